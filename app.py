@@ -5,32 +5,24 @@ import streamlit as st
 import duckdb
 import os
 from dotenv import load_dotenv
-from data_ingestion import sync_activities, ingest_oura_data
-
-import folium
-from folium.plugins import HeatMap
+from data_ingestion import (
+    init_db, sync_activities, ingest_oura_data, sync_all, get_sync_progress, full_sync_fraction, get_data_version,
+)
 
-import pandas as pd
+# folium and altair are imported in the sections that draw with them, so the
+# page shell renders without waiting on them
 import numpy as np
-import altair as alt
-import polyline
 import datetime
 
-from openai import OpenAI
 import streamlit.components.v1 as components
-from sklearn.preprocessing import StandardScaler, RobustScaler
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.decomposition import PCA
-from sklearn.metrics import silhouette_score
-from scipy.stats import zscore
 from chat_window import render_chat
+from route_cache import simplify_route
+import heat_grid
+import run_table
+import rollups
 
 # Load .env
 load_dotenv()
-client = OpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
-)
 
 # Page config
 st.set_page_config(page_title="Running Dashboard🏃‍♀️", layout="wide")
@@ -74,401 +66,18 @@ def duckdb_exists():
 
 is_new_db = not duckdb_exists()
 
-
-
+# Schema, migrations and backfills; only the first session of the server process runs them
+init_db()
 
 # Connect to DB
 con = duckdb.connect(DUCKDB_PATH)
-df = con.execute("SELECT * FROM runs ORDER BY start_date_local DESC").fetchdf()
-df["start_date_local"] = pd.to_datetime(df["start_date_local"], format="%Y-%m-%d %H:%M:%S")
-df = df[df["start_date_local"] >= pd.to_datetime("2020-01-01")]
-
-# Enhanced streaming data analysis
-
-streaming_features_df = con.execute("""
-    WITH hr_changes AS (
-        SELECT 
-            activity_id,
-            time_sec,
-            heartrate,
-            velocity_smooth,
-            heartrate - LAG(heartrate) OVER (PARTITION BY activity_id ORDER BY time_sec) AS hr_change
-        FROM run_streams
-        WHERE velocity_smooth > 0 AND velocity_smooth < 20  -- Filter out unrealistic speeds
-        AND heartrate > 0 AND heartrate < 250  -- Filter out unrealistic heart rates
-    )
-    SELECT 
-        activity_id,
-        -- Pace variability (coefficient of variation) - with bounds checking
-        CASE
-            WHEN COUNT(*) > 10 AND AVG(velocity_smooth) > 0 AND AVG(velocity_smooth) < 20 THEN 
-                CASE 
-                    WHEN AVG(1000 / (velocity_smooth * 60)) > 0 AND STDDEV_POP(1000 / (velocity_smooth * 60)) IS NOT NULL THEN
-                        LEAST(STDDEV_POP(1000 / (velocity_smooth * 60)) / AVG(1000 / (velocity_smooth * 60)), 2.0)
-                    ELSE NULL
-                END
-            ELSE NULL
-        END AS pace_cv,
-        
-        -- Heart rate variability - with bounds checking
-        CASE
-            WHEN COUNT(heartrate) > 10 AND AVG(heartrate) BETWEEN 50 AND 220 THEN 
-                CASE 
-                    WHEN STDDEV_POP(heartrate) IS NOT NULL THEN
-                        LEAST(STDDEV_POP(heartrate) / AVG(heartrate), 1.0)
-                    ELSE NULL
-                END
-            ELSE NULL
-        END AS hr_cv,
-        
-        -- Effort spikes (sudden HR increases > 15 bpm) - FIXED
-        COUNT(CASE WHEN hr_change > 15 THEN 1 END) * 1.0 / NULLIF(COUNT(*), 0) AS effort_spike_rate,
-        
-        -- Time in high intensity (assuming max HR ~190)
-        COUNT(CASE WHEN heartrate > 141 THEN 1 END) * 1.0 / NULLIF(COUNT(heartrate), 0) AS high_intensity_pct,
-        
-        -- Work-to-rest ratio for intervals
-        CASE 
-            WHEN COUNT(CASE WHEN heartrate > 141 THEN 1 END) > 0 THEN
-                COUNT(CASE WHEN heartrate > 141 THEN 1 END) * 1.0 / 
-                NULLIF(COUNT(CASE WHEN heartrate <= 141 AND heartrate > 0 THEN 1 END), 0)
-            ELSE 0
-        END AS work_rest_ratio,
-        
-        -- Average streaming data for validation
-        AVG(velocity_smooth) AS avg_velocity_smooth,
-        AVG(heartrate) AS avg_heartrate_stream
-        
-    FROM hr_changes
-    GROUP BY activity_id
-""").fetchdf()
-
-# Merge enhanced streaming features
-df = df.merge(streaming_features_df, on="activity_id", how="left")
-
-# Calculate streaming pace
-df["pace_min_per_km_stream"] = np.where(
-    df["avg_velocity_smooth"] > 0,
-    1000 / (df["avg_velocity_smooth"] * 60),
-    np.nan
-)
 
-class ImprovedRunClassifier:
-    def __init__(self):
-        self.scaler = RobustScaler()
-        self.model = None
-        self.cluster_names = {}
-        self.is_trained = False
-    
-    def extract_features(self, df):
-        """Extract comprehensive features for better classification"""
-        features = pd.DataFrame()
-        features["activity_id"] = df["activity_id"] 
-        
-        # Basic features
-        features['distance_km'] = df['distance_km']
-        features['duration_min'] = df['moving_time_min']
-        features['avg_pace'] = df['pace_min_per_km'].fillna(df['pace_min_per_km_stream'])
-        features['elevation_gain'] = df['total_elevation_gain_m'].fillna(0)
-        features['avg_hr'] = df['average_heartrate'].fillna(df['avg_heartrate_stream'])
-        
-        # Streaming-based features (the key to better classification)
-        features['pace_variability'] = df['pace_cv'].fillna(0)
-        features['hr_variability'] = df['hr_cv'].fillna(0)
-        features['effort_spikes'] = df['effort_spike_rate'].fillna(0)
-        features['high_intensity_time'] = df['high_intensity_pct'].fillna(0)
-        features['work_rest_ratio'] = df['work_rest_ratio'].fillna(0)
-        
-        # Derived features
-        features['pace_per_km_norm'] = features['avg_pace'] / features['avg_pace'].median()
-        features['distance_duration_ratio'] = features['distance_km'] / (features['duration_min'] / 60)
-        features['hr_intensity'] = np.where(
-            features['avg_hr'] > 0,
-            features['avg_hr'] / 185,  # Normalize to estimated max HR
-            0
-        )
-        
-        # Composite features for better separation
-        features['variability_score'] = (
-            features['pace_variability'] * 0.4 + 
-            features['hr_variability'] * 0.3 + 
-            features['effort_spikes'] * 0.3
-        )
-        
-        features['intensity_score'] = (
-            features['hr_intensity'] * 0.6 + 
-            features['high_intensity_time'] * 0.4
-        )
-        
-        # Fill remaining NaN values
-        features = features.fillna(features.median())
-        
-        return features
-    
-    def find_optimal_clusters(self, features, max_k=6):
-        """Find optimal number of clusters using silhouette score"""
-        if len(features) < 10:
-            return 5  # Increased default clusters
-        
-        X_scaled = self.scaler.fit_transform(features)
-        
-        scores = []
-        K_range = range(3, min(max_k + 1, len(X_scaled) // 2))  # Start with 3 clusters minimum
-        
-        for k in K_range:
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(X_scaled)
-            if len(set(labels)) > 1:
-                score = silhouette_score(X_scaled, labels)
-                scores.append(score)
-            else:
-                scores.append(0)
-        
-        if scores:
-            optimal_k = K_range[np.argmax(scores)]
-            return optimal_k
-        return 5
-    
-    def classify_runs(self, features):
-        """Main classification method using rule-based approach first, then clustering"""
-        if len(features) < 5:
-            return ['unknown'] * len(features)
-    
-        run_types = ['unknown'] * len(features)
-    
-        for i, row in features.iterrows():
-            distance = row['distance_km']
-            variability = row['variability_score']
-            intensity = row['intensity_score']
-            work_rest = row['work_rest_ratio']
-            high_intensity_pct = row['high_intensity_time']
-            pace = row['avg_pace']
-            activity_id = row['activity_id']
-        
-            skip_interval_check = distance > 6  # ✅ Hard rule: intervals must be ≤ 6km
-
-            # 🧠 Debug
-            # if activity_id in [14980216184]:  # Add more IDs if needed
-            #     print(f"\n=== DEBUG: Activity {activity_id} ===")
-            #     print(f"Distance: {distance}")
-            #     print(f"Variability: {variability}")
-            #     print(f"Intensity: {intensity}")
-            #     print(f"Work/Rest: {work_rest}")
-            #     print(f"High Intensity %: {high_intensity_pct}")
-            #     print(f"Pace: {pace}")
-
-            
-            # ✅ Rule-based logic
-            if distance >= 15:
-                run_types[i] = 'long run'
-            elif not skip_interval_check and variability > 0.25 and work_rest > 0.23 and high_intensity_pct > 0.18:
-                run_types[i] = 'interval'
-            elif not skip_interval_check and variability > 0.3 and pace < 5.5 and intensity < 0.5:
-                run_types[i] = 'interval'
-            elif distance <= 6 and variability < 0.2 and intensity < 0.6:
-                run_types[i] = 'easy run'
-            elif distance >= 5 and 5.5 <= pace <= 6.3 and variability < 0.25:
-                run_types[i] = 'tempo run'
-            elif 4 < distance <= 12 and variability > 0.4:
-                run_types[i] = 'tempo run'
-            elif distance <= 8 and intensity > 0.75:
-                run_types[i] = 'speed work'
-            elif distance > 6 and variability > 0.3 and intensity > 0.5:
-                run_types[i] = 'tempo run'  # fallback for misclassified long intervals
-            elif distance <= 6 and variability > 0.3 and intensity < 0.5:
-                run_types[i] = 'interval'
-            else:
-                continue  # Let clustering handle unknowns
-
-            # ✅ Optional debug output
-            # if activity_id in [14980216184]:
-            #     print(f"Assigned Type: {run_types[i]}")
-            #     print("===============================")
-
-        # Clustering for unknowns
-        unknown_indices = [i for i, rt in enumerate(run_types) if rt == 'unknown']
-        if len(unknown_indices) > 3:
-            unknown_features = features.iloc[unknown_indices]
-            X_scaled = self.scaler.fit_transform(unknown_features)
-            n_clusters = min(4, len(unknown_features))
-            self.model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-            cluster_labels = self.model.fit_predict(X_scaled)
-            cluster_names = self._analyze_unknown_clusters(unknown_features, cluster_labels)
-
-            for idx, cluster_id in enumerate(cluster_labels):
-                original_idx = unknown_indices[idx]
-                run_types[original_idx] = cluster_names.get(cluster_id, 'recovery run')
-
-        run_types = ['recovery run' if rt == 'unknown' else rt for rt in run_types]
-        self.is_trained = True
-        return run_types
+# Sync controls and the section switcher rerun this script (widgets inside a
+# section rerun only that section). The frames below are cached per data
+# version (a token each sync writes), so those reruns reuse them and a sync
+# invalidates them.
+data_version = get_data_version()
 
-    
-    def _analyze_unknown_clusters(self, features, labels):
-        """Analyze clusters for unknown runs and assign names"""
-        cluster_names = {}
-        
-        for cluster_id in np.unique(labels):
-            mask = labels == cluster_id
-            cluster_data = features[mask]
-            
-            # Calculate cluster characteristics
-            avg_distance = cluster_data['distance_km'].mean()
-            avg_variability = cluster_data['variability_score'].mean()
-            avg_intensity = cluster_data['intensity_score'].mean()
-            avg_work_rest = cluster_data['work_rest_ratio'].mean()
-            
-            # Assign names based on cluster characteristics
-            if avg_distance >= 15:
-                name = "long run"
-            elif avg_distance <= 6 and avg_work_rest > 0.15 and avg_variability > 0.3:
-                name = "interval"
-            elif avg_intensity > 0.7:
-                name = "tempo run"
-            elif avg_distance < 8 and avg_variability < 0.2 and avg_intensity < 0.5:
-                name = "easy run"
-            else:
-                name = "recovery run"
-
-            
-            cluster_names[cluster_id] = name
-        
-        return cluster_names
-
-# Enhanced streaming data analysis with better bounds checking
-def get_enhanced_streaming_features(con):
-    """Get enhanced streaming features with better error handling"""
-    try:
-        streaming_features_df = con.execute("""
-            WITH hr_changes AS (
-                SELECT 
-                    activity_id,
-                    time_sec,
-                    heartrate,
-                    velocity_smooth,
-                    heartrate - LAG(heartrate) OVER (PARTITION BY activity_id ORDER BY time_sec) AS hr_change
-                FROM run_streams
-                WHERE velocity_smooth > 0.5 AND velocity_smooth < 15  -- More realistic speed bounds
-                AND heartrate BETWEEN 60 AND 220  -- Realistic HR bounds
-            ),
-            activity_stats AS (
-                SELECT 
-                    activity_id,
-                    COUNT(*) as total_points,
-                    AVG(velocity_smooth) as avg_velocity,
-                    AVG(heartrate) as avg_hr,
-                    STDDEV_POP(velocity_smooth) as vel_stddev,
-                    STDDEV_POP(heartrate) as hr_stddev
-                FROM hr_changes
-                GROUP BY activity_id
-                HAVING COUNT(*) > 20  -- Need sufficient data points
-            )
-            SELECT 
-                h.activity_id,
-                
-                -- Pace variability (coefficient of variation)
-                CASE
-                    WHEN s.avg_velocity > 0 AND s.vel_stddev IS NOT NULL THEN 
-                        LEAST(s.vel_stddev / s.avg_velocity, 1.5)
-                    ELSE 0
-                END AS pace_cv,
-                
-                -- Heart rate variability
-                CASE
-                    WHEN s.avg_hr > 0 AND s.hr_stddev IS NOT NULL THEN 
-                        LEAST(s.hr_stddev / s.avg_hr, 0.8)
-                    ELSE 0
-                END AS hr_cv,
-                
-                -- Effort spikes (sudden HR increases > 10 bpm)
-                COUNT(CASE WHEN h.hr_change > 10 THEN 1 END) * 1.0 / s.total_points AS effort_spike_rate,
-                
-                -- Time in high intensity (>80% estimated max HR)
-                COUNT(CASE WHEN h.heartrate > 141 THEN 1 END) * 1.0 / s.total_points AS high_intensity_pct,
-                
-                -- Work-to-rest ratio for intervals
-                CASE 
-                    WHEN COUNT(CASE WHEN h.heartrate <= 141 AND h.heartrate > 0 THEN 1 END) > 0 THEN
-                        COUNT(CASE WHEN h.heartrate > 141 THEN 1 END) * 1.0 / 
-                        COUNT(CASE WHEN h.heartrate <= 141 AND h.heartrate > 0 THEN 1 END)
-                    ELSE 0
-                END AS work_rest_ratio,
-                
-                -- Average values for validation
-                s.avg_velocity AS avg_velocity_smooth,
-                s.avg_hr AS avg_heartrate_stream
-                
-            FROM hr_changes h
-            JOIN activity_stats s ON h.activity_id = s.activity_id
-            GROUP BY h.activity_id, s.avg_velocity, s.avg_hr, s.vel_stddev, s.hr_stddev, s.total_points
-        """).fetchdf()
-        
-        return streaming_features_df
-        
-    except Exception as e:
-        print(f"Error getting streaming features: {e}")
-        # Return empty dataframe with expected columns
-        return pd.DataFrame(columns=[
-            'activity_id', 'pace_cv', 'hr_cv', 'effort_spike_rate', 
-            'high_intensity_pct', 'work_rest_ratio', 'avg_velocity_smooth', 'avg_heartrate_stream'
-        ])
-
-# Usage in your main app:
-# Replace the existing streaming features query with:
-# streaming_features_df = get_enhanced_streaming_features(con)
-
-# Then use the improved classifier:
-classifier = ImprovedRunClassifier()
-
-if len(df) >= 5:
-    with st.spinner("🤖 Applying improved ML classification..."):
-        features = classifier.extract_features(df)
-        run_types = classifier.classify_runs(features)
-        df['run_type'] = run_types
-        
-        con.execute("""
-            CREATE TABLE IF NOT EXISTS run_types (
-                activity_id BIGINT PRIMARY KEY,
-                run_type TEXT,
-                classified_at TIMESTAMP
-            )
-        """)
-
-        # Insert or update classified run types
-        now = datetime.datetime.utcnow().isoformat()
-
-        for activity_id, run_type in zip(df["activity_id"], df["run_type"]):
-            con.execute("""
-                INSERT INTO run_types (activity_id, run_type, classified_at)
-                VALUES (?, ?, ?)
-                ON CONFLICT(activity_id) DO UPDATE SET 
-                    run_type = excluded.run_type,
-                    classified_at = excluded.classified_at
-            """, (activity_id, run_type, now))
-
-        
-        # Show improved classification summary
-        type_counts = pd.Series(run_types).value_counts()
-        # st.success(f"✅ Classified {len(df)} runs into {len(type_counts)} types")
-        
-        # # Classification overview
-        # with st.expander("🔍 Improved Classification Overview"):
-        #     col1, col2 = st.columns(2)
-        #     with col1:
-        #         st.write("**Run Type Distribution:**")
-        #         for run_type, count in type_counts.items():
-        #             st.write(f"• {run_type.title()}: {count} runs")
-            
-        #     with col2:
-        #         st.write("**Classification Rules Applied:**")
-        #         st.write("• Distance ≥20km → Long Run")
-        #         st.write("• Distance ≤4km + High Variability → Interval")
-        #         st.write("• Distance ≤6km + Low Variability → Easy Run")
-        #         st.write("• 4-12km + High Variability → Tempo Run")
-        #         st.write("• Short Distance + High Intensity → Speed Work")
-        #         st.write("• Remaining → ML Clustering")
-
-# Add week_start
 st.title("Running Dashboard 🏃‍♀️")
 
 
@@ -476,22 +85,32 @@ st.markdown("### 🔄 Manual Sync Controls")
 
 sync_cols = st.columns([1.5, 1.5, 1.2, 1.2])
 
+def show_full_sync_progress(bar):
+    def update(progress):
+        through = (progress.get("after") or "")[:10] or "start"
+        bar.progress(full_sync_fraction(progress),
+                     text=f"{progress['synced']} runs synced, {progress['pending']} in flight, through {through}")
+    return update
+
+interrupted_sync = get_sync_progress()
+if interrupted_sync:
+    st.info(f"⏸️ A full history sync stopped after {interrupted_sync['synced']} runs "
+            f"(through {(interrupted_sync.get('after') or 'the start')[:10]}). Run it again to resume.")
+
 if is_new_db:
     with sync_cols[0]:
         if st.button("🚨 Full Historical Sync"):
             with st.spinner("Performing full sync from 2025-02-18..."):
-                sync_activities(limit=None, after=START_DATE, before=TODAY)
-                ingest_oura_data(start_date=START_DATE, end_date=TODAY)
+                sync_all(limit=None, after=START_DATE, before=TODAY, oura_start_date=START_DATE, oura_end_date=TODAY)
                 st.success("✅ Full history sync complete.")
-                st.experimental_rerun()
+                st.rerun()
 else:
     with sync_cols[0]:
         if st.button("🔁 Sync Last 30 Strava Runs + Oura"):
             with st.spinner("Syncing recent Strava and Oura data..."):
-                sync_activities(limit=200)
-                ingest_oura_data()
+                sync_all(limit=200)
                 st.success("✅ Latest data synced.")
-                st.experimental_rerun()
+                st.rerun()
     with sync_cols[1]:
         if st.button("🩺 Sync Oura Only"):
             with st.spinner("Syncing latest Oura data..."):
@@ -505,47 +124,72 @@ else:
     with sync_cols[3]:
         if st.button("🚨 Full History Sync"):
             with st.spinner("Performing full sync from 2025-02-18..."):
-                sync_activities(limit=None, full_sync=True)
-                ingest_oura_data(start_date=START_DATE, end_date=TODAY)
+                bar = st.progress(full_sync_fraction(interrupted_sync), text="Listing activities...")
+                sync_all(limit=None, full_sync=True, oura_start_date=START_DATE, oura_end_date=TODAY,
+                         on_progress=show_full_sync_progress(bar))
                 st.success("✅ Full history sync complete.")
                 st.rerun()
 
 # ✅ 2. Safe display of last run date
-if "start_date_local" in df.columns and not df.empty:
-    last_run_date = df["start_date_local"].max()
-    if pd.notna(last_run_date):
-        st.markdown(f"### 🕓 Last Run Recorded: `{last_run_date.strftime('%Y-%m-%d %H:%M:%S')}`")
-    else:
-        st.markdown("### 🕓 Last Run Recorded: `No data available`")
+last_run_date = con.execute("SELECT MAX(start_date_local) FROM runs").fetchone()[0]
+if last_run_date is not None:
+    st.markdown(f"### 🕓 Last Run Recorded: `{last_run_date.strftime('%Y-%m-%d %H:%M:%S')}`")
 else:
     st.markdown("### 🕓 Last Run Recorded: `No runs found`")
 
-# ✅ 3. Week start column (only after df is validated)
-if not df.empty and "start_date_local" in df.columns:
-    df["week_start"] = df["start_date_local"] - pd.to_timedelta(df["start_date_local"].dt.weekday, unit="d")
-    df["week_start"] = df["week_start"].dt.date
-
-# Heatmap
-st.header("🔥 Heatmap of All Runs")
-
-# Build Folium map
-m = folium.Map(zoom_start=12, width="100%", height="100%")
-all_points = []
-for _, row in df.iterrows():
-    if pd.notna(row["summary_polyline"]):
-        all_points.extend(polyline.decode(row["summary_polyline"]))
-if all_points:
-    HeatMap(all_points, radius=8, blur=6, min_opacity=0.5).add_to(m)
-    lats, lons = zip(*all_points)
-    m.fit_bounds([[min(lats), min(lons)], [max(lats), max(lons)]])
-else:
-    st.warning("No GPS data available to display heatmap.")
-
-# Full Folium HTML
-html_content = m.get_root().render()
-
-# Responsive container (width:100%)
-map_html = f"""
+# Build Folium map from the grid cells binned at ingest (heat_grid.py)
+@st.cache_data(show_spinner=False)
+def load_heat_cells(version):
+    """[lat, lng, weight] heatmap cells, and the bounding box of all routes."""
+    cells = heat_grid.load_cells(con)
+    bounds = con.execute(f"""
+        SELECT MIN(min_lat), MIN(min_lng), MAX(max_lat), MAX(max_lng)
+        FROM run_routes
+        WHERE {heat_grid.SHOWN_RUNS}
+    """, (heat_grid.START_DATE,)).fetchone()
+    return cells, bounds
+
+# Douglas–Peucker tolerance for the optional route lines (~10 m)
+ROUTE_TOLERANCE_DEG = 0.0001
+
+@st.cache_data(show_spinner=False)
+def load_route_lines(version):
+    """Each route as simplified [lat, lng] points."""
+    routes = con.execute(
+        f"SELECT lat, lng FROM run_routes WHERE {heat_grid.SHOWN_RUNS}", (heat_grid.START_DATE,)
+    ).fetchall()
+    lines = []
+    for lat, lng in routes:
+        lat, lng = np.asarray(lat), np.asarray(lng)
+        keep = simplify_route(lat, lng, ROUTE_TOLERANCE_DEG)
+        lines.append(np.column_stack([lat[keep], lng[keep]]).round(5).tolist())
+    return lines
+
+MAP_CACHE_ENTRIES = 4
+
+# The rendered map is a pure function of the data: rebuilt once per data version
+# (and route-line setting), the few most recent kept in memory
+@st.cache_data(show_spinner=False, max_entries=MAP_CACHE_ENTRIES)
+def render_heatmap(version, show_routes):
+    """Full Folium HTML of the heatmap in a responsive container, or None without GPS data."""
+    heat_cells, (min_lat, min_lng, max_lat, max_lng) = load_heat_cells(version)
+    if not heat_cells:
+        return None
+    import folium
+    from folium.plugins import HeatMap
+
+    m = folium.Map(zoom_start=12, width="100%", height="100%")
+    HeatMap(heat_cells, radius=8, blur=6, min_opacity=0.5).add_to(m)
+    if show_routes:
+        for line in load_route_lines(version):
+            folium.PolyLine(line, weight=1, opacity=0.4, color="#3388ff").add_to(m)
+    m.fit_bounds([[min_lat, min_lng], [max_lat, max_lng]])
+
+    # Full Folium HTML
+    html_content = m.get_root().render()
+
+    # Responsive container (width:100%)
+    return f"""
 <div style="width:100%; height:100%;">
     <style>
         .folium-map {{
@@ -557,8 +201,6 @@ map_html = f"""
 </div>
 """
 
-# Fluid iframe (width fills page)
-components.html(map_html, height=700, width=2000, scrolling=False)
 
 # # Enhanced Training Analysis with Run Types
 # st.header("🏃‍♀️ Training Analysis by Run Type")
@@ -601,99 +243,111 @@ components.html(map_html, height=700, width=2000, scrolling=False)
 #         st.altair_chart(chart_weekly, use_container_width=True)
 
 # Trends
-st.header("📊 Monthly Trends")
-df["year_month"] = df["start_date_local"].dt.to_period("M").astype(str)
-df_trend = df.groupby("year_month").agg({"distance_km": "sum"}).reset_index()
-df_pace_trend = df.groupby("year_month").agg({"pace_min_per_km": "mean"}).reset_index()
-
-chart_distance = alt.Chart(df_trend).mark_bar().encode(
-    x=alt.X("year_month", title="Month"),
-    y=alt.Y("distance_km", title="Total Distance (km)"),
-    tooltip=["year_month", "distance_km"]
-).properties(width=350, height=300)
-
-chart_pace = alt.Chart(df_pace_trend).mark_line(point=True).encode(
-    x=alt.X("year_month", title="Month"),
-    y=alt.Y("pace_min_per_km", title="Average Pace (min/km)"),
-    tooltip=["year_month", "pace_min_per_km"]
-).properties(width=350, height=300)
-
-col1, col2 = st.columns(2)
-with col1:
-    st.subheader("Distance per Month")
-    st.altair_chart(chart_distance)
-with col2:
-    st.subheader("Pace per Month")
-    st.altair_chart(chart_pace)
-
-# Weekly totals
-df_week = df.groupby("week_start").agg(
-    distance_km=("distance_km", "sum"),
-    num_runs=("distance_km", "count")
-).reset_index().sort_values("week_start")
-df_week["cumulative_distance"] = df_week["distance_km"].cumsum()
-
-# Weekly distance chart
-chart_week = alt.Chart(df_week).mark_bar().encode(
-    x=alt.X("week_start:T", title="Week Starting", axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
-    y=alt.Y("distance_km", title="Total Distance (km)"),
-    tooltip=["week_start", "distance_km", "num_runs"]
-).properties(width=700, height=300)
-
-# Cumulative distance chart
-chart_cumulative = alt.Chart(df_week).mark_line(point=True).encode(
-    x="week_start:T",
-    y="cumulative_distance",
-    tooltip=["week_start", "cumulative_distance"]
-).properties(width=700, height=300)
-
-# Show headers directly above each chart
-st.header("📊 Weekly Distance")
-st.altair_chart(chart_week, use_container_width=True)
-
-st.header("📈 Cumulative Distance (per Week)")
-st.altair_chart(chart_cumulative, use_container_width=True)
+@st.cache_data(show_spinner=False)
+def load_trend_frames(version):
+    """Monthly distance and pace, and weekly totals with the running cumulative distance."""
+    # Read from the rollups maintained at ingest (rollups.py)
+    months = rollups.load_rollup(con, "month")
+    months["year_month"] = months["period_start"].dt.strftime("%Y-%m")
+    df_trend = months[["year_month", "distance_km"]]
+    df_pace_trend = months[["year_month"]].assign(pace_min_per_km=months["mean_pace"])
+
+    # Weekly totals
+    df_week = rollups.load_rollup(con, "week").rename(columns={"period_start": "week_start", "run_count": "num_runs"})
+    df_week = df_week[["week_start", "distance_km", "num_runs", "cumulative_distance"]]
+    return df_trend, df_pace_trend, df_week
+
+# Sections: only the selected one runs. Each is a fragment, so its own widgets
+# (route lines, table controls, chat) rerun just that section, not the page.
+@st.fragment
+def heatmap_section():
+    st.header("🔥 Heatmap of All Runs")
+    show_routes = st.checkbox("Show route lines", value=False)
+    map_html = render_heatmap(data_version, show_routes)
+    if map_html is None:
+        st.warning("No GPS data available to display heatmap.")
+    else:
+        # Fluid iframe (width fills page)
+        components.html(map_html, height=700, width=2000, scrolling=False)
+
+@st.fragment
+def trends_section():
+    import altair as alt
+
+    st.header("📊 Monthly Trends")
+    df_trend, df_pace_trend, df_week = load_trend_frames(data_version)
+
+    chart_distance = alt.Chart(df_trend).mark_bar().encode(
+        x=alt.X("year_month", title="Month"),
+        y=alt.Y("distance_km", title="Total Distance (km)"),
+        tooltip=["year_month", "distance_km"]
+    ).properties(width=350, height=300)
+
+    chart_pace = alt.Chart(df_pace_trend).mark_line(point=True).encode(
+        x=alt.X("year_month", title="Month"),
+        y=alt.Y("pace_min_per_km", title="Average Pace (min/km)"),
+        tooltip=["year_month", "pace_min_per_km"]
+    ).properties(width=350, height=300)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Distance per Month")
+        st.altair_chart(chart_distance)
+    with col2:
+        st.subheader("Pace per Month")
+        st.altair_chart(chart_pace)
+
+    # Weekly distance chart
+    chart_week = alt.Chart(df_week).mark_bar().encode(
+        x=alt.X("week_start:T", title="Week Starting", axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
+        y=alt.Y("distance_km", title="Total Distance (km)"),
+        tooltip=["week_start", "distance_km", "num_runs"]
+    ).properties(width=700, height=300)
+
+    # Cumulative distance chart
+    chart_cumulative = alt.Chart(df_week).mark_line(point=True).encode(
+        x="week_start:T",
+        y="cumulative_distance",
+        tooltip=["week_start", "cumulative_distance"]
+    ).properties(width=700, height=300)
+
+    # Show headers directly above each chart
+    st.header("📊 Weekly Distance")
+    st.altair_chart(chart_week, use_container_width=True)
+
+    st.header("📈 Cumulative Distance (per Week)")
+    st.altair_chart(chart_cumulative, use_container_width=True)
 
 # Enhanced Run Table with better run types
-st.markdown("## 📋 Run Table")
-df_display = df[[
-    "start_date_local", "run_name", "distance_km", "moving_time_min",
-    "pace_min_per_km", "total_elevation_gain_m", "average_heartrate", "activity_id", "run_type"
-]].copy()
-
-df_display = df_display.rename(columns={
-    "start_date_local": "Start Date",
-    "run_name": "Run Name",
-    "distance_km": "Distance (km)",
-    "moving_time_min": "Moving Time",
-    "pace_min_per_km": "Pace (min/km)",
-    "total_elevation_gain_m": "Elevation Gain (m)",
-    "average_heartrate": "Avg HR",
-    "run_type": "Run Type"
-})
-
-df_display["View"] = df_display["activity_id"].apply(
-    lambda rid: f'<a href="details?run_id={rid}" target="_blank" title="View details"><i class="fas fa-eye"></i></a>'
-)
-df_display.drop(columns=["activity_id"], inplace=True)
-
-# Format helpers
-def format_pace(p):
-    if pd.isna(p): return ""
-    m, s = divmod(int(p * 60), 60)
-    return f"{m} min {s} sec"
-
-def format_duration(m_float):
-    if pd.isna(m_float): return ""
-    total_sec = int(m_float * 60)
-    h, rem = divmod(total_sec, 3600)
-    m, s = divmod(rem, 60)
-    return f"{h} hr {m} min {s} sec" if h > 0 else f"{m} min {s} sec"
-
-df_display["Pace (min/km)"] = df_display["Pace (min/km)"].apply(format_pace)
-df_display["Moving Time"] = df_display["Moving Time"].apply(format_duration)
-df_display["Run Type"] = df_display["Run Type"].str.title()
-
-st.write(df_display.to_html(escape=False, index=False), unsafe_allow_html=True)
-
-render_chat()
\ No newline at end of file
+@st.fragment
+def run_table_section():
+    st.markdown("## 📋 Run Table")
+
+    table_cols = st.columns([1.4, 0.8, 2, 1.6, 0.8])
+    sort_by = table_cols[0].selectbox("Sort by", list(run_table.SORT_COLUMNS), index=0)
+    descending = table_cols[1].selectbox("Order", ["Descending", "Ascending"]) == "Descending"
+    type_filter = table_cols[2].multiselect("Run type", run_table.run_type_options(con), format_func=str.title)
+    date_range = table_cols[3].date_input("Dates", value=(), format="YYYY-MM-DD")
+    start_date, end_date = (tuple(date_range) + (None, None))[:2]
+
+    total_runs = run_table.count_runs(con, type_filter, start_date, end_date)
+    page_count = max(1, -(-total_runs // run_table.PAGE_SIZE))
+    page = table_cols[4].number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1) - 1
+
+    page_df = run_table.load_page(con, sort_by, descending, type_filter, start_date, end_date, page)
+    st.write(run_table.page_html(page_df), unsafe_allow_html=True)
+    st.caption(f"Runs {page * run_table.PAGE_SIZE + 1 if total_runs else 0}–"
+               f"{page * run_table.PAGE_SIZE + len(page_df)} of {total_runs}")
+
+@st.fragment
+def chat_section():
+    render_chat()
+
+SECTIONS = {
+    "🔥 Heatmap": heatmap_section,
+    "📊 Trends": trends_section,
+    "📋 Run Table": run_table_section,
+    "💬 Chat": chat_section,
+}
+section = st.radio("Section", list(SECTIONS), horizontal=True, key="section", label_visibility="collapsed")
+SECTIONS[section]()
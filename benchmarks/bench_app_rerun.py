@@ -0,0 +1,77 @@
+"""Benchmark: dashboard script time, first load vs reruns.
+
+Syncs synthetic history from the local fixture server into a fresh DuckDB
+file, then drives app.py with Streamlit's AppTest: one cold run, several
+reruns with nothing changed (what a chat message or widget change costs), and
+a rerun after a sync has written a new data version.
+
+    python benchmarks/bench_app_rerun.py [--years 1] [--reruns 5]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData, base_url_env, start_server  # noqa: E402
+
+
+def timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    server = start_server(data=SyntheticData(args.years))
+    workdir = tempfile.mkdtemp()
+    os.environ.update(base_url_env(server.base_url))
+    os.environ.update({
+        "STRAVA_CLIENT_ID": "fixture", "STRAVA_CLIENT_SECRET": "fixture", "STRAVA_REFRESH_TOKEN": "fixture",
+        "OURA_API_TOKEN": "fixture", "TOKEN_CACHE_PATH": os.path.join(workdir, "tokens.json"),
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "fixture"),
+    })
+    # app.py and pages/ open running.duckdb relative to the working directory
+    for name in os.listdir(ROOT):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(ROOT, name), workdir)
+    shutil.copytree(os.path.join(ROOT, "pages"), os.path.join(workdir, "pages"))
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+
+    warnings.filterwarnings("ignore")
+    import data_ingestion  # noqa: E402
+    from streamlit.testing.v1 import AppTest  # noqa: E402
+
+    data_ingestion.sync_activities(limit=None, full_sync=True)
+    runs = data_ingestion.con.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    at = AppTest.from_file(os.path.join(workdir, "app.py"), default_timeout=600)
+    cold = timed_run(at)
+    warm = sorted(timed_run(at) for _ in range(args.reruns))
+
+    # What a sync does to the dashboard: new rows, new data version
+    data_ingestion.con.execute("UPDATE runs SET updated_at = now() WHERE activity_id = (SELECT MIN(activity_id) FROM runs)")
+    data_ingestion.write_data_version()
+    after_sync = timed_run(at)
+
+    print(f"{runs} runs")
+    print(f"{'first load':<24} {cold * 1000:>8.0f} ms")
+    print(f"{'rerun, median':<24} {warm[len(warm) // 2] * 1000:>8.0f} ms")
+    print(f"{'rerun after a sync':<24} {after_sync * 1000:>8.0f} ms")
+    server.shutdown()
+    server.server_close()
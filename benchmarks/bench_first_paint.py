@@ -0,0 +1,90 @@
+"""Benchmark: time to first meaningful paint, and to each dashboard section.
+
+Syncs synthetic history from the local fixture server into a fresh DuckDB
+file, then drives app.py with Streamlit's AppTest. The first paint is the
+first script run of a session (empty caches), which renders the header, sync
+controls and the default section. Each other section is then timed on its
+first visit and on a revisit.
+
+    python benchmarks/bench_first_paint.py [--years 1]
+
+On a checkout from before the sections (no section switcher) only the first
+paint, then the whole page, is reported.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData, base_url_env, start_server  # noqa: E402
+
+
+def timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=1)
+    args = parser.parse_args()
+
+    server = start_server(data=SyntheticData(args.years))
+    workdir = tempfile.mkdtemp()
+    os.environ.update(base_url_env(server.base_url))
+    os.environ.update({
+        "STRAVA_CLIENT_ID": "fixture", "STRAVA_CLIENT_SECRET": "fixture", "STRAVA_REFRESH_TOKEN": "fixture",
+        "OURA_API_TOKEN": "fixture", "TOKEN_CACHE_PATH": os.path.join(workdir, "tokens.json"),
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "fixture"),
+    })
+    # app.py and pages/ open running.duckdb relative to the working directory
+    for name in os.listdir(ROOT):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(ROOT, name), workdir)
+    shutil.copytree(os.path.join(ROOT, "pages"), os.path.join(workdir, "pages"))
+    os.chdir(workdir)
+    sys.path.insert(0, workdir)
+
+    warnings.filterwarnings("ignore")
+    import data_ingestion  # noqa: E402
+    from streamlit.testing.v1 import AppTest  # noqa: E402
+
+    data_ingestion.sync_activities(limit=None, full_sync=True)
+    runs = data_ingestion.con.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    # AppTest scans installed packages for components on its first run; keep
+    # that out of the app's numbers
+    AppTest.from_string("import streamlit as st\nst.write('warm-up')").run()
+
+    at = AppTest.from_file(os.path.join(workdir, "app.py"), default_timeout=600)
+    first_paint = timed_run(at)
+    switcher = [radio for radio in at.radio if radio.key == "section"]
+    default = switcher[0].value if switcher else "whole page"
+
+    visits = []
+    if switcher:
+        for section in [s for s in switcher[0].options if s != default] + [default]:
+            at.radio(key="section").set_value(section)
+            first = timed_run(at)
+            again = timed_run(at)
+            visits.append((section, first, again))
+
+    print(f"{runs} runs")
+    print(f"{'first paint (' + default + ')':<28} {first_paint * 1000:>8.0f} ms")
+    if visits:
+        print(f"{'section':<28} {'first visit':>11} {'revisit':>9}")
+    for section, first, again in visits:
+        print(f"{section:<28} {first * 1000:>8.0f} ms {again * 1000:>6.0f} ms")
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,72 @@
+"""Benchmark: heatmap payload, every route point vs heat_grid cells.
+
+Saves synthetic routes (from fixture_server.SyntheticData) for growing
+histories and, for each, renders the Folium heatmap the way app.py did (one
+HeatMap point per route point) and the way it does now (weighted cells from
+heat_cells), comparing the HTML size and the time to build and render it.
+
+    python benchmarks/bench_heat_grid.py [--years 1 3 6]
+"""
+import argparse
+import os
+import sys
+import time
+
+import duckdb
+import folium
+from folium.plugins import HeatMap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData  # noqa: E402
+import heat_grid  # noqa: E402
+import route_cache  # noqa: E402
+
+
+def render(heat):
+    start = time.perf_counter()
+    m = folium.Map(zoom_start=12)
+    HeatMap(heat, radius=8, blur=6, min_opacity=0.5).add_to(m)
+    html = m.get_root().render()
+    return len(html), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 3, 6])
+    args = parser.parse_args()
+
+    print(f"{'years':>5} {'runs':>6} {'points':>9} {'cells':>7} {'points html':>12} {'cells html':>11}"
+          f" {'points':>9} {'cells':>9} {'bin/run':>8}")
+    for years in args.years:
+        data = SyntheticData(years)
+        ids = [a["id"] for a in data.activities]
+        con = duckdb.connect()
+        # load_cells picks the runs to show from `runs`
+        con.execute("CREATE TABLE runs (activity_id BIGINT, start_date_local TIMESTAMP)")
+        con.executemany("INSERT INTO runs VALUES (?, ?)",
+                        [(a["id"], a["start_date_local"].rstrip("Z")) for a in data.activities])
+        route_cache.ensure_route_table(con)
+        heat_grid.ensure_heat_table(con)
+        route_cache.save_routes(con, ids, route_cache.route_frame(ids, [a["map"]["summary_polyline"] for a in data.activities]))
+        start = time.perf_counter()
+        for activity_id in ids:
+            heat_grid.save_cells(con, [activity_id])
+        bin_ms = (time.perf_counter() - start) / len(ids) * 1000
+
+        points = con.execute("""
+            SELECT UNNEST(lat) AS lat, UNNEST(lng) AS lng FROM run_routes
+        """).fetchnumpy()
+        point_list = [[float(lat), float(lng)] for lat, lng in zip(points["lat"], points["lng"])]
+        point_bytes, point_s = render(point_list)
+
+        start = time.perf_counter()
+        cells = heat_grid.load_cells(con)
+        load_s = time.perf_counter() - start
+        cell_bytes, cell_s = render(cells)
+
+        print(f"{years:>5g} {len(ids):>6} {len(point_list):>9,} {len(cells):>7,} {point_bytes / 1e3:>9.0f} kB"
+              f" {cell_bytes / 1e3:>8.0f} kB {point_s * 1000:>6.0f} ms {(load_s + cell_s) * 1000:>6.0f} ms"
+              f" {bin_ms:>5.1f} ms")
@@ -0,0 +1,75 @@
+"""Benchmark: import time of what the dashboard loads at startup, with a budget.
+
+Imports the modules app.py and pages/details.py import, each set in a fresh
+interpreter (median of --repeats), and checks that none of the heavy
+dependencies that only some code paths need (scikit-learn, stravalib,
+openai, folium, altair) came along. Exits non-zero when a set is over
+--budget-ms or a heavy dependency is imported, so it can gate CI.
+
+    python benchmarks/bench_import_time.py [--repeats 5] [--budget-ms 1500]
+
+Importing must not touch running.duckdb either; each import runs in an empty
+temporary directory and fails if a database file appears there.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported at the top of each entry point
+STARTUP_IMPORTS = {
+    "app.py": ["streamlit", "duckdb", "data_ingestion", "streamlit.components.v1", "chat_window",
+               "stream_features", "route_cache", "heat_grid", "run_table", "rollups"],
+    "pages/details.py": ["streamlit", "duckdb", "streamlit.components.v1", "chat_window", "stream_pyramid"],
+}
+# Loaded only where used: fitting or loading the classifier, a sync, the chat's LLM call, drawing
+LAZY_DEPENDENCIES = ["sklearn", "joblib", "stravalib", "openai", "folium", "altair"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(modules, workdir):
+    code = PROBE.format(root=ROOT, modules=modules, lazy=LAZY_DEPENDENCIES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'entry point':<18} {'median':>9} {'max':>9}  lazy dependencies imported")
+    for entry, modules in STARTUP_IMPORTS.items():
+        with tempfile.TemporaryDirectory() as workdir:
+            runs = [probe(modules, workdir) for _ in range(args.repeats)]
+            touched = os.listdir(workdir)
+        timings = [run["ms"] for run in runs]
+        loaded = sorted({m for run in runs for m in run["loaded"]})
+        median = statistics.median(timings)
+        print(f"{entry:<18} {median:>6.0f} ms {max(timings):>6.0f} ms  {', '.join(loaded) or '-'}")
+        if median > args.budget_ms:
+            failures.append(f"{entry}: {median:.0f} ms over the {args.budget_ms:.0f} ms budget")
+        if loaded:
+            failures.append(f"{entry}: imports {', '.join(loaded)} at startup")
+        if touched:
+            failures.append(f"{entry}: importing created {', '.join(touched)}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
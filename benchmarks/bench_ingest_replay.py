@@ -0,0 +1,82 @@
+"""Benchmark: a full Strava + weather + Oura sync against the local fixture server.
+
+Starts `fixture_server.py` in-process (synthetic data, or recorded fixtures
+with --replay), points data_ingestion at it and runs `sync_all` into a fresh
+DuckDB file. Needs no credentials or network, so throughput, retry behaviour
+and DB write cost are reproducible.
+
+    python benchmarks/bench_ingest_replay.py [--years 1] [--latency-ms 50] [--rate-429 0.02] [--fail-rate 0.01]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import Fixtures, SyntheticData, base_url_env, start_server  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--replay", metavar="DIR", help="Replay recorded fixtures instead of synthetic data")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--stream-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.replay:
+        source = {"fixtures": Fixtures(os.path.abspath(args.replay))}
+    else:
+        source = {"data": SyntheticData(args.years)}
+    server = start_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          rate_429=args.rate_429, fail_rate=args.fail_rate, **source)
+
+    # Everything is read at import time: base URLs, credentials, token cache, DB file
+    workdir = tempfile.mkdtemp()
+    os.environ.update(base_url_env(server.base_url))
+    os.environ.update({
+        "STRAVA_CLIENT_ID": "fixture", "STRAVA_CLIENT_SECRET": "fixture", "STRAVA_REFRESH_TOKEN": "fixture",
+        "OURA_API_TOKEN": "fixture", "TOKEN_CACHE_PATH": os.path.join(workdir, "tokens.json"),
+        "STREAM_WORKERS": str(args.stream_workers),
+    })
+    os.chdir(workdir)
+    import data_ingestion  # noqa: E402
+
+    # stravalib warns on every stream request about resolution="high"
+    warnings.filterwarnings("ignore", category=FutureWarning)
+
+    oura_start = (date.today() - timedelta(days=int(365 * args.years))).isoformat()
+    start = time.perf_counter()
+    data_ingestion.sync_all(limit=None, full_sync=True, oura_start_date=oura_start)
+    elapsed = time.perf_counter() - start
+
+    con = data_ingestion.con
+    runs = con.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+    samples = con.execute("SELECT COUNT(*) FROM run_streams").fetchone()[0]
+    weather = con.execute("SELECT COUNT(temp_c) FROM weather_by_run").fetchone()[0]
+    oura = sum(con.execute(f"SELECT COUNT(*) FROM oura_{name}").fetchone()[0]
+               for name in data_ingestion.OURA_ENDPOINTS)
+    con.execute("CHECKPOINT")
+    size_mb = os.path.getsize(os.path.join(workdir, "running.duckdb")) / 1e6
+
+    print()
+    print(f"{'elapsed':<18} {elapsed:>10.1f} s")
+    print(f"{'runs':<18} {runs:>10}  ({runs / elapsed:.1f}/s)")
+    print(f"{'stream samples':<18} {samples:>10}  ({samples / elapsed:,.0f}/s)")
+    print(f"{'runs with weather':<18} {weather:>10}")
+    print(f"{'oura records':<18} {oura:>10}")
+    print(f"{'database size':<18} {size_mb:>10.1f} MB")
+    print("server responses:")
+    for key, count in sorted(server.stats.items()):
+        print(f"  {key:<24} {count:>8}")
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,115 @@
+"""Benchmark: normalizing one synthetic year of Oura sleep records.
+
+Both sides start from the raw response body, as returned by the API: the old
+path parses it into Python objects and sniffs types with per-column regexes,
+the new one hands the text to the schema-driven `data_ingestion.normalize_oura`.
+
+    python benchmarks/bench_oura_normalize.py [--repeats 3]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# data_ingestion opens running.duckdb in the working directory on import
+os.chdir(tempfile.mkdtemp())
+import data_ingestion  # noqa: E402
+
+
+def synthetic_sleep_year(days=365):
+    """One long sleep per night plus a nap every fifth day, shaped like the v2 sleep endpoint."""
+    rng = np.random.default_rng(7)
+    records = []
+    for i in range(days):
+        day = date(2025, 1, 1) + timedelta(days=i)
+        for kind in ["long_sleep"] + (["sleep"] if i % 5 == 0 else []):
+            start = datetime(day.year, day.month, day.day, 23) - timedelta(days=1)
+            samples = 96 if kind == "long_sleep" else 12
+            records.append({
+                "id": f"{day.isoformat()}-{kind}-{rng.integers(1e9)}",
+                "day": day.isoformat(),
+                "bedtime_start": start.isoformat() + "+01:00",
+                "bedtime_end": (start + timedelta(minutes=5 * samples)).isoformat() + "+01:00",
+                "type": kind,
+                "period": 0,
+                "total_sleep_duration": int(rng.integers(20000, 30000)),
+                "time_in_bed": int(rng.integers(25000, 32000)),
+                "awake_time": int(rng.integers(1000, 3000)),
+                "deep_sleep_duration": int(rng.integers(3000, 6000)),
+                "light_sleep_duration": int(rng.integers(10000, 15000)),
+                "rem_sleep_duration": int(rng.integers(4000, 7000)),
+                "latency": int(rng.integers(300, 1200)),
+                "efficiency": int(rng.integers(80, 95)),
+                "restless_periods": int(rng.integers(100, 300)),
+                "average_breath": float(rng.normal(15, 1)),
+                "average_heart_rate": float(rng.normal(55, 3)),
+                "average_hrv": float(rng.normal(60, 10)),
+                "lowest_heart_rate": int(rng.integers(45, 55)),
+                "readiness_score_delta": None,
+                "sleep_score_delta": None,
+                "low_battery_alert": False,
+                "movement_30_sec": "".join(rng.choice(list("1234"), samples * 10)),
+                "sleep_phase_5_min": "".join(rng.choice(list("1234"), samples)),
+                "heart_rate": {"interval": 300.0, "items": rng.normal(55, 4, samples).round().tolist(),
+                               "timestamp": start.isoformat() + "+01:00"},
+                "hrv": {"interval": 300.0, "items": rng.normal(60, 15, samples).round().tolist(),
+                        "timestamp": start.isoformat() + "+01:00"},
+                "readiness": {"score": int(rng.integers(60, 95)), "temperature_deviation": 0.1,
+                              "contributors": {"hrv_balance": 80, "recovery_index": 90}},
+            })
+    return records
+
+
+def legacy_normalize(name, pages):
+    data = [record for page in pages for record in json.loads(page)["data"]]
+    df = pd.DataFrame(data)
+
+    if "timestamp" not in df.columns:
+        if "day" in df.columns:
+            df["timestamp"] = pd.to_datetime(df["day"])
+        elif "bedtime_start" in df.columns:
+            df["timestamp"] = pd.to_datetime(df["bedtime_start"])
+
+    for col in df.columns:
+        if df[col].dtype == object and df[col].astype(str).str.match(r"^\d{4}-\d{2}-\d{2}").any():
+            df[col] = pd.to_datetime(df[col], errors="coerce", utc=True)
+
+    for col in df.columns:
+        if df[col].astype(str).str.fullmatch(r"\d{20,}").any():
+            df[col] = df[col].astype(str)
+
+    for col, col_type in data_ingestion.OURA_ENDPOINTS[name]["columns"].items():
+        if col_type == "JSON" and col in df.columns:
+            df[col] = df[col].map(lambda v: None if v is None else json.dumps(v))
+    return df
+
+
+def bench(label, normalize, pages, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        df = normalize("sleep", pages)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{label:<24} {len(df):>5} records  {len(df.columns):>3} cols  {best * 1000:>8.1f} ms")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = [json.dumps({"data": synthetic_sleep_year(), "next_token": None})]
+    before = bench("regex sniffing (before)", legacy_normalize, pages, args.repeats)
+    after = bench("schema-driven (after)", data_ingestion.normalize_oura, pages, args.repeats)
+    print(f"speed-up: {before / after:.1f}x")
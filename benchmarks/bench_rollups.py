@@ -0,0 +1,76 @@
+"""Benchmark: trend chart frames, pandas groupbys over every run vs run_rollups.
+
+Fills an in-memory runs table with random runs and times what app.py did on
+each data version (load all runs, group by month and week, cumsum), reading
+the month and week rollups instead, and refreshing the periods of one saved
+run.
+
+    python benchmarks/bench_rollups.py [--runs 500 5000 50000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rollups  # noqa: E402
+
+
+def fill(con, n, rng):
+    runs = pd.DataFrame({
+        "activity_id": np.arange(n, dtype=np.int64),
+        "start_date_local": pd.Timestamp("2020-01-02") + pd.to_timedelta(rng.uniform(0, 5 * 365, n), unit="D"),
+        "distance_km": rng.uniform(3, 25, n),
+        "pace_min_per_km": rng.uniform(4, 7, n),
+        "average_heartrate": rng.uniform(120, 175, n),
+    })
+    con.register("staged_runs", runs)
+    con.execute("CREATE OR REPLACE TABLE runs AS SELECT * FROM staged_runs")
+    con.unregister("staged_runs")
+    rollups.ensure_rollup_table(con)
+    rollups.rebuild(con)
+
+
+def legacy_frames(con):
+    df = con.execute("SELECT * FROM runs ORDER BY start_date_local DESC").fetchdf()
+    df["week_start"] = (df["start_date_local"] - pd.to_timedelta(df["start_date_local"].dt.weekday, unit="D")).dt.date
+    df["year_month"] = df["start_date_local"].dt.to_period("M").astype(str)
+    df_trend = df.groupby("year_month").agg({"distance_km": "sum"}).reset_index()
+    df_pace_trend = df.groupby("year_month").agg({"pace_min_per_km": "mean"}).reset_index()
+    df_week = df.groupby("week_start").agg(
+        distance_km=("distance_km", "sum"), num_runs=("distance_km", "count")
+    ).reset_index().sort_values("week_start")
+    df_week["cumulative_distance"] = df_week["distance_km"].cumsum()
+    return df_trend, df_pace_trend, df_week
+
+
+def timed(fn, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, nargs="+", default=[500, 5000, 50000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'runs':>7} {'groupby':>10} {'rollups':>10} {'refresh 1 run':>14}")
+    for n in args.runs:
+        con = duckdb.connect()
+        fill(con, n, rng)
+        legacy_s = timed(lambda: legacy_frames(con))
+        rollup_s = timed(lambda: (rollups.load_rollup(con, "month"), rollups.load_rollup(con, "week")))
+        start_date = con.execute("SELECT start_date_local FROM runs LIMIT 1").fetchone()[0]
+        refresh_s = timed(lambda: rollups.refresh_periods(con, [start_date]))
+        print(f"{n:>7,} {legacy_s * 1000:>7.1f} ms {rollup_s * 1000:>7.1f} ms {refresh_s * 1000:>11.1f} ms")
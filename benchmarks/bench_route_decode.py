@@ -0,0 +1,84 @@
+"""Benchmark: building the heatmap points, per-run polyline.decode vs run_routes.
+
+Encodes synthetic routes (from fixture_server.SyntheticData) as summary
+polylines and times what app.py did on every rerun (iterrows +
+polyline.decode), the batch NumPy decoder used at ingest, and the read app.py
+does now (unnest run_routes).
+
+    python benchmarks/bench_route_decode.py [--years 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+import polyline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData  # noqa: E402
+import route_cache  # noqa: E402
+
+
+def timed(fn, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def legacy_points(df):
+    all_points = []
+    for _, row in df.iterrows():
+        if pd.notna(row["summary_polyline"]):
+            all_points.extend(polyline.decode(row["summary_polyline"]))
+    lats, lons = zip(*all_points)
+    return all_points, [[min(lats), min(lons)], [max(lats), max(lons)]]
+
+
+def cached_points(con, ids):
+    points = con.execute("""
+        SELECT UNNEST(lat) AS lat, UNNEST(lng) AS lng
+        FROM run_routes
+        WHERE activity_id IN (SELECT UNNEST(?))
+    """, (ids,)).fetchnumpy()
+    bounds = con.execute("""
+        SELECT MIN(min_lat), MIN(min_lng), MAX(max_lat), MAX(max_lng)
+        FROM run_routes
+        WHERE activity_id IN (SELECT UNNEST(?))
+    """, (ids,)).fetchone()
+    return points, bounds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=2)
+    args = parser.parse_args()
+
+    data = SyntheticData(args.years)
+    df = pd.DataFrame({
+        "activity_id": [a["id"] for a in data.activities],
+        "summary_polyline": [a["map"]["summary_polyline"] for a in data.activities],
+    })
+    ids = df["activity_id"].tolist()
+
+    con = duckdb.connect()
+    route_cache.ensure_route_table(con)
+    route_cache.save_routes(con, ids, route_cache.route_frame(ids, df["summary_polyline"]))
+
+    legacy, (points, _) = timed(lambda: legacy_points(df))
+    batch, (lat, lng, _) = timed(lambda: route_cache.decode_polylines(df["summary_polyline"]))
+    cached, (stored, _) = timed(lambda: cached_points(con, ids))
+
+    error = np.abs(np.array(points) - np.column_stack([stored["lat"], stored["lng"]])).max()
+    print(f"{len(df)} runs, {len(points):,} points, float32 storage error {error * 111_000:.2f} m")
+    print(f"{'polyline.decode per run':<28} {legacy * 1000:>8.1f} ms   (app.py before, every rerun)")
+    print(f"{'batch NumPy decode':<28} {batch * 1000:>8.1f} ms   (once, at ingest)")
+    print(f"{'read run_routes':<28} {cached * 1000:>8.1f} ms   (app.py now)")
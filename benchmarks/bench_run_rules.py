@@ -0,0 +1,95 @@
+"""Benchmark: run-type rules, iterrows cascade vs the RULES decision table.
+
+Draws random classifier features (with many values exactly on a threshold),
+applies the rule cascade classify_runs used to run row by row and
+ImprovedRunClassifier.apply_rules, checks they agree on every run and prints
+the time of each plus the per-rule hit counts.
+
+    python benchmarks/bench_run_rules.py [--runs 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from run_classifier import ImprovedRunClassifier, RULES  # noqa: E402
+
+
+def legacy_rules(features):
+    """The rule cascade as classify_runs applied it before RULES."""
+    run_types = ['unknown'] * len(features)
+    for i, row in features.iterrows():
+        distance = row['distance_km']
+        variability = row['variability_score']
+        intensity = row['intensity_score']
+        work_rest = row['work_rest_ratio']
+        high_intensity_pct = row['high_intensity_time']
+        pace = row['avg_pace']
+        skip_interval_check = distance > 6
+        if distance >= 15:
+            run_types[i] = 'long run'
+        elif not skip_interval_check and variability > 0.25 and work_rest > 0.23 and high_intensity_pct > 0.18:
+            run_types[i] = 'interval'
+        elif not skip_interval_check and variability > 0.3 and pace < 5.5 and intensity < 0.5:
+            run_types[i] = 'interval'
+        elif distance <= 6 and variability < 0.2 and intensity < 0.6:
+            run_types[i] = 'easy run'
+        elif distance >= 5 and 5.5 <= pace <= 6.3 and variability < 0.25:
+            run_types[i] = 'tempo run'
+        elif 4 < distance <= 12 and variability > 0.4:
+            run_types[i] = 'tempo run'
+        elif distance <= 8 and intensity > 0.75:
+            run_types[i] = 'speed work'
+        elif distance > 6 and variability > 0.3 and intensity > 0.5:
+            run_types[i] = 'tempo run'
+        elif distance <= 6 and variability > 0.3 and intensity < 0.5:
+            run_types[i] = 'interval'
+    return run_types
+
+
+def random_features(n, rng):
+    columns = {
+        "distance_km": (0, 25), "variability_score": (0, 0.6), "intensity_score": (0.2, 1.0),
+        "work_rest_ratio": (0, 0.6), "high_intensity_time": (0, 0.5), "avg_pace": (4, 8),
+    }
+    thresholds = {}
+    for _, _, clauses in RULES:
+        for col, _, threshold in clauses:
+            thresholds.setdefault(col, []).append(threshold)
+    features = {}
+    for col, (low, high) in columns.items():
+        values = rng.uniform(low, high, n)
+        # A fifth of the values sit exactly on a threshold, to check < vs <=
+        on_edge = rng.random(n) < 0.2
+        values[on_edge] = rng.choice(thresholds[col], on_edge.sum())
+        features[col] = values
+    return pd.DataFrame(features)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10_000)
+    args = parser.parse_args()
+
+    features = random_features(args.runs, np.random.default_rng(42))
+    classifier = ImprovedRunClassifier()
+
+    start = time.perf_counter()
+    legacy = legacy_rules(features)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = classifier.apply_rules(features)
+    table_s = time.perf_counter() - start
+
+    mismatches = int((np.array(legacy, dtype=object) != table).sum())
+    print(f"{args.runs:,} runs, {mismatches} mismatches")
+    print(f"{'iterrows cascade':<20} {legacy_s * 1000:>9.1f} ms")
+    print(f"{'RULES decision table':<20} {table_s * 1000:>9.1f} ms")
+    print(classifier.rule_hits.to_string())
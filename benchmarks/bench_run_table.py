@@ -0,0 +1,70 @@
+"""Benchmark: run table, whole history to HTML vs one DuckDB page.
+
+Fills an in-memory runs/run_types pair with random runs and times what app.py
+rendered before (every run formatted and passed through to_html) against
+run_table.load_page + page_html for the first and last page, as the history
+grows.
+
+    python benchmarks/bench_run_table.py [--runs 500 5000 50000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import run_table  # noqa: E402
+
+RUN_TYPES = ["easy run", "long run", "tempo run", "interval", "recovery run", "speed work"]
+
+
+def fill(con, n, rng):
+    runs = pd.DataFrame({
+        "activity_id": np.arange(n, dtype=np.int64) + 10_000_000,
+        "start_date_local": pd.Timestamp("2020-01-02") + pd.to_timedelta(rng.uniform(0, 5 * 365, n), unit="D"),
+        "run_name": [f"Run {i}" for i in range(n)],
+        "distance_km": rng.uniform(3, 25, n),
+        "moving_time_min": rng.uniform(15, 150, n),
+        "pace_min_per_km": rng.uniform(4, 7, n),
+        "total_elevation_gain_m": rng.uniform(0, 300, n),
+        "average_heartrate": rng.uniform(120, 175, n),
+    })
+    runs["run_type"] = rng.choice(RUN_TYPES, n)
+    con.register("staged_runs", runs)
+    con.execute("CREATE OR REPLACE TABLE runs AS SELECT * EXCLUDE (run_type) FROM staged_runs")
+    con.execute("CREATE OR REPLACE TABLE run_types AS SELECT activity_id, run_type FROM staged_runs")
+    con.unregister("staged_runs")
+    return runs
+
+
+def timed(fn, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, nargs="+", default=[500, 5000, 50000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'runs':>7} {'full table':>11} {'html':>9} {'first page':>11} {'last page':>10} {'html':>7}")
+    for n in args.runs:
+        con = duckdb.connect()
+        runs_df = fill(con, n, rng)
+        full_s, full_html = timed(lambda: run_table.page_html(runs_df.sort_values("start_date_local", ascending=False)))
+        last = (n - 1) // run_table.PAGE_SIZE
+        first_s, first_html = timed(lambda: run_table.page_html(run_table.load_page(con, page=0)))
+        last_s, _ = timed(lambda: run_table.page_html(run_table.load_page(con, sort="Pace (min/km)", page=last)))
+        print(f"{n:>7,} {full_s * 1000:>8.0f} ms {len(full_html) / 1e3:>6.0f} kB {first_s * 1000:>8.1f} ms"
+              f" {last_s * 1000:>7.1f} ms {len(first_html) / 1e3:>4.0f} kB")
@@ -0,0 +1,73 @@
+"""Benchmark: dashboard stream features, LAG query over run_streams vs run_stream_features.
+
+Ingests synthetic runs (from fixture_server.SyntheticData) and, as the history
+grows, times what app.py ran on every load (the hr_changes window query over
+every stream sample) against the join it does now, plus the per-run refresh
+ingest pays instead.
+
+    python benchmarks/bench_stream_features.py [--years 2] [--steps 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData  # noqa: E402
+
+# data_ingestion opens running.duckdb in the working directory on import
+workdir = tempfile.mkdtemp()
+os.chdir(workdir)
+import data_ingestion  # noqa: E402
+import stream_features  # noqa: E402
+
+LEGACY_SQL = stream_features.FEATURE_SQL.replace(
+    "activity_id IN (SELECT activity_id FROM staged_feature_ids)\n        AND", ""
+)
+JOIN_SQL = f"""
+    SELECT r.activity_id, {", ".join(f"f.{c}" for c in stream_features.FEATURE_COLUMNS)}
+    FROM runs r
+    LEFT JOIN run_stream_features f USING (activity_id)
+"""
+
+
+def timed(sql, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        data_ingestion.con.execute(sql).fetchdf()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--steps", type=int, default=4)
+    args = parser.parse_args()
+
+    data = SyntheticData(args.years)
+    con = data_ingestion.con
+    con.executemany("INSERT INTO runs (activity_id) VALUES (?)", [(a["id"],) for a in data.activities])
+    batches = np.array_split(np.arange(len(data.activities)), args.steps)
+
+    print(f"{'runs':>6} {'samples':>10} {'LAG query':>11} {'join':>9} {'refresh/run':>12}")
+    for batch in batches:
+        refresh = []
+        for i in batch:
+            activity = data.activities[i]
+            streams = data.streams(activity["id"], data_ingestion.STREAM_TYPES)
+            frame, _ = data_ingestion.prepare_streams({k: v["data"] for k, v in streams.items()})
+            data_ingestion.store_streams(activity["id"], frame, [])
+            start = time.perf_counter()
+            stream_features.refresh_features(con, [activity["id"]])
+            refresh.append(time.perf_counter() - start)
+        runs, samples = con.execute("SELECT COUNT(*), SUM(sample_count) FROM activity_streams").fetchone()
+        print(f"{runs:>6} {samples:>10,} {timed(LEGACY_SQL) * 1000:>8.1f} ms {timed(JOIN_SQL) * 1000:>6.1f} ms"
+              f" {np.median(refresh) * 1000:>9.1f} ms")
@@ -0,0 +1,85 @@
+"""Benchmark: writing one synthetic 2-hour, 1 Hz run.
+
+Compares the old row-by-row `executemany` path into a row-per-sample table with
+`data_ingestion.save_streams` (one activity_streams row, read back through the
+run_streams view).
+
+    python benchmarks/bench_stream_load.py [--repeats 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# data_ingestion opens running.duckdb in the working directory on import
+os.chdir(tempfile.mkdtemp())
+import data_ingestion  # noqa: E402
+
+con = data_ingestion.con
+con.execute("""
+CREATE TABLE legacy_run_streams (
+    activity_id BIGINT,
+    stream_index INT,
+    heartrate DOUBLE,
+    velocity_smooth DOUBLE,
+    time_sec INT,
+    distance_m DOUBLE
+)
+""")
+
+
+def synthetic_streams(seconds=2 * 60 * 60):
+    rng = np.random.default_rng(42)
+    velocity = np.clip(3.0 + rng.normal(0, 0.3, seconds), 0.5, None)
+    return {
+        "time": list(range(seconds)),
+        "heartrate": (145 + rng.normal(0, 8, seconds)).round().tolist(),
+        "velocity_smooth": velocity.round(2).tolist(),
+        "distance": np.cumsum(velocity).round(1).tolist(),
+    }
+
+
+def legacy_save_streams(activity_id, streams):
+    zipped = zip(
+        range(len(streams["time"])),
+        streams["heartrate"] or [None] * len(streams["time"]),
+        streams["velocity_smooth"] or [None] * len(streams["time"]),
+        streams["time"],
+        streams["distance"] or [None] * len(streams["time"])
+    )
+    con.execute("DELETE FROM legacy_run_streams WHERE activity_id = ?", (activity_id,))
+    con.executemany("""
+        INSERT INTO legacy_run_streams (
+            activity_id, stream_index, heartrate,
+            velocity_smooth, time_sec, distance_m
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    """, [(activity_id, i, hr, v, t, d) for i, hr, v, t, d in zipped])
+
+
+def bench(name, save, table, streams, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        save(1, streams)
+        timings.append(time.perf_counter() - start)
+    rows = con.execute(f"SELECT COUNT(*) FROM {table} WHERE activity_id = 1").fetchone()[0]
+    best = min(timings)
+    print(f"{name:<22} {rows:>6} rows  {best * 1000:>9.1f} ms  {rows / best:>12,.0f} rows/sec")
+    return rows / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    streams = synthetic_streams()
+    before = bench("executemany (before)", legacy_save_streams, "legacy_run_streams", streams, args.repeats)
+    after = bench("columnar (after)", data_ingestion.save_streams, "run_streams", streams, args.repeats)
+    print(f"speed-up: {after / before:.0f}x")
@@ -0,0 +1,122 @@
+"""Benchmark: details-page chart payload, full 1 Hz samples vs stream_pyramid levels.
+
+Ingests synthetic runs (from fixture_server.SyntheticData), then for each run
+builds the pace/HR chart the way pages/details.py used to (every sample, all
+helper columns) and from each stored pyramid level, and compares the Vega-Lite
+spec size Streamlit ships to the browser and the time to load the data.
+
+    python benchmarks/bench_stream_pyramid.py [--years 0.5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData  # noqa: E402
+
+# data_ingestion opens running.duckdb in the working directory on import
+workdir = tempfile.mkdtemp()
+os.chdir(workdir)
+import data_ingestion  # noqa: E402
+import stream_pyramid  # noqa: E402
+
+alt.data_transformers.disable_max_rows()
+
+
+def legacy_frame(con, run_id):
+    """The frame the old get_streaming_data + plot_strava_style_chart handed to Altair."""
+    time_sec, heartrate, velocity_mms = con.execute(
+        "SELECT time_sec, heartrate, velocity_mms FROM activity_streams WHERE activity_id = ?", (run_id,)
+    ).fetchone()
+    df = pd.DataFrame({
+        "time_sec": np.asarray(time_sec, dtype=np.int64),
+        "heartrate": np.asarray(heartrate, dtype=np.float64),
+        "velocity_smooth": np.asarray(velocity_mms, dtype=np.float64) / 1000,
+    })
+    df["pace"] = 1000 / (df["velocity_smooth"] * 60)
+    df = df[(df["pace"] < 20) & (df["pace"] > 2)]
+    df = df[(df["heartrate"] > 60) & (df["heartrate"] < 220)].copy()
+    df["delta_time"] = df["time_sec"].diff().fillna(0)
+    df["delta_dist_m"] = df["velocity_smooth"] * df["delta_time"]
+    df["distance_km"] = df["delta_dist_m"].cumsum() / 1000
+    df = df[(df["pace"] > 3) & (df["pace"] < 12)].copy()
+    df["pace_smooth"] = df["pace"].rolling(window=7, min_periods=1).mean()
+    df["hr_smooth"] = df["heartrate"].rolling(window=7, min_periods=1).mean()
+    return df
+
+
+def level_frame(con, run_id, level):
+    distance_m, pace_ds, hr_dbpm = con.execute(
+        "SELECT distance_m, pace_ds, hr_dbpm FROM stream_pyramid WHERE activity_id = ? AND level = ?",
+        (run_id, level),
+    ).fetchone()
+    return pd.DataFrame({
+        "distance_km": np.asarray(distance_m) / 1000,
+        "pace_smooth": np.asarray(pace_ds) / 600,
+        "hr_smooth": np.asarray(hr_dbpm) / 10,
+    })
+
+
+def spec_bytes(df):
+    pace = alt.Chart(df).mark_line().encode(x="distance_km", y="pace_smooth")
+    hr = alt.Chart(df).mark_line().encode(x="distance_km", y="hr_smooth")
+    return len(alt.vconcat(pace, hr).to_json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=0.5)
+    args = parser.parse_args()
+
+    data = SyntheticData(args.years)
+    start = time.perf_counter()
+    for activity in data.activities:
+        streams = data.streams(activity["id"], data_ingestion.STREAM_TYPES)
+        data_ingestion.save_streams(activity["id"], {k: v["data"] for k, v in streams.items()})
+    ingest = time.perf_counter() - start
+
+    con = data_ingestion.con
+    names = ["full"] + [f"level {level}" for level in stream_pyramid.LEVELS]
+    loaders = [lambda r: legacy_frame(con, r)] + [
+        lambda r, level=level: level_frame(con, r, level) for level in stream_pyramid.LEVELS
+    ]
+    points = {name: [] for name in names}
+    payload = {name: [] for name in names}
+    load_ms = {name: [] for name in names}
+    peaks = []
+    for activity in data.activities:
+        frames = []
+        for name, load in zip(names, loaders):
+            t = time.perf_counter()
+            df = load(activity["id"])
+            load_ms[name].append((time.perf_counter() - t) * 1000)
+            points[name].append(len(df))
+            payload[name].append(spec_bytes(df))
+            frames.append(df)
+        # Largest gap between the plotted extremes at full resolution and at the smallest level
+        full, small = frames[0], frames[1]
+        peaks.append(max(
+            abs(full["pace_smooth"].min() - small["pace_smooth"].min()) * 60,
+            abs(full["hr_smooth"].max() - small["hr_smooth"].max()),
+        ))
+
+    print(f"{len(data.activities)} runs, pyramids built in {ingest:.1f} s (with stream storage)")
+    print(f"{'':<12} {'points':>9} {'payload':>11} {'load':>9} {'vs full':>8}")
+    for name in names:
+        kb = np.median(payload[name]) / 1e3
+        ratio = np.median(np.array(payload["full"]) / np.array(payload[name]))
+        print(f"{name:<12} {np.median(points[name]):>9.0f} {kb:>8.0f} kB {np.median(load_ms[name]):>6.1f} ms {ratio:>7.1f}x")
+    longest = int(np.argmax(points["full"]))
+    print(f"longest run: {points['full'][longest]} -> " + ", ".join(
+        f"{points[name][longest]} points ({payload['full'][longest] / payload[name][longest]:.0f}x smaller)"
+        for name in names[1:]))
+    print(f"largest peak shift at level {stream_pyramid.LEVELS[0]}: {max(peaks):.2f} (s/km or bpm)")
@@ -0,0 +1,117 @@
+"""Benchmark: row-per-sample stream storage vs one array row per activity.
+
+Stores the same synthetic 1 Hz runs (from fixture_server.SyntheticData) in the
+old `run_streams` table layout and in `activity_streams`, then compares
+storage used, a whole-table window query of the kind app.py runs (through the
+run_streams view for arrays), and loading a single run the way
+pages/details.py does.
+
+    python benchmarks/bench_stream_storage.py [--years 1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import SyntheticData  # noqa: E402
+
+# data_ingestion opens running.duckdb in the working directory on import
+workdir = tempfile.mkdtemp()
+os.chdir(workdir)
+import data_ingestion  # noqa: E402
+
+FEATURE_QUERY = """
+    SELECT activity_id, AVG(velocity_smooth), STDDEV_POP(heartrate),
+           COUNT(CASE WHEN hr_change > 10 THEN 1 END)
+    FROM (
+        SELECT activity_id, heartrate, velocity_smooth,
+               heartrate - LAG(heartrate) OVER (PARTITION BY activity_id ORDER BY time_sec) AS hr_change
+        FROM run_streams
+        WHERE velocity_smooth > 0.5 AND heartrate BETWEEN 60 AND 220
+    )
+    GROUP BY activity_id
+"""
+
+
+def load_legacy(con, activity_id, streams):
+    n = len(streams["time"]["data"])
+    frame = pd.DataFrame({
+        "activity_id": np.full(n, activity_id, dtype=np.int64),
+        "stream_index": np.arange(n, dtype=np.int32),
+        "heartrate": np.asarray(streams["heartrate"]["data"], dtype=np.float64),
+        "velocity_smooth": np.asarray(streams["velocity_smooth"]["data"], dtype=np.float64),
+        "time_sec": np.asarray(streams["time"]["data"], dtype=np.int32),
+        "distance_m": np.asarray(streams["distance"]["data"], dtype=np.float64),
+    })
+    con.register("staged", frame)
+    con.execute("INSERT INTO run_streams SELECT * FROM staged")
+    con.unregister("staged")
+
+
+def timed(fn, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=1)
+    args = parser.parse_args()
+
+    data = SyntheticData(args.years)
+    legacy_path = os.path.join(workdir, "legacy.duckdb")
+    legacy = duckdb.connect(legacy_path)
+    legacy.execute("""
+        CREATE TABLE run_streams (
+            activity_id BIGINT, stream_index INT, heartrate DOUBLE,
+            velocity_smooth DOUBLE, time_sec INT, distance_m DOUBLE
+        )
+    """)
+
+    samples = 0
+    keys = ["time", "distance", "velocity_smooth", "heartrate"]
+    for activity in data.activities:
+        streams = data.streams(activity["id"], keys)
+        samples += len(streams["time"]["data"])
+        load_legacy(legacy, activity["id"], streams)
+        data_ingestion.save_streams(activity["id"], {k: v["data"] for k, v in streams.items()})
+
+    con = data_ingestion.con
+    legacy.execute("CHECKPOINT")
+    con.execute("CHECKPOINT")
+    # Used blocks, not file size: free blocks left by earlier writes get reused.
+    # activity_streams is the only sizeable table in the ingestion database.
+    sizes = [
+        c.execute("SELECT used_blocks * block_size FROM pragma_database_size()").fetchone()[0]
+        for c in (legacy, con)
+    ]
+
+    run_id = data.activities[len(data.activities) // 2]["id"]
+    query = [timed(lambda: legacy.execute(FEATURE_QUERY).fetchall()), timed(lambda: con.execute(FEATURE_QUERY).fetchall())]
+    single = [
+        timed(lambda: legacy.execute(
+            "SELECT time_sec, heartrate, velocity_smooth FROM run_streams WHERE activity_id = ? ORDER BY time_sec",
+            (run_id,)).fetchdf()),
+        timed(lambda: con.execute(
+            "SELECT time_sec, heartrate, velocity_mms FROM activity_streams WHERE activity_id = ?",
+            (run_id,)).fetchone()),
+    ]
+
+    print(f"{len(data.activities)} runs, {samples:,} samples")
+    print(f"{'':<28} {'rows (before)':>14} {'arrays (after)':>15}")
+    print(f"{'storage used':<28} {sizes[0] / 1e6:>11.1f} MB {sizes[1] / 1e6:>12.1f} MB")
+    print(f"{'feature query, all runs':<28} {query[0] * 1000:>11.1f} ms {query[1] * 1000:>12.1f} ms")
+    print(f"{'load one run':<28} {single[0] * 1000:>11.1f} ms {single[1] * 1000:>12.1f} ms")
@@ -0,0 +1,425 @@
+"""Local stand-in for the Strava, Oura and Open-Meteo APIs.
+
+Serves either fixtures recorded with HTTP_RECORD_DIR (see http_client.py) or
+synthetic data: N years of runs with 1 Hz streams, daily Oura records and
+hourly weather. Latency, 429s and 5xx failures can be injected to exercise
+the retry and rate-limit paths. Point the ingestion code at it with:
+
+    python benchmarks/fixture_server.py --synthetic-years 2 --port 8765
+    STRAVA_BASE_URL=http://127.0.0.1:8765 OURA_BASE_URL=http://127.0.0.1:8765 \\
+    OPEN_METEO_BASE_URL=http://127.0.0.1:8765 python data_ingestion.py --full
+
+    HTTP_RECORD_DIR=fixtures python data_ingestion.py   # record live responses
+    python benchmarks/fixture_server.py --replay fixtures
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import polyline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from http_client import fixture_key  # noqa: E402
+
+HOME = (-33.87, 151.21)
+STREAMS_PATH = re.compile(r"^/api/v3/activities/(\d+)/streams$")
+OURA_PATH = re.compile(r"^/v2/usercollection/(\w+)$")
+OURA_PAGE_SIZE = 50
+# Params that change from run to run; replay falls back to ignoring them
+VOLATILE_PARAMS = {"after", "before", "start_date", "end_date"}
+
+
+def fixture_token():
+    return {"token_type": "Bearer", "access_token": "fixture-access", "refresh_token": "fixture-refresh",
+            "expires_at": int(time.time()) + 6 * 3600, "expires_in": 6 * 3600}
+
+
+class SyntheticData:
+    """Deterministic fake API payloads, generated on request from a seed."""
+
+    def __init__(self, years=1, runs_per_week=4, seed=7, end=None):
+        self.seed = seed
+        end = end or date.today()
+        rng = random.Random(seed)
+        self.activities = []
+        day = end - timedelta(days=int(365 * years))
+        activity_id = 10_000_000
+        while day <= end:
+            if rng.random() < runs_per_week / 7:
+                activity_id += 1
+                self.activities.append(self._activity(activity_id, day, rng))
+            day += timedelta(days=1)
+        self.by_id = {a["id"]: a for a in self.activities}
+
+    def _activity(self, activity_id, day, rng):
+        distance = rng.choice([5000, 6000, 8000, 10000, 12000, 16000, 21100]) * rng.uniform(0.95, 1.05)
+        pace = rng.uniform(4.5, 6.5) * 60  # seconds per km
+        moving_time = int(distance / 1000 * pace)
+        start = datetime(day.year, day.month, day.day, rng.randint(5, 19), rng.randint(0, 59))
+        lat = HOME[0] + rng.uniform(-0.05, 0.05)
+        lon = HOME[1] + rng.uniform(-0.05, 0.05)
+        route = [(lat + 0.01 * np.sin(t), lon + 0.01 * (1 - np.cos(t))) for t in np.linspace(0, 2 * np.pi, 40)]
+        return {
+            "id": activity_id,
+            "name": f"Run {day.isoformat()}",
+            "type": "Run",
+            "sport_type": "Run",
+            "start_date": start.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z"),
+            "start_date_local": start.isoformat() + "Z",
+            "distance": round(distance, 1),
+            "moving_time": moving_time,
+            "elapsed_time": moving_time + rng.randint(0, 300),
+            "total_elevation_gain": round(rng.uniform(5, 200), 1),
+            "average_heartrate": round(rng.uniform(130, 165), 1),
+            "max_heartrate": float(rng.randint(165, 190)),
+            "start_latlng": [round(lat, 6), round(lon, 6)],
+            "map": {"id": f"a{activity_id}", "summary_polyline": polyline.encode(route, 5)},
+        }
+
+    def list_activities(self, params):
+        before = int(params.get("before") or 2**40)
+        after = int(params.get("after") or 0)
+        page = int(params.get("page", 1))
+        per_page = int(params.get("per_page", 30))
+
+        def epoch(a):
+            return datetime.fromisoformat(a["start_date"].replace("Z", "+00:00")).timestamp()
+
+        selected = [a for a in self.activities if after < epoch(a) < before]
+        # Like Strava: oldest first when `after` is given, newest first otherwise
+        if not params.get("after"):
+            selected.reverse()
+        return selected[(page - 1) * per_page: page * per_page]
+
+    def streams(self, activity_id, keys):
+        activity = self.by_id.get(activity_id)
+        if activity is None:
+            return None
+        rng = np.random.default_rng(self.seed * 1_000_003 + activity_id)
+        n = activity["moving_time"]
+        mean_speed = activity["distance"] / n
+        velocity = np.clip(mean_speed + np.cumsum(rng.normal(0, 0.02, n)) * 0.1 + rng.normal(0, 0.15, n), 0.5, None)
+        distance = np.cumsum(velocity)
+        warmup = 1 - np.exp(-np.arange(n) / 300)
+        heartrate = np.round(95 + (activity["average_heartrate"] - 85) * warmup + rng.normal(0, 2, n))
+        available = {
+            "time": np.arange(n).tolist(),
+            "distance": np.round(distance, 1).tolist(),
+            "velocity_smooth": np.round(velocity, 3).tolist(),
+            "heartrate": heartrate.astype(int).tolist(),
+            "altitude": np.round(20 + 10 * np.sin(distance / 800), 1).tolist(),
+            "cadence": np.round(85 + rng.normal(0, 2, n)).astype(int).tolist(),
+            "latlng": np.round(np.column_stack([
+                activity["start_latlng"][0] + 0.01 * np.sin(distance / distance[-1] * 2 * np.pi),
+                activity["start_latlng"][1] + 0.01 * (1 - np.cos(distance / distance[-1] * 2 * np.pi)),
+            ]), 6).tolist(),
+        }
+        return {
+            key: {"type": key, "data": values, "series_type": "distance",
+                  "original_size": n, "resolution": "high"}
+            for key, values in available.items() if key in keys
+        }
+
+    def oura(self, endpoint, params):
+        start = date.fromisoformat(params["start_date"])
+        end = date.fromisoformat(params.get("end_date") or date.today().isoformat())
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        offset = int(params.get("next_token") or 0)
+        page = days[offset: offset + OURA_PAGE_SIZE]
+        next_offset = offset + OURA_PAGE_SIZE
+        return {
+            "data": [self._oura_record(endpoint, day) for day in page],
+            "next_token": str(next_offset) if next_offset < len(days) else None,
+        }
+
+    def _oura_record(self, endpoint, day):
+        rng = random.Random(f"{self.seed}-{endpoint}-{day}")
+        record = {"id": f"{endpoint}-{day.isoformat()}", "day": day.isoformat()}
+        if endpoint == "daily_readiness":
+            record.update(
+                score=rng.randint(55, 95),
+                temperature_deviation=round(rng.gauss(0, 0.3), 2),
+                temperature_trend_deviation=round(rng.gauss(0, 0.2), 2),
+                timestamp=f"{day.isoformat()}T00:00:00+00:00",
+                contributors={k: rng.randint(40, 100) for k in [
+                    "activity_balance", "body_temperature", "hrv_balance", "previous_day_activity",
+                    "previous_night", "recovery_index", "resting_heart_rate", "sleep_balance"]},
+            )
+        elif endpoint == "sleep":
+            bedtime = datetime(day.year, day.month, day.day, 22, 30) - timedelta(days=1)
+            in_bed = rng.randint(6 * 3600, 9 * 3600)
+            record.update(
+                type="long_sleep",
+                period=0,
+                bedtime_start=bedtime.isoformat() + "+00:00",
+                bedtime_end=(bedtime + timedelta(seconds=in_bed)).isoformat() + "+00:00",
+                time_in_bed=in_bed,
+                total_sleep_duration=int(in_bed * 0.9),
+                awake_time=int(in_bed * 0.1),
+                deep_sleep_duration=int(in_bed * 0.2),
+                light_sleep_duration=int(in_bed * 0.5),
+                rem_sleep_duration=int(in_bed * 0.2),
+                latency=rng.randint(120, 1200),
+                efficiency=rng.randint(80, 97),
+                restless_periods=rng.randint(100, 300),
+                average_breath=round(rng.uniform(13, 16), 1),
+                average_heart_rate=round(rng.uniform(45, 60), 1),
+                average_hrv=round(rng.uniform(30, 90), 1),
+                lowest_heart_rate=rng.randint(40, 55),
+                readiness={"score": rng.randint(55, 95)},
+                heart_rate={"interval": 300, "items": [rng.randint(45, 65) for _ in range(96)]},
+                hrv={"interval": 300, "items": [rng.randint(20, 120) for _ in range(96)]},
+            )
+        else:
+            record.update(
+                score=rng.randint(50, 100),
+                steps=rng.randint(4000, 25000),
+                active_calories=rng.randint(200, 1500),
+                total_calories=rng.randint(2000, 3500),
+                target_calories=500,
+                timestamp=f"{day.isoformat()}T04:00:00+00:00",
+                contributors={k: rng.randint(40, 100) for k in [
+                    "meet_daily_targets", "move_every_hour", "recovery_time",
+                    "stay_active", "training_frequency", "training_volume"]},
+            )
+        return record
+
+    def weather(self, params):
+        start = date.fromisoformat(params["start_date"])
+        end = date.fromisoformat(params["end_date"])
+        hours = int(((end - start).days + 1) * 24)
+        t = np.arange(hours)
+        return {
+            "latitude": float(params["latitude"]),
+            "longitude": float(params["longitude"]),
+            "hourly": {
+                "time": [(datetime(start.year, start.month, start.day) + timedelta(hours=int(h))).strftime("%Y-%m-%dT%H:%M")
+                         for h in t],
+                "temperature_2m": np.round(18 + 6 * np.sin((t % 24 - 9) / 24 * 2 * np.pi), 1).tolist(),
+                "relative_humidity_2m": np.round(65 - 15 * np.sin((t % 24 - 9) / 24 * 2 * np.pi)).tolist(),
+            },
+        }
+
+
+class Fixtures:
+    """Fixtures recorded by http_client, indexed by exact request and by request minus volatile params."""
+
+    def __init__(self, directory):
+        self.exact = {}
+        self.loose = {}
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            with open(path) as f:
+                fixture = json.load(f)
+            self.exact[os.path.basename(path)[:-5]] = fixture
+            self.loose[self._loose_key(fixture["method"], fixture["path"], fixture["query"])] = fixture
+        if not self.exact:
+            raise SystemExit(f"No fixtures found in {directory}")
+
+    @staticmethod
+    def _loose_key(method, path, query):
+        params = [(k, v) for k, v in sorted(parse_qsl(query, keep_blank_values=True)) if k not in VOLATILE_PARAMS]
+        return method, path, tuple(params)
+
+    def find(self, method, path, query):
+        return (self.exact.get(fixture_key(method, path, query))
+                or self.loose.get(self._loose_key(method, path, query)))
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data=None, fixtures=None, latency_ms=0, jitter_ms=0,
+                 rate_429=0.0, fail_rate=0.0, strava_limits=(100_000, 1_000_000), seed=7):
+        super().__init__(address, Handler)
+        self.data = data
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.fail_rate = fail_rate
+        self.strava_limits = strava_limits
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.strava_usage = [0, 0]
+        self.window = self._window()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @staticmethod
+    def _window():
+        return int(time.time() // 900)
+
+    def count_strava_request(self):
+        """Usage counters in Strava's 15-minute and daily windows, for the rate-limit headers."""
+        with self.lock:
+            if self._window() != self.window:
+                self.window = self._window()
+                self.strava_usage[0] = 0
+            self.strava_usage[0] += 1
+            self.strava_usage[1] += 1
+            return list(self.strava_usage)
+
+    def inject_fault(self):
+        """Sleep for the configured latency, then maybe return an injected error status."""
+        with self.lock:
+            delay = self.latency_ms + self.rng.uniform(0, self.jitter_ms)
+            roll = self.rng.random()
+        if delay:
+            time.sleep(delay / 1000)
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.fail_rate:
+            return 503
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == "/__stats":
+            with server.lock:
+                return self.send_json(200, dict(server.stats))
+
+        headers = {}
+        if url.path.startswith("/api/v3/"):
+            short, daily = server.count_strava_request()
+            headers["X-RateLimit-Limit"] = "{},{}".format(*server.strava_limits)
+            headers["X-RateLimit-Usage"] = f"{short},{daily}"
+            if short > server.strava_limits[0] or daily > server.strava_limits[1]:
+                return self.reply(url, 429, {"message": "Rate Limit Exceeded"}, headers)
+
+        status = server.inject_fault()
+        if status == 429:
+            headers["Retry-After"] = "1"
+            return self.reply(url, 429, {"message": "Rate Limit Exceeded"}, headers)
+        if status:
+            return self.reply(url, status, {"message": "Service Unavailable"}, headers)
+
+        # Token exchanges are never recorded, so both modes hand out a fixture token
+        if method == "POST" and url.path == "/oauth/token":
+            return self.reply(url, 200, fixture_token(), headers)
+
+        if server.fixtures is not None:
+            fixture = server.fixtures.find(method, url.path, url.query)
+            if fixture is None:
+                return self.reply(url, 404, {"message": "No recorded fixture", "path": self.path}, headers)
+            headers.update(fixture["headers"])
+            return self.reply(url, fixture["status"], fixture["body"], headers)
+
+        status, body = self.synthesize(method, url)
+        self.reply(url, status, body, headers)
+
+    def synthesize(self, method, url):
+        data = self.server.data
+        params = dict(parse_qsl(url.query))
+        if url.path == "/api/v3/athlete/activities":
+            return 200, data.list_activities(params)
+        match = STREAMS_PATH.match(url.path)
+        if match:
+            streams = data.streams(int(match.group(1)), params.get("keys", "").split(","))
+            return (200, streams) if streams is not None else (404, {"message": "Record Not Found"})
+        match = OURA_PATH.match(url.path)
+        if match:
+            return 200, data.oura(match.group(1), params)
+        if url.path == "/v1/archive":
+            return 200, data.weather(params)
+        return 404, {"message": "Not Found", "path": url.path}
+
+    def reply(self, url, status, body, headers):
+        with self.server.lock:
+            self.server.stats[f"{url.path.split('/')[1] or '/'} {status}"] += 1
+            self.server.stats["requests"] += 1
+        headers.setdefault("Content-Type", "application/json")
+        self.send_json(status, body, headers)
+
+    def send_json(self, status, body, headers=None):
+        payload = (body if isinstance(body, str) else json.dumps(body)).encode()
+        self.send_response(status)
+        for key, value in (headers or {"Content-Type": "application/json"}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_server(port=0, **kwargs):
+    """Start a FixtureServer on a background thread; returns the server (see `.base_url`)."""
+    server = FixtureServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url_env(base_url):
+    """Environment overrides that point every API client at `base_url`."""
+    return {"STRAVA_BASE_URL": base_url, "OURA_BASE_URL": base_url, "OPEN_METEO_BASE_URL": base_url}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--replay", metavar="DIR", help="Serve fixtures recorded with HTTP_RECORD_DIR")
+    mode.add_argument("--synthetic-years", type=float, default=1, help="Years of synthetic runs to serve")
+    parser.add_argument("--runs-per-week", type=float, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform extra latency on top")
+    parser.add_argument("--rate-429", type=float, default=0, help="Fraction of requests answered with 429")
+    parser.add_argument("--fail-rate", type=float, default=0, help="Fraction of requests answered with 503")
+    parser.add_argument("--strava-limits", default="100000,1000000", help="15-minute,daily Strava limits")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.replay:
+        source = {"fixtures": Fixtures(args.replay)}
+        print(f"📼 Replaying {len(source['fixtures'].exact)} fixtures from {args.replay}")
+    else:
+        source = {"data": SyntheticData(args.synthetic_years, args.runs_per_week, args.seed)}
+        print(f"🧪 Serving {len(source['data'].activities)} synthetic runs")
+
+    server = FixtureServer(
+        ("127.0.0.1", args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429, fail_rate=args.fail_rate, seed=args.seed,
+        strava_limits=tuple(int(x) for x in args.strava_limits.split(",")), **source,
+    )
+    for key, value in base_url_env(server.base_url).items():
+        print(f"export {key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(dict(server.stats), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 import os
-import requests
 import duckdb
 import pandas as pd
 from datetime import datetime, timedelta
 
+import http_client
 from pace_prediction import fetch_training_data, build_and_train_model, predict_pace
 
-con = duckdb.connect("running.duckdb")
+_con = None
+
+def db():
+    """The chat's DuckDB connection, opened on first use so importing the chat leaves the database alone."""
+    global _con
+    if _con is None:
+        _con = duckdb.connect("running.duckdb")
+    return _con
 
 def get_recent_runs(days=28):
     query = f"""
@@ -17,17 +24,17 @@ def get_recent_runs(days=28):
     WHERE r.start_date_local >= CURRENT_DATE - INTERVAL {days} DAY
     ORDER BY r.start_date_local DESC
     """
-    return con.execute(query).df()
+    return db().execute(query).df()
 
 def get_oura_sleep():
     try:
-        return con.execute("SELECT * FROM oura_sleep ORDER BY day DESC LIMIT 5").df()
+        return db().execute("SELECT * FROM oura_sleep ORDER BY day DESC LIMIT 5").df()
     except:
         return pd.DataFrame()
 
 def get_oura_readiness():
     try:
-        return con.execute("SELECT * FROM oura_readiness ORDER BY timestamp DESC LIMIT 7").df()
+        return db().execute("SELECT * FROM oura_readiness ORDER BY timestamp DESC LIMIT 7").df()
     except:
         return pd.DataFrame()
 
@@ -60,7 +67,7 @@ def summarize_oura(sleep_df, readiness_df):
     return "\n".join(lines)
 
 def get_predicted_paces_for_races():
-    df = fetch_training_data()
+    df = fetch_training_data(db())
     if df.empty:
         return "🚫 Not enough data to train prediction model."
 
@@ -142,7 +149,7 @@ def send_to_llm(user_message, session_history, session_id=None):
     }
 
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=30)
+        resp = http_client.post(url, headers=headers, json=payload)
         resp.raise_for_status()
         reply = resp.json()["choices"][0]["message"]["content"]
         print("Token usage:", resp.json().get("usage", {}))
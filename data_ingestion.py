@@ -2,281 +2,623 @@ import duckdb
 import time
 import os
 import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
-from stravalib.client import Client
-import polyline
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import argparse
+import threading
+import hashlib
+import json
+import re
+import asyncio
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+import stream_pyramid
+import route_cache
+import heat_grid
+import rollups
+import stream_features
+import run_classifier
+from weather_cache import (
+    ensure_weather_tables, plan_weather, settle_weather, fetch_hourly, store_hourly, REQUEST_DELAY
+)
 
 # Load .env
 load_dotenv()
 
-# Connect to DuckDB
-con = duckdb.connect("running.duckdb")
-
-# Create tables if not exist
-con.execute("""
-CREATE TABLE IF NOT EXISTS runs (
-    activity_id BIGINT PRIMARY KEY,
-    start_date_local TIMESTAMP,
-    run_name TEXT,
-    distance_km DOUBLE,
-    moving_time_min DOUBLE,
-    pace_min_per_km DOUBLE,
-    total_elevation_gain_m DOUBLE,
-    summary_polyline TEXT,
-    average_heartrate DOUBLE,
-    max_heartrate DOUBLE,
-    latitude DOUBLE, 
-    longitude DOUBLE, 
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
-
-con.execute("""
-CREATE TABLE IF NOT EXISTS run_streams (
-    activity_id BIGINT,
-    stream_index INT,
-    heartrate DOUBLE,
-    velocity_smooth DOUBLE,
-    time_sec INT,
-    distance_m DOUBLE
-)
-""")
-
-con.execute("""
-CREATE TABLE IF NOT EXISTS weather_by_run (
-    activity_id BIGINT PRIMARY KEY,
-    timestamp TEXT,
-    lat DOUBLE,
-    lon DOUBLE,
-    temp_c DOUBLE,
-    humidity_pct DOUBLE
-)
-""")
+# API hosts can be pointed at a local fixture server (benchmarks/fixture_server.py)
+DEFAULT_STRAVA_BASE_URL = "https://www.strava.com"
+STRAVA_BASE_URL = os.getenv("STRAVA_BASE_URL", DEFAULT_STRAVA_BASE_URL).rstrip("/")
+
+# Concurrent stream downloads; all DB writes go through the pipeline's single writer
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "4"))
+PIPELINE_QUEUE_SIZE = 64
+WRITE_BATCH_SIZE = 50
+# Re-list this much before the watermark: Strava's `after` is UTC, start_date_local is not
+WATERMARK_OVERLAP = timedelta(days=1)
+# Strava's maximum page size; full syncs checkpoint after every completed page
+LIST_PAGE_SIZE = 200
+FULL_SYNC_START = datetime(2000, 1, 1)
+FULL_SYNC_CHECKPOINT = "strava_full_sync"
+DATA_VERSION_KEY = "data_version"
+STREAM_TYPES = ["heartrate", "velocity_smooth", "time", "distance", "altitude", "cadence", "latlng"]
+
+DUCKDB_PATH = "running.duckdb"
+
+# Opened by init_db(), which the dashboard and the ingestion entry points call;
+# importing this module does not touch the database
+con = None
+_init_lock = threading.Lock()
+
+def drop_primary_key(table):
+    """Rebuild `table` without its PRIMARY KEY, if it was created with one."""
+    keyed = con.execute(
+        "SELECT COUNT(*) FROM duckdb_constraints() WHERE table_name = ? AND constraint_type = 'PRIMARY KEY'",
+        (table,)
+    ).fetchone()[0]
+    if not keyed:
+        return
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"ALTER TABLE {table} RENAME TO {table}_keyed")
+        con.execute(f"CREATE TABLE {table} AS SELECT * FROM {table}_keyed")
+        con.execute(f"DROP TABLE {table}_keyed")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    print(f"🔁 Rebuilt {table} without its primary key")
+
+def migrate_run_streams():
+    """Fold a legacy row-per-sample run_streams table into activity_streams."""
+    legacy = con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'run_streams'").fetchone()[0]
+    if not legacy:
+        return
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute("DELETE FROM activity_streams WHERE activity_id IN (SELECT activity_id FROM run_streams)")
+        con.execute("""
+            INSERT INTO activity_streams (
+                activity_id, sample_count, time_sec, distance_dm, velocity_mms, heartrate
+            )
+            SELECT
+                activity_id,
+                COUNT(*),
+                list(time_sec ORDER BY stream_index),
+                list(TRY_CAST(round(distance_m * 10) AS INTEGER) ORDER BY stream_index),
+                list(TRY_CAST(round(velocity_smooth * 1000) AS INTEGER) ORDER BY stream_index),
+                list(TRY_CAST(round(heartrate) AS SMALLINT) ORDER BY stream_index)
+            FROM run_streams
+            GROUP BY activity_id
+        """)
+        # Streams that were never recorded are NULL arrays, not arrays of NULLs
+        for col in ["distance_dm", "velocity_mms", "heartrate"]:
+            con.execute(f"UPDATE activity_streams SET {col} = NULL WHERE list_count({col}) = 0")
+        con.execute("DROP TABLE run_streams")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    print("🔁 Migrated run_streams to per-activity arrays")
 
+def ensure_schema():
+    """Create missing tables and apply the migrations."""
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS runs (
+        activity_id BIGINT PRIMARY KEY,
+        start_date_local TIMESTAMP,
+        run_name TEXT,
+        distance_km DOUBLE,
+        moving_time_min DOUBLE,
+        pace_min_per_km DOUBLE,
+        total_elevation_gain_m DOUBLE,
+        summary_polyline TEXT,
+        average_heartrate DOUBLE,
+        max_heartrate DOUBLE,
+        latitude DOUBLE, 
+        longitude DOUBLE, 
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # One row per activity. Samples are integer arrays at the precision Strava reports
+    # (distance/altitude in dm, velocity in mm/s, lat/lng in 1e-6 degrees), which
+    # DuckDB bit-packs (delta-FOR for the monotonic time/distance arrays).
+    # No PRIMARY KEY: on a file-backed table with list columns, DuckDB's index makes
+    # every insert slower as the table grows (~40 ms -> 200+ ms per run over 400 runs).
+    # save_streams replaces a run's row with DELETE + INSERT in one transaction instead.
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS activity_streams (
+        activity_id BIGINT,
+        sample_count INTEGER,
+        time_sec INTEGER[],
+        distance_dm INTEGER[],
+        velocity_mms INTEGER[],
+        heartrate SMALLINT[],
+        altitude_dm INTEGER[],
+        cadence SMALLINT[],
+        lat_e6 INTEGER[],
+        lng_e6 INTEGER[]
+    )
+    """)
+    drop_primary_key("activity_streams")
+    migrate_run_streams()
 
-def refresh_strava_token():
-    response = requests.post(
-        url="https://www.strava.com/oauth/token",
+    # Row-per-sample view over activity_streams, for the existing window queries.
+    # Not OR REPLACE: replacing a view while another connection (a dashboard page)
+    # has a transaction open makes the CHECKPOINT below fail
+    con.execute("""
+    CREATE VIEW IF NOT EXISTS run_streams AS
+    SELECT
+        activity_id,
+        UNNEST(range(sample_count))::INTEGER AS stream_index,
+        UNNEST(heartrate)::DOUBLE AS heartrate,
+        UNNEST(velocity_mms) / 1000 AS velocity_smooth,
+        UNNEST(time_sec) AS time_sec,
+        UNNEST(distance_dm) / 10 AS distance_m
+    FROM activity_streams
+    """)
+
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS weather_by_run (
+        activity_id BIGINT PRIMARY KEY,
+        timestamp TEXT,
+        lat DOUBLE,
+        lon DOUBLE,
+        temp_c DOUBLE,
+        humidity_pct DOUBLE
+    )
+    """)
+
+    ensure_weather_tables(con)
+    stream_pyramid.ensure_pyramid_table(con)
+    drop_primary_key("stream_pyramid")
+    route_cache.ensure_route_table(con)
+    heat_grid.ensure_heat_table(con)
+    rollups.ensure_rollup_table(con)
+    stream_features.ensure_feature_table(con)
+    run_classifier.ensure_run_types_table(con)
+
+    con.execute("ALTER TABLE runs ADD COLUMN IF NOT EXISTS fingerprint TEXT")
+
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Flush schema changes out of the WAL: DuckDB cannot replay an ADD COLUMN on a table
+    # with CURRENT_TIMESTAMP defaults, so a sync killed mid-way would leave the file unopenable
+    con.execute("CHECKPOINT")
+
+def backfill_routes():
+    """Decode the polylines of runs saved before run_routes existed."""
+    missing = con.execute("""
+        SELECT activity_id, summary_polyline FROM runs
+        WHERE summary_polyline IS NOT NULL AND summary_polyline != ''
+          AND activity_id NOT IN (SELECT activity_id FROM run_routes)
+    """).fetchdf()
+    if missing.empty:
+        return
+    routes = route_cache.route_frame(missing["activity_id"], missing["summary_polyline"])
+    route_cache.save_routes(con, missing["activity_id"], routes)
+    print(f"🔁 Decoded routes for {len(routes)} stored runs")
+
+def backfill_heat_cells():
+    """Grid cells for routes decoded before heat_cells existed."""
+    missing = [row[0] for row in con.execute("""
+        SELECT activity_id FROM run_routes
+        WHERE activity_id NOT IN (SELECT DISTINCT activity_id FROM heat_cells)
+    """).fetchall()]
+    if not missing:
+        return
+    heat_grid.save_cells(con, missing)
+    print(f"🔁 Binned heatmap cells for {len(missing)} stored routes")
+
+def backfill_rollups():
+    """Rebuild run_rollups when it does not account for every stored run (first start, or an interrupted save)."""
+    if rollups.in_sync(con):
+        return
+    rollups.rebuild(con)
+    print("🔁 Rebuilt day/week/month rollups")
+
+def get_sync_state(key):
+    row = con.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def clear_sync_state(key):
+    con.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+
+def set_sync_state(key, value):
+    con.execute("""
+        INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (key, str(value)))
+
+
+def refresh_strava_token(refresh_token=None):
+    response = http_client.post(
+        url=f"{STRAVA_BASE_URL}/oauth/token",
         data={
             "client_id": os.getenv("STRAVA_CLIENT_ID"),
             "client_secret": os.getenv("STRAVA_CLIENT_SECRET"),
             "grant_type": "refresh_token",
-            "refresh_token": os.getenv("STRAVA_REFRESH_TOKEN"),
+            "refresh_token": refresh_token or os.getenv("STRAVA_REFRESH_TOKEN"),
         }
     )
     response.raise_for_status()
     tokens = response.json()
     return tokens["access_token"], tokens["refresh_token"], tokens["expires_at"]
 
+def get_strava_token():
+    """Cached Strava access token; only refreshed when it is about to expire."""
+    def refresh(cached):
+        # Strava may rotate the refresh token, so prefer the latest one we were given
+        try:
+            tokens = refresh_strava_token(cached and cached.get("refresh_token"))
+        except requests.HTTPError:
+            if not cached:
+                raise
+            tokens = refresh_strava_token()
+        print("🔑 Refreshed Strava access token")
+        return dict(zip(["access_token", "refresh_token", "expires_at"], tokens))
+
+    token = http_client.cached_token("strava", refresh)
+    return token["access_token"], token["refresh_token"], token["expires_at"]
+
 def get_activity_streams(client, activity_id):
     try:
         streams = client.get_activity_streams(
             activity_id,
-            types=["heartrate", "velocity_smooth", "time", "distance"],
+            types=STREAM_TYPES,
             resolution='high'
         )
         data = {}
-        for stream_type in ["heartrate", "velocity_smooth", "time", "distance"]:
+        for stream_type in STREAM_TYPES:
             data[stream_type] = streams[stream_type].data if stream_type in streams else None
         return data
     except Exception as e:
         print(f"❌ Error fetching streams for {activity_id}: {e}")
         return None
     
-def fetch_weather(lat, lon, timestamp):
-    date_str = timestamp.split("T")[0]
-    url = (
-        f"https://archive-api.open-meteo.com/v1/archive?"
-        f"latitude={lat}&longitude={lon}"
-        f"&start_date={date_str}&end_date={date_str}"
-        f"&hourly=temperature_2m,relative_humidity_2m"
-        f"&timezone=auto"
+def activity_to_row(activity):
+    start_date_local = activity.start_date_local.replace(tzinfo=None)
+    distance_km = round(float(activity.distance) / 1000, 2)
+    moving_time_min = round(float(activity.moving_time) / 60, 2)
+    pace_min_per_km = round(moving_time_min / distance_km, 2) if distance_km > 0 else None
+    elevation = round(activity.total_elevation_gain or 0, 2)
+
+    data = {
+        "activity_id": activity.id,
+        "run_name": activity.name,
+        "start_date_local": start_date_local,
+        "distance_km": distance_km,
+        "moving_time_min": moving_time_min,
+        "pace_min_per_km": pace_min_per_km,
+        "total_elevation_gain_m": elevation,
+        "summary_polyline": activity.map.summary_polyline if activity.map else None,
+        "average_heartrate": activity.average_heartrate,
+        "max_heartrate": activity.max_heartrate,
+    }
+    data["fingerprint"] = activity_fingerprint(data)
+    return data
+
+def activity_fingerprint(data):
+    """Hash of the fields that matter downstream; unchanged hash = nothing to re-sync."""
+    parts = [data["run_name"], data["distance_km"], data["moving_time_min"], data["summary_polyline"]]
+    return hashlib.sha1("|".join("" if p is None else str(p) for p in parts).encode()).hexdigest()
+
+RUN_COLUMNS = [
+    "activity_id", "start_date_local", "run_name", "distance_km",
+    "moving_time_min", "pace_min_per_km", "total_elevation_gain_m",
+    "summary_polyline", "average_heartrate", "max_heartrate",
+    "latitude", "longitude", "fingerprint"
+]
+
+def save_runs(rows):
+    """Merge a batch of run rows into `runs` in one transaction. Returns (new, updated)."""
+    if not rows:
+        return 0, 0
+
+    staged = pd.DataFrame(rows, columns=RUN_COLUMNS).drop_duplicates("activity_id", keep="last")
+    # Polylines are decoded here, once, for the whole batch; latitude/longitude is the start point
+    routes = route_cache.route_frame(staged["activity_id"], staged["summary_polyline"])
+    start = routes.set_index("activity_id")
+    staged["latitude"] = staged["activity_id"].map(start["start_lat"])
+    staged["longitude"] = staged["activity_id"].map(start["start_lng"])
+    columns = ", ".join(RUN_COLUMNS)
+    updates = ",\n            ".join(f"{col} = excluded.{col}" for col in RUN_COLUMNS[1:])
+
+    con.register("staged_runs", staged)
+    try:
+        con.execute("BEGIN TRANSACTION")
+        # Periods these runs were in before the save, in case a start time changed
+        previous_starts = [row[0] for row in con.execute(
+            "SELECT start_date_local FROM runs WHERE activity_id IN (SELECT activity_id FROM staged_runs)"
+        ).fetchall()]
+        count_updated = len(previous_starts)
+        con.execute(f"""
+            INSERT INTO runs ({columns})
+            SELECT {columns} FROM staged_runs
+            ON CONFLICT (activity_id) DO UPDATE SET
+            {updates},
+            updated_at = now()
+        """)
+        route_cache.save_routes(con, staged["activity_id"], routes)
+        heat_grid.save_cells(con, staged["activity_id"])
+        rollups.refresh_periods(con, previous_starts + staged["start_date_local"].tolist())
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister("staged_runs")
+
+    return len(staged) - count_updated, count_updated
+
+# activity_streams column -> (Strava stream, latlng component, scale, element type)
+STREAM_COLUMNS = {
+    "time_sec": ("time", None, 1, "INTEGER"),
+    "distance_dm": ("distance", None, 10, "INTEGER"),
+    "velocity_mms": ("velocity_smooth", None, 1000, "INTEGER"),
+    "heartrate": ("heartrate", None, 1, "SMALLINT"),
+    "altitude_dm": ("altitude", None, 10, "INTEGER"),
+    "cadence": ("cadence", None, 1, "SMALLINT"),
+    "lat_e6": ("latlng", 0, 1e6, "INTEGER"),
+    "lng_e6": ("latlng", 1, 1e6, "INTEGER"),
+}
+
+def streams_to_frame(streams):
+    """Scaled, rounded samples per activity_streams column; streams Strava did not send are left out."""
+    present = [streams[k] for k in STREAM_TYPES if streams.get(k)]
+    n = min(len(values) for values in present)
+
+    columns = {"sample_index": np.arange(n, dtype=np.int32)}
+    for col, (key, component, scale, _) in STREAM_COLUMNS.items():
+        values = streams.get(key)
+        if not values:
+            continue
+        samples = np.asarray(values[:n], dtype=np.float64)
+        if component is not None:
+            samples = samples.reshape(-1, 2)[:, component]
+        columns[col] = np.rint(samples * scale)
+    return pd.DataFrame(columns)
+
+def pyramid_levels(frame):
+    """Downsampled chart series for one run, or [] without heart rate and velocity (see stream_pyramid)."""
+    if "heartrate" not in frame.columns or "velocity_mms" not in frame.columns:
+        return []
+    return stream_pyramid.build_levels(frame["time_sec"], frame["heartrate"], frame["velocity_mms"] / 1000)
+
+def prepare_streams(streams):
+    """Everything save_streams writes for one run. CPU only, so the pipeline runs it off the DB thread."""
+    frame = streams_to_frame(streams)
+    return frame, pyramid_levels(frame)
+
+def save_streams(activity_id, streams):
+    if not streams or not streams["time"]:
+        return
+    store_streams(activity_id, *prepare_streams(streams))
+
+def store_streams(activity_id, frame, levels):
+    # DuckDB scans the NumPy-backed frame and packs each column into one array
+    arrays = ", ".join(
+        f"list(TRY_CAST({col} AS {col_type}) ORDER BY sample_index)" if col in frame.columns else "NULL"
+        for col, (_, _, _, col_type) in STREAM_COLUMNS.items()
     )
+    # Samples, their chart pyramid and stream features land together, in one commit
+    con.register("staged_streams", frame)
+    con.execute("BEGIN TRANSACTION")
     try:
-        resp = requests.get(url, timeout=10)
-        data = resp.json()
-        target_hour = timestamp[:13]  # e.g. '2025-09-20T07'
-        for i, t in enumerate(data['hourly']['time']):
-            if t.startswith(target_hour):
-                return {
-                    "temp_c": data['hourly']['temperature_2m'][i],
-                    "humidity_pct": data['hourly']['relative_humidity_2m'][i],
-                }
-    except Exception as e:
-        print(f"⚠️ Weather fetch failed for {timestamp} @ {lat},{lon}: {e}")
-    return None
+        con.execute("DELETE FROM activity_streams WHERE activity_id = ?", (activity_id,))
+        con.execute(f"""
+            INSERT INTO activity_streams (activity_id, sample_count, {", ".join(STREAM_COLUMNS)})
+            SELECT ?, COUNT(*), {arrays}
+            FROM staged_streams
+        """, (activity_id,))
+        save_pyramid(activity_id, levels)
+        stream_features.refresh_features(con, [activity_id])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister("staged_streams")
 
-def sync_activities(limit=None, full_sync=False):
-    access_token, refresh_token, token_expires_at = refresh_strava_token()
+def save_pyramid(activity_id, levels):
+    con.execute("DELETE FROM stream_pyramid WHERE activity_id = ?", (activity_id,))
+    if not levels:
+        return
+    staged = pd.DataFrame({
+        "level": np.concatenate([np.full(len(d), level, dtype=np.int32) for level, d, _, _ in levels]),
+        "point": np.concatenate([np.arange(len(d), dtype=np.int32) for _, d, _, _ in levels]),
+        "distance_km": np.concatenate([d for _, d, _, _ in levels]),
+        "pace_smooth": np.concatenate([p for _, _, p, _ in levels]),
+        "hr_smooth": np.concatenate([h for _, _, _, h in levels]),
+    })
+    if staged.empty:
+        # Nothing plottable survives the filters; empty levels stop the backfill retrying it
+        con.executemany("INSERT INTO stream_pyramid VALUES (?, ?, [], [], [])",
+                        [(activity_id, level) for level, *_ in levels])
+        return
+    con.register("staged_pyramid", staged)
+    try:
+        con.execute("""
+            INSERT INTO stream_pyramid (activity_id, level, distance_m, pace_ds, hr_dbpm)
+            SELECT ?, level,
+                   list(round(distance_km * 1000)::INTEGER ORDER BY point),
+                   list(round(pace_smooth * 600)::SMALLINT ORDER BY point),
+                   list(round(hr_smooth * 10)::SMALLINT ORDER BY point)
+            FROM staged_pyramid
+            GROUP BY level
+        """, (activity_id,))
+    finally:
+        con.unregister("staged_pyramid")
 
-    client = Client(access_token=access_token)
-    client.refresh_token = refresh_token
-    client.token_expires_at = token_expires_at
-    client.token_expires = True  # Force token refresh
+def backfill_pyramids():
+    """Build stream_pyramid rows for runs stored before it existed."""
+    missing = con.execute("""
+        SELECT activity_id, time_sec, heartrate, velocity_mms
+        FROM activity_streams s
+        WHERE heartrate IS NOT NULL AND velocity_mms IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM stream_pyramid p WHERE p.activity_id = s.activity_id)
+    """).fetchall()
+    for activity_id, time_sec, heartrate, velocity_mms in missing:
+        frame = pd.DataFrame({
+            "time_sec": np.asarray(time_sec, dtype=np.float64),
+            "heartrate": np.asarray(heartrate, dtype=np.float64),
+            "velocity_mms": np.asarray(velocity_mms, dtype=np.float64),
+        })
+        save_pyramid(activity_id, pyramid_levels(frame))
+    if missing:
+        print(f"🔁 Built chart pyramids for {len(missing)} stored runs")
 
-    count_new = 0
-    count_updated = 0
+def load_fingerprints():
+    return dict(con.execute("SELECT activity_id, fingerprint FROM runs").fetchall())
 
-    activities = list(client.get_activities(limit=limit))
-    print(f"Total activities pulled: {len(activities)}")
+def mark_synced(activity_id, fingerprint):
+    con.execute("UPDATE runs SET fingerprint = ? WHERE activity_id = ?", (fingerprint, activity_id))
 
-    for activity in activities:
-        if activity.type != "Run":
-            continue
+def load_checkpoint(restart=False):
+    """The saved full-sync checkpoint, or a fresh one."""
+    value = get_sync_state(FULL_SYNC_CHECKPOINT)
+    if value and not restart:
+        return json.loads(value)
+    return {"started_at": datetime.now(timezone.utc).isoformat(), "after": None, "pages": 0, "listed": 0, "synced": 0}
 
-        start_date_local = activity.start_date_local.replace(tzinfo=None)
-        distance_km = round(float(activity.distance) / 1000, 2)
-        moving_time_min = round(float(activity.moving_time) / 60, 2)
-        pace_min_per_km = round(moving_time_min / distance_km, 2) if distance_km > 0 else None
-        elevation = round(activity.total_elevation_gain or 0, 2)
+def get_sync_progress():
+    """Progress of a running or interrupted full-history sync, or None. Safe to call from other threads."""
+    with con.cursor() as cur:
+        row = cur.execute("SELECT value FROM sync_state WHERE key = ?", (FULL_SYNC_CHECKPOINT,)).fetchone()
+    return json.loads(row[0]) if row else None
 
-        # Decode polyline for lat/lon
-        if activity.map and activity.map.summary_polyline:
-            try:
-                first_point = polyline.decode(activity.map.summary_polyline)[0]
-                lat, lon = first_point[0], first_point[1]
-            except:
-                lat = lon = None
-        else:
-            lat = lon = None
-
-        data = {
-            "activity_id": activity.id,
-            "run_name": activity.name,
-            "start_date_local": start_date_local,
-            "distance_km": distance_km,
-            "moving_time_min": moving_time_min,
-            "pace_min_per_km": pace_min_per_km,
-            "total_elevation_gain_m": elevation,
-            "summary_polyline": activity.map.summary_polyline if activity.map else None,
-            "average_heartrate": activity.average_heartrate,
-            "max_heartrate": activity.max_heartrate,
-            "latitude": lat,
-            "longitude": lon
-        }
+def compute_data_version(cur=None):
+    """Short hash of max(updated_at) and row counts across everything the dashboard reads."""
+    row = (cur or con).execute("""
+        SELECT
+            (SELECT max(updated_at) FROM runs),
+            (SELECT count(*) FROM runs),
+            (SELECT count(fingerprint) FROM runs),
+            (SELECT count(*) FROM activity_streams),
+            (SELECT count(temp_c) FROM weather_by_run),
+            (SELECT count(*) FROM run_routes),
+            (SELECT count(*) FROM heat_cells),
+            (SELECT max(computed_at) FROM run_stream_features)
+    """).fetchone()
+    return hashlib.sha1("|".join(str(v) for v in row).encode()).hexdigest()[:16]
 
-        exists = con.execute("SELECT COUNT(*) FROM runs WHERE activity_id = ?", (data["activity_id"],)).fetchone()[0]
-
-        if exists:
-            con.execute("""
-                UPDATE runs SET
-                    start_date_local = ?,
-                    run_name = ?,
-                    distance_km = ?,
-                    moving_time_min = ?,
-                    pace_min_per_km = ?,
-                    total_elevation_gain_m = ?,
-                    summary_polyline = ?,
-                    average_heartrate = ?,
-                    max_heartrate = ?,
-                    latitude = ?,
-                    longitude = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE activity_id = ?
-            """, (
-                data["start_date_local"],
-                data["run_name"],
-                data["distance_km"],
-                data["moving_time_min"],
-                data["pace_min_per_km"],
-                data["total_elevation_gain_m"],
-                data["summary_polyline"],
-                data["average_heartrate"],
-                data["max_heartrate"],
-                data["latitude"],
-                data["longitude"],
-                data["activity_id"]
-            ))
-            count_updated += 1
-        else:
-            con.execute("""
-                INSERT INTO runs (
-                    activity_id, start_date_local, run_name, distance_km,
-                    moving_time_min, pace_min_per_km, total_elevation_gain_m,
-                    summary_polyline, average_heartrate, max_heartrate,
-                    latitude, longitude
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data["activity_id"],
-                data["start_date_local"],
-                data["run_name"],
-                data["distance_km"],
-                data["moving_time_min"],
-                data["pace_min_per_km"],
-                data["total_elevation_gain_m"],
-                data["summary_polyline"],
-                data["average_heartrate"],
-                data["max_heartrate"],
-                data["latitude"],
-                data["longitude"]
-            ))
-            count_new += 1
-
-        # Insert stream data
-        streams = get_activity_streams(client, activity.id)
-        if streams and streams["time"]:
-            zipped = zip(
-                range(len(streams["time"])),
-                streams["heartrate"] or [None] * len(streams["time"]),
-                streams["velocity_smooth"] or [None] * len(streams["time"]),
-                streams["time"],
-                streams["distance"] or [None] * len(streams["time"])
-            )
-            con.execute("DELETE FROM run_streams WHERE activity_id = ?", (activity.id,))
-            con.executemany("""
-                INSERT INTO run_streams (
-                    activity_id, stream_index, heartrate,
-                    velocity_smooth, time_sec, distance_m
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, [(activity.id, i, hr, v, t, d) for i, hr, v, t, d in zipped])
-
-        # Weather ingestion
-                # Weather ingestion
-        if lat is not None and lon is not None and start_date_local:
-            timestamp = start_date_local.isoformat()
-            existing = con.execute(
-                "SELECT temp_c, humidity_pct FROM weather_by_run WHERE activity_id = ?",
-                (activity.id,)
-            ).fetchone()
-
-            if not existing:
-                # No weather yet — fetch and insert if available
-                weather = fetch_weather(lat, lon, timestamp)
-                if weather and weather["temp_c"] is not None and weather["humidity_pct"] is not None:
-                    con.execute("""
-                        INSERT INTO weather_by_run 
-                        (activity_id, timestamp, lat, lon, temp_c, humidity_pct)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
-                        activity.id, timestamp, lat, lon,
-                        weather["temp_c"], weather["humidity_pct"]
-                    ))
-                    print(f"✅ Weather added for {activity.id}")
-                else:
-                    print(f"❌ Weather not available for {activity.id} — will retry later.")
-                time.sleep(0.5)
-
-            elif existing[0] is None or existing[1] is None:
-                # Weather row exists but has nulls — retry
-                weather = fetch_weather(lat, lon, timestamp)
-                if weather and weather["temp_c"] is not None and weather["humidity_pct"] is not None:
-                    con.execute("""
-                        UPDATE weather_by_run
-                        SET temp_c = ?, humidity_pct = ?
-                        WHERE activity_id = ?
-                    """, (weather["temp_c"], weather["humidity_pct"], activity.id))
-                    print(f"🔁 Weather updated for {activity.id}")
-                    time.sleep(0.5)
-                else:
-                    print(f"⚠️ Still no weather for {activity.id}, keeping NULLs.")
-            else:
-                print(f"⏭️ Weather already exists and complete for {activity.id}")
-        
-    print(f"✅ Sync complete! New: {count_new}, Updated: {count_updated}")
+def write_data_version():
+    set_sync_state(DATA_VERSION_KEY, compute_data_version())
+
+def get_data_version():
+    """Token the last sync wrote; caches keyed on it refresh after every sync. Safe to call from other threads."""
+    with con.cursor() as cur:
+        row = cur.execute("SELECT value FROM sync_state WHERE key = ?", (DATA_VERSION_KEY,)).fetchone()
+        # A database no sync has stamped yet
+        return row[0] if row else compute_data_version(cur)
 
+def backfill_features():
+    """Features for runs that have none, or were computed by an older FEATURE_VERSION."""
+    refreshed = stream_features.refresh_stale_features(con)
+    if refreshed:
+        print(f"🔁 Recomputed stream features for {refreshed} runs (v{stream_features.FEATURE_VERSION})")
+        write_data_version()
+
+RUN_TYPES_KEY = "run_types"
+
+def update_run_types(refit=False):
+    """Bring run_types up to date with the data version and the saved classifier (refit first if asked).
+
+    The only place run_types is written: once per data version, after a sync
+    or at startup, so dashboard sessions only ever read it.
+    """
+    last = json.loads(get_sync_state(RUN_TYPES_KEY) or "{}")
+    # Nothing synced since the last write and its model is still current: done,
+    # without loading the classifier (and scikit-learn)
+    if (not refit and last.get("version") == get_data_version()
+            and last.get("classifier") == run_classifier.CLASSIFIER_VERSION
+            and run_classifier.saved_model_current(last.get("model"))):
+        return
+    df = stream_features.runs_with_features(con)
+    if len(df) < 5:
+        return
+    classifier = run_classifier.fitted_classifier(df, refit=refit)
+    stamp = {"version": get_data_version(), "classifier": run_classifier.CLASSIFIER_VERSION,
+             "model": classifier.fitted_at.isoformat()}
+    if last == stamp:
+        return
+    con.execute("BEGIN TRANSACTION")
+    try:
+        written = run_classifier.update_run_types(con, df, classifier, reclassify_all=last.get("model") != stamp["model"])
+        set_sync_state(RUN_TYPES_KEY, json.dumps(stamp))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    print(f"🏷️ Run types: {written} of {len(df)} runs changed")
+
+def init_db(path=DUCKDB_PATH):
+    """Open the database and bring it up to date: schema, migrations, backfills and run types.
+
+    Safe to call again; only the first call in a process does anything. Returns the connection.
+    """
+    global con
+    # Dashboard sessions start on their own threads
+    with _init_lock:
+        if con is not None:
+            return con
+        con = duckdb.connect(path)
+        try:
+            ensure_schema()
+            backfill_routes()
+            backfill_heat_cells()
+            backfill_rollups()
+            backfill_pyramids()
+            backfill_features()
+        except Exception:
+            # Let the next call try again
+            con.close()
+            con = None
+            raise
+        try:
+            update_run_types()
+        except Exception as e:
+            print(f"⚠️ Run-type classification failed: {e}")
+    return con
+
+def full_sync_fraction(progress):
+    """Rough completion of a full sync: how far its cursor has moved from the first run towards now."""
+    if not progress or not progress.get("first") or not progress.get("after"):
+        return 0.0
+    first = datetime.fromisoformat(progress["first"])
+    through = datetime.fromisoformat(progress["after"])
+    span = (datetime.now(timezone.utc) - first).total_seconds()
+    return min(1.0, max(0.0, (through - first).total_seconds() / span)) if span > 0 else 1.0
+
+def strava_client():
+    # stravalib takes over a second to import; only syncs need it
+    from stravalib.client import Client
+    from strava_rate_limit import StravaRateLimiter
+
+    access_token, refresh_token, token_expires_at = get_strava_token()
+    client = Client(
+        access_token=access_token,
+        refresh_token=refresh_token,
+        token_expires=token_expires_at,
+        rate_limiter=StravaRateLimiter(),
+        requests_session=http_client.session_for(STRAVA_BASE_URL),
+    )
+    if STRAVA_BASE_URL != DEFAULT_STRAVA_BASE_URL:
+        # stravalib always resolves relative paths against https://www.strava.com/api/v3
+        client.protocol.resolve_url = lambda url: (
+            url if url.startswith("http") else f"{STRAVA_BASE_URL}/api/v3/{url.strip('/')}"
+        )
+    return client
 
 import os
 import requests
@@ -284,86 +626,620 @@ import pandas as pd
 from datetime import datetime, timedelta
 import duckdb
 
-# Connect to your local DuckDB
-con = duckdb.connect("running.duckdb")
+OURA_BASE_URL = os.getenv("OURA_BASE_URL", "https://api.ouraring.com").rstrip("/")
+OURA_API = f"{OURA_BASE_URL}/v2/usercollection"
+NEXT_TOKEN = re.compile(r'"next_token"\s*:\s*"([^"]+)"')
 
-def ingest_oura_data(start_date=None, end_date=None):
-    token = os.getenv("OURA_API_TOKEN")
-    if not token:
-        print("❌ OURA_API_TOKEN not found.")
-        return
+# Explicit table schemas per Oura endpoint. Dotted paths are flattened into
+# columns (contributors.hrv_balance -> contributors_hrv_balance); nested objects
+# typed JSON are kept as-is. `timestamp` falls back to `day` where Oura sends none.
+OURA_ENDPOINTS = {
+    "readiness": {
+        "path": "daily_readiness",
+        "columns": {
+            "id": "TEXT",
+            "day": "DATE",
+            "timestamp": "TIMESTAMPTZ",
+            "score": "INTEGER",
+            "temperature_deviation": "DOUBLE",
+            "temperature_trend_deviation": "DOUBLE",
+            "contributors": "JSON",
+            "contributors.activity_balance": "INTEGER",
+            "contributors.body_temperature": "INTEGER",
+            "contributors.hrv_balance": "INTEGER",
+            "contributors.previous_day_activity": "INTEGER",
+            "contributors.previous_night": "INTEGER",
+            "contributors.recovery_index": "INTEGER",
+            "contributors.resting_heart_rate": "INTEGER",
+            "contributors.sleep_balance": "INTEGER",
+        },
+    },
+    "sleep": {
+        "path": "sleep",
+        "columns": {
+            "id": "TEXT",
+            "day": "DATE",
+            "timestamp": "TIMESTAMPTZ",
+            "bedtime_start": "TIMESTAMPTZ",
+            "bedtime_end": "TIMESTAMPTZ",
+            "type": "TEXT",
+            "period": "INTEGER",
+            "total_sleep_duration": "INTEGER",
+            "time_in_bed": "INTEGER",
+            "awake_time": "INTEGER",
+            "deep_sleep_duration": "INTEGER",
+            "light_sleep_duration": "INTEGER",
+            "rem_sleep_duration": "INTEGER",
+            "latency": "INTEGER",
+            "efficiency": "INTEGER",
+            "restless_periods": "INTEGER",
+            "average_breath": "DOUBLE",
+            "average_heart_rate": "DOUBLE",
+            "average_hrv": "DOUBLE",
+            "lowest_heart_rate": "INTEGER",
+            "readiness_score_delta": "DOUBLE",
+            "sleep_score_delta": "DOUBLE",
+            "readiness": "JSON",
+            "readiness.score": "INTEGER",
+            "heart_rate": "JSON",
+            "hrv": "JSON",
+        },
+    },
+    "activity": {
+        "path": "daily_activity",
+        "columns": {
+            "id": "TEXT",
+            "day": "DATE",
+            "timestamp": "TIMESTAMPTZ",
+            "score": "INTEGER",
+            "steps": "INTEGER",
+            "active_calories": "INTEGER",
+            "total_calories": "INTEGER",
+            "target_calories": "INTEGER",
+            "equivalent_walking_distance": "INTEGER",
+            "high_activity_time": "INTEGER",
+            "medium_activity_time": "INTEGER",
+            "low_activity_time": "INTEGER",
+            "sedentary_time": "INTEGER",
+            "resting_time": "INTEGER",
+            "non_wear_time": "INTEGER",
+            "inactivity_alerts": "INTEGER",
+            "average_met_minutes": "DOUBLE",
+            "contributors": "JSON",
+            "contributors.meet_daily_targets": "INTEGER",
+            "contributors.move_every_hour": "INTEGER",
+            "contributors.recovery_time": "INTEGER",
+            "contributors.stay_active": "INTEGER",
+            "contributors.training_frequency": "INTEGER",
+            "contributors.training_volume": "INTEGER",
+        },
+    },
+}
 
-    headers = {"Authorization": f"Bearer {token}"}
-    today = datetime.utcnow().date()
-    if not start_date:
-        start_date = (today - timedelta(days=7)).isoformat()
-    if not end_date:
-        end_date = today.isoformat()
-
-    endpoints = {
-        "readiness": "https://api.ouraring.com/v2/usercollection/daily_readiness",
-        "sleep": "https://api.ouraring.com/v2/usercollection/sleep",
-        "activity": "https://api.ouraring.com/v2/usercollection/daily_activity"
+def oura_columns(name):
+    """Table column -> (JSON path, DuckDB type) for an Oura endpoint."""
+    return {
+        path.replace(".", "_"): (path, col_type)
+        for path, col_type in OURA_ENDPOINTS[name]["columns"].items()
     }
 
-    for name, url in endpoints.items():
-        print(f"📡 Fetching Oura {name} data...")
-        try:
-            resp = requests.get(url, headers=headers, params={
-                "start_date": start_date,
-                "end_date": end_date
-            })
-            resp.raise_for_status()
-            data = resp.json().get("data", [])
-            if not data:
-                print(f"⚠️ No {name} data returned.")
+def normalize_oura(name, pages):
+    """Flatten and type raw Oura response pages in one vectorized DuckDB pass.
+
+    `pages` are the response bodies as text; the JSON never round-trips through
+    Python objects.
+    """
+    columns = oura_columns(name)
+
+    # from_json structure mirroring the declared paths
+    structure = {path: col_type for path, col_type in columns.values() if "." not in path}
+    selects = []
+    for col, (path, col_type) in columns.items():
+        root, _, rest = path.partition(".")
+        if not rest:
+            expr = f'r."{root}"'
+        elif structure.get(root) == "JSON":
+            # Parent is stored as raw JSON too: read the child from it
+            expr = f"TRY_CAST(json_extract_string(r.\"{root}\", '$.{rest}') AS {col_type})"
+        else:
+            node = structure.setdefault(root, {})
+            *parents, leaf = rest.split(".")
+            for parent in parents:
+                node = node.setdefault(parent, {})
+            node[leaf] = col_type
+            expr = "r." + ".".join(f'"{part}"' for part in path.split("."))
+        if col == "timestamp" and "day" in columns:
+            expr = f'COALESCE({expr}, CAST(r."day" AS TIMESTAMPTZ))'
+        selects.append(f'{expr} AS "{col}"')
+
+    return con.execute(f"""
+        SELECT {', '.join(selects)}
+        FROM (
+            SELECT unnest(from_json(json_extract(page, '$.data'), ?)) AS r
+            FROM unnest(?::VARCHAR[]) AS p(page)
+        )
+    """, [json.dumps([structure]), list(pages)]).fetchdf()
+
+def ensure_oura_table(name):
+    """Create oura_{name} with its declared schema, migrating a legacy CREATE-AS table if present."""
+    table = f"oura_{name}"
+    columns = {col: col_type for col, (_, col_type) in oura_columns(name).items()}
+
+    exists = con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", (table,)).fetchone()[0]
+    keyed = con.execute(
+        "SELECT COUNT(*) FROM duckdb_constraints() WHERE table_name = ? AND constraint_type = 'PRIMARY KEY'",
+        (table,)
+    ).fetchone()[0]
+    legacy = bool(exists and not keyed)
+    if legacy:
+        con.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+
+    column_defs = ",\n        ".join(f"{col} {col_type}" for col, col_type in columns.items())
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        {column_defs},
+        ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id)
+    )
+    """)
+    for col, col_type in columns.items():
+        con.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} {col_type}")
+
+    if legacy:
+        legacy_cols = {row[0] for row in con.execute(f"DESCRIBE {table}_legacy").fetchall()}
+        common = [col for col in columns if col in legacy_cols]
+        if "id" in common:
+            casts = ", ".join(f"TRY_CAST({col} AS {columns[col]})" for col in common)
+            con.execute(f"""
+                INSERT INTO {table} ({", ".join(common)})
+                SELECT {casts} FROM {table}_legacy WHERE id IS NOT NULL
+                ON CONFLICT (id) DO NOTHING
+            """)
+            print(f"🔁 Migrated {table} to a keyed table")
+        con.execute(f"DROP TABLE {table}_legacy")
+    # Same WAL replay issue as the schema changes in ensure_schema()
+    con.execute("CHECKPOINT")
+
+def upsert_oura(name, df):
+    """Merge a normalized frame into oura_{name} by record id, casting to the declared schema."""
+    table = f"oura_{name}"
+    types = {col: col_type for col, (_, col_type) in oura_columns(name).items()}
+    columns = [col for col in types if col in df.columns]
+    casts = ", ".join(f"TRY_CAST({col} AS {types[col]})" for col in columns)
+    updates = ", ".join(f"{col} = excluded.{col}" for col in columns if col != "id")
+
+    con.register("staged_oura", df[columns].drop_duplicates("id", keep="last"))
+    try:
+        con.execute(f"""
+            INSERT INTO {table} ({", ".join(columns)})
+            SELECT {casts} FROM staged_oura
+            ON CONFLICT (id) DO UPDATE SET {updates}, ingested_at = now()
+        """)
+    finally:
+        con.unregister("staged_oura")
+
+def fetch_oura(path, headers, start_date, end_date):
+    """Fetch every page of an Oura collection endpoint as raw response bodies."""
+    pages = []
+    params = {"start_date": start_date, "end_date": end_date}
+    while True:
+        resp = http_client.get(f"{OURA_API}/{path}", headers=headers, params=params)
+        resp.raise_for_status()
+        pages.append(resp.text)
+        # Pages stay raw text; only the cursor is read (this runs off the DB thread)
+        match = NEXT_TOKEN.search(resp.text)
+        next_token = match and match.group(1)
+        if not next_token:
+            return pages
+        params = {"start_date": start_date, "end_date": end_date, "next_token": next_token}
+
+def oura_since(name, start_date=None):
+    """Make sure oura_{name} exists and return the first day to fetch."""
+    ensure_oura_table(name)
+    if start_date:
+        return start_date
+    # Resume from the newest stored day (re-fetched, Oura revises it during the day)
+    last_day = con.execute(f"SELECT MAX(day) FROM oura_{name}").fetchone()[0]
+    return (last_day or datetime.utcnow().date() - timedelta(days=7)).isoformat()
+
+def store_oura(name, pages):
+    df = normalize_oura(name, pages)
+    if df.empty:
+        print(f"⚠️ No {name} data returned.")
+        return
+    upsert_oura(name, df)
+    total = con.execute(f"SELECT COUNT(*) FROM oura_{name}").fetchone()[0]
+    print(f"✅ Ingested Oura {name}: {len(df)} rows ({total} stored)")
+
+
+class IngestPipeline:
+    """Strava, weather and Oura ingestion as one asyncio pipeline.
+
+    Activity listing feeds bounded queues for the stream and weather stages
+    while Oura is fetched alongside. Blocking HTTP calls run in worker threads;
+    every DuckDB call runs on one dedicated thread, fed by a batching writer,
+    so the database file only ever has a single writer.
+    """
+
+    def __init__(self, on_progress=None):
+        self.loop = asyncio.get_running_loop()
+        self.db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="duckdb-writer")
+        self.write_q = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.stats = {"new": 0, "updated": 0, "unchanged": 0}
+        # Changed runs whose streams and/or weather are still outstanding
+        self.pending = {}
+        # Start times of runs left for the next sync; the watermark stays before them
+        self.failed = []
+        self.pages = deque()
+        self.checkpoint = None
+        self.progress = {"pages": 0, "listed": 0, "synced": 0}
+        self.on_progress = on_progress
+
+    def in_db(self, fn, *args):
+        return self.loop.run_in_executor(self.db, fn, *args)
+
+    async def write(self, fn, *args):
+        """Queue fn(*args) for the writer; returns a future that resolves once it is written, or fails with its error."""
+        written = self.loop.create_future()
+        # Most writes are not awaited and the writer logs failures, so retrieve the
+        # exception here to keep asyncio from warning about it
+        written.add_done_callback(lambda f: f.cancelled() or f.exception())
+        await self.write_q.put((fn, args, written))
+        return written
+
+    async def barrier(self):
+        """Wait until everything queued so far has been written."""
+        done = self.loop.create_future()
+        await self.write_q.put(done)
+        await done
+
+    async def writer(self):
+        runs = []
+
+        async def flush():
+            if not runs:
+                return
+            batch = runs[:]
+            runs.clear()
+            try:
+                new, updated = await self.in_db(save_runs, batch)
+                self.stats["new"] += new
+                self.stats["updated"] += updated
+            except Exception as e:
+                print(f"❌ Failed to save {len(batch)} runs: {e}")
+                for row in batch:
+                    self.fail(row)
+
+        while True:
+            # Run rows are merged in batches: whenever the queue runs dry or the batch is full
+            if self.write_q.empty():
+                await flush()
+            item = await self.write_q.get()
+            if item is None:
+                await flush()
+                return
+            if isinstance(item, dict):
+                runs.append(item)
+                if len(runs) >= WRITE_BATCH_SIZE:
+                    await flush()
                 continue
 
-            df = pd.DataFrame(data)
+            await flush()
+            if isinstance(item, asyncio.Future):
+                item.set_result(None)
+                continue
+            fn, args, written = item
+            try:
+                await self.in_db(fn, *args)
+            except Exception as e:
+                print(f"❌ Write failed ({fn.__name__}): {e}")
+                written.set_exception(e)
+            else:
+                written.set_result(None)
+
+    async def strava(self, limit=None, full_sync=False, after=None, before=None, restart=False):
+        client = await asyncio.to_thread(strava_client)
+
+        watermark = await self.in_db(get_sync_state, "strava_watermark")
+        if full_sync:
+            self.checkpoint = await self.in_db(load_checkpoint, restart)
+            self.progress = self.checkpoint
+            if self.checkpoint["pages"]:
+                print(f"⏯️ Resuming full sync after {self.checkpoint['after'][:10]} "
+                      f"({self.checkpoint['pages']} pages, {self.checkpoint['synced']} runs already done)")
+        elif after is None and watermark:
+            # Incremental syncs only list what started after the stored watermark
+            after = datetime.fromisoformat(watermark) - WATERMARK_OVERLAP
+            print(f"⏩ Listing activities after {after:%Y-%m-%d %H:%M}")
+        known = await self.in_db(load_fingerprints)
+
+        stream_q = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        weather_q = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        workers = [
+            asyncio.create_task(self.stream_worker(client, stream_q))
+            for _ in range(STREAM_WORKERS)
+        ]
+        weather = asyncio.create_task(self.weather(weather_q))
+
+        listed = 0
+        seen = set()
+        starts = []
+        batch = []
+        exhausted = False
+        try:
+            async for activities in self.list_pages(client, limit, after, before):
+                page = {"cursor": max(a.start_date for a in activities), "open": set(), "listed": False}
+                self.pages.append(page)
+                self.progress.setdefault("first", min(a.start_date for a in activities).isoformat())
+                for activity in activities:
+                    # Full-sync pages overlap by a second at their boundary
+                    if activity.id in seen:
+                        continue
+                    seen.add(activity.id)
+                    listed += 1
+                    self.progress["listed"] += 1
+                    if activity.type != "Run":
+                        continue
+                    data = activity_to_row(activity)
+                    starts.append(data["start_date_local"])
+
+                    # Unchanged fingerprint: no row write, streams or weather
+                    if known.get(data["activity_id"]) == data["fingerprint"]:
+                        self.stats["unchanged"] += 1
+                        continue
+
+                    # The fingerprint is only stored once streams and weather are done
+                    self.pending[data["activity_id"]] = {
+                        "fingerprint": data["fingerprint"], "todo": {"streams", "weather"}, "page": page,
+                    }
+                    page["open"].add(data["activity_id"])
+                    await self.write_q.put({**data, "fingerprint": None})
+                    await stream_q.put(data)
+                    batch.append(data["activity_id"])
+                    if len(batch) >= WRITE_BATCH_SIZE:
+                        await weather_q.put(batch)
+                        batch = []
+                page["listed"] = True
+                await self.advance_checkpoint()
+                self.report()
+            exhausted = True
+        finally:
+            # The last (possibly empty) batch also picks up queued weather retries
+            await weather_q.put(batch)
+            await weather_q.put(None)
+            for _ in workers:
+                await stream_q.put(None)
+            await asyncio.gather(*workers, weather)
+
+        # Advance the watermark, but never past a run that still needs its row or streams
+        if starts:
+            new_watermark = max(starts)
+            if self.failed:
+                new_watermark = min(new_watermark, min(self.failed))
+            if not watermark or new_watermark > datetime.fromisoformat(watermark):
+                await self.write(set_sync_state, "strava_watermark", new_watermark.isoformat())
+
+        if self.checkpoint is not None:
+            if exhausted and not self.pending:
+                await self.write(clear_sync_state, FULL_SYNC_CHECKPOINT)
+                print("🏁 Full history sync complete")
+            else:
+                print(f"⏸️ Full sync checkpoint kept at {(self.checkpoint['after'] or 'the start')[:10]}; "
+                      f"run it again to resume")
+
+        await self.barrier()
+        print(f"Total activities pulled: {listed}")
+        print(
+            f"✅ Sync complete! New: {self.stats['new']}, Updated: {self.stats['updated']}, "
+            f"Unchanged: {self.stats['unchanged']}"
+        )
+
+    async def list_pages(self, client, limit, after, before):
+        """Activity listing, one API page at a time."""
+        if self.checkpoint is None:
+            activities = iter(client.get_activities(limit=limit, after=after, before=before))
+            while page := await asyncio.to_thread(list, islice(activities, LIST_PAGE_SIZE)):
+                yield page
+                # A short page means the listing ran out, and stravalib's iterator
+                # resets itself at the end: asking it again would start over
+                if len(page) < LIST_PAGE_SIZE:
+                    return
+            return
+
+        # Full syncs walk forward from the checkpoint: with `after`, Strava lists oldest first
+        cursor = self.checkpoint["after"]
+        cursor = datetime.fromisoformat(cursor) - timedelta(seconds=1) if cursor else FULL_SYNC_START
+        while True:
+            page = await asyncio.to_thread(
+                list, client.get_activities(after=cursor, before=before, limit=LIST_PAGE_SIZE)
+            )
+            if not page:
+                return
+            yield page
+            if len(page) < LIST_PAGE_SIZE:
+                return
+            cursor = max(a.start_date for a in page) - timedelta(seconds=1)
+
+    async def complete(self, activity_id, part):
+        """Mark streams or weather done; a run with both done gets its fingerprint."""
+        entry = self.pending.get(activity_id)
+        if entry is None or entry.get("failed"):
+            return
+        entry["todo"].discard(part)
+        if entry["todo"]:
+            return
+        del self.pending[activity_id]
+        await self.write(mark_synced, activity_id, entry["fingerprint"])
+        entry["page"]["open"].discard(activity_id)
+        self.progress["synced"] += 1
+        await self.advance_checkpoint()
+        self.report()
 
-            # Add fallback timestamp columns
-            if "timestamp" not in df.columns:
-                if "day" in df.columns:
-                    df["timestamp"] = pd.to_datetime(df["day"])
-                elif "bedtime_start" in df.columns:
-                    df["timestamp"] = pd.to_datetime(df["bedtime_start"])
+    async def advance_checkpoint(self):
+        """Move the full-sync cursor past every leading page whose runs are all done."""
+        moved = False
+        while self.pages and self.pages[0]["listed"] and not self.pages[0]["open"]:
+            page = self.pages.popleft()
+            if self.checkpoint is not None:
+                self.checkpoint["after"] = page["cursor"].isoformat()
+                self.checkpoint["pages"] += 1
+                moved = True
+        if moved:
+            # Queued behind the fingerprints it covers, so it is never ahead of them on disk
+            await self.write(set_sync_state, FULL_SYNC_CHECKPOINT, json.dumps(self.checkpoint))
 
-            # Normalize columns
-            if name == "sleep" and "duration" in df.columns:
-                df["total_sleep_duration"] = df["duration"] / 60  # seconds → minutes
+    def fail(self, data):
+        """Leave a run for the next sync: never fingerprinted, its page kept open (so the
+        full-sync checkpoint stays before it) and the watermark held back to its start."""
+        entry = self.pending.get(data["activity_id"])
+        if entry is not None:
+            entry["failed"] = True
+        self.failed.append(data["start_date_local"])
 
-            # Ensure datetime format
-            for col in df.columns:
-                if df[col].dtype == object and df[col].astype(str).str.match(r"^\d{4}-\d{2}-\d{2}").any():
-                    df[col] = pd.to_datetime(df[col], errors="ignore")
+    def report(self):
+        if self.on_progress:
+            self.on_progress({**self.progress, "pending": len(self.pending)})
 
-            # Convert large digit fields to string (DuckDB can't handle 20+ digits as int)
-            for col in df.columns:
-                if df[col].astype(str).str.fullmatch(r"\d{20,}").any():
-                    df[col] = df[col].astype(str)
+    async def stream_worker(self, client, stream_q):
+        while (data := await stream_q.get()) is not None:
+            activity_id = data["activity_id"]
+            try:
+                streams = await asyncio.to_thread(get_activity_streams, client, activity_id)
+                if streams is None:
+                    # Left unfingerprinted (and its page open), so the next sync retries it
+                    self.fail(data)
+                    continue
+                # Manual and treadmill entries have no samples: nothing to store, but done
+                if streams.get("time"):
+                    frame, levels = await asyncio.to_thread(prepare_streams, streams)
+                    # Only done once the samples are on disk
+                    await (await self.write(store_streams, activity_id, frame, levels))
+                await self.complete(activity_id, "streams")
+            except Exception as e:
+                # One bad run must not take the worker (and the sync) down with it
+                print(f"❌ Error storing streams for {activity_id}: {e}")
+                self.fail(data)
+
+    async def weather(self, weather_q):
+        """Weather ingestion: cached per grid cell, batched per date span, retries queued."""
+        resolved = queued = requests_made = 0
+        while (activity_ids := await weather_q.get()) is not None:
+            # The runs must be in the table before the cache can be consulted
+            await self.barrier()
+            remaining, plan, cached = await self.in_db(plan_weather, con, activity_ids)
+            resolved += cached
+            for i, (cell_lat, cell_lon, start_date, end_date) in enumerate(plan):
+                if i:
+                    await asyncio.sleep(REQUEST_DELAY)
+                requests_made += 1
+                try:
+                    frame = await asyncio.to_thread(fetch_hourly, cell_lat, cell_lon, start_date, end_date)
+                except Exception as e:
+                    print(f"⚠️ Weather fetch failed for cell {cell_lat},{cell_lon} {start_date}→{end_date}: {e}")
+                    continue
+                await self.write(store_hourly, con, frame)
+            await self.barrier()
+            fetched, still_missing = await self.in_db(settle_weather, con, remaining)
+            resolved += fetched
+            queued += still_missing
+            # Runs still missing weather sit in weather_queue, which retries them on its own
+            for activity_id in activity_ids:
+                await self.complete(activity_id, "weather")
 
-            # Store into DuckDB
-            con.execute(f"DROP TABLE IF EXISTS oura_{name}")
-            con.execute(f"CREATE TABLE oura_{name} AS SELECT * FROM df")
+        if resolved or queued:
+            print(f"🌤️ Weather: {resolved} resolved ({requests_made} API requests), {queued} queued for retry")
 
-            print(f"✅ Ingested Oura {name}: {len(df)} rows")
+    async def oura(self, start_date=None, end_date=None):
+        token = os.getenv("OURA_API_TOKEN")
+        if not token:
+            print("❌ OURA_API_TOKEN not found.")
+            return
+        headers = {"Authorization": f"Bearer {token}"}
+        end_date = end_date or datetime.utcnow().date().isoformat()
+        await asyncio.gather(*(
+            self.oura_endpoint(name, headers, start_date, end_date) for name in OURA_ENDPOINTS
+        ))
 
+    async def oura_endpoint(self, name, headers, start_date, end_date):
+        since = await self.in_db(oura_since, name, start_date)
+        print(f"📡 Fetching Oura {name} data from {since}...")
+        try:
+            pages = await asyncio.to_thread(fetch_oura, OURA_ENDPOINTS[name]["path"], headers, since, end_date)
         except Exception as e:
             print(f"❌ Error fetching {name}: {e}")
+            return
+        await self.write(store_oura, name, pages)
+
+    async def run(self, strava=None, oura=None):
+        writer = asyncio.create_task(self.writer())
+        stages = []
+        if strava is not None:
+            stages.append(self.strava(**strava))
+        if oura is not None:
+            stages.append(self.oura(**oura))
+        try:
+            results = await asyncio.gather(*stages, return_exceptions=True)
+        finally:
+            await self.write_q.put(None)
+            await writer
+            self.db.shutdown()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+
+def run_ingestion(strava=None, oura=None, on_progress=None):
+    init_db()
+
+    async def main():
+        await IngestPipeline(on_progress).run(strava=strava, oura=oura)
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(main())
+    finally:
+        # Even a failed sync may have written rows; the dashboard's caches key on this
+        write_data_version()
+        try:
+            update_run_types()
+        except Exception as e:
+            print(f"⚠️ Run-type classification failed: {e}")
+    print(f"⏱️ Ingestion finished in {time.perf_counter() - started:.1f}s")
+
+def sync_activities(limit=None, full_sync=False, after=None, before=None, restart=False, on_progress=None):
+    """Strava runs, streams and weather. Full syncs resume from their checkpoint unless `restart`."""
+    run_ingestion(
+        strava=dict(limit=limit, full_sync=full_sync, after=after, before=before, restart=restart),
+        on_progress=on_progress,
+    )
+
+def ingest_oura_data(start_date=None, end_date=None):
+    run_ingestion(oura=dict(start_date=start_date, end_date=end_date))
+
+def sync_all(limit=None, full_sync=False, after=None, before=None, oura_start_date=None, oura_end_date=None,
+             restart=False, on_progress=None):
+    """Strava (runs, streams, weather) and Oura in one concurrent run."""
+    run_ingestion(
+        strava=dict(limit=limit, full_sync=full_sync, after=after, before=before, restart=restart),
+        oura=dict(start_date=oura_start_date, end_date=oura_end_date),
+        on_progress=on_progress,
+    )
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--full", action="store_true", help="Pull full history")
+    parser.add_argument("--restart", action="store_true", help="Ignore a saved full-sync checkpoint")
     parser.add_argument("--start_date", type=str, help="Start date (YYYY-MM-DD)")
     parser.add_argument("--end_date", type=str, help="End date (YYYY-MM-DD)")
+    parser.add_argument("--refit", action="store_true", help="Refit the run-type classifier instead of syncing")
     args = parser.parse_args()
 
-    if args.full:
-        print("🔁 Running full Strava sync...")
-        sync_activities(limit=None, full_sync=True)
-
-        print("🔁 Running full Oura backfill...")
-        ingest_oura_data(start_date=args.start_date, end_date=args.end_date)
+    if args.refit:
+        init_db()
+        update_run_types(refit=True)
+    elif args.full:
+        print("🔁 Running full Strava sync + Oura backfill...")
+        sync_all(limit=None, full_sync=True, oura_start_date=args.start_date, oura_end_date=args.end_date,
+                 restart=args.restart)
     else:
-        sync_activities(limit=30)
-        ingest_oura_data()
\ No newline at end of file
+        sync_all(limit=30)
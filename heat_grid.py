@@ -0,0 +1,69 @@
+"""Route points binned into weighted grid cells for the heatmap.
+
+Each run's decoded route (run_routes) is counted into CELL_DEG cells in
+`heat_cells` when the run is saved. The dashboard sums those per cell at the
+finest of LEVELS that fits in MAX_CELLS, so the heatmap payload stays bounded
+however many runs there are.
+"""
+import numpy as np
+
+# Finest cell, in degrees (~55 m of latitude)
+CELL_DEG = 0.0005
+# Cells merged per side at each zoom level, finest first (~55 m, ~220 m, ~1.1 km, ~5.5 km)
+LEVELS = [1, 4, 20, 100]
+MAX_CELLS = 5_000
+# Earliest run the dashboard shows, as in run_table.START_DATE
+START_DATE = "2020-01-01"
+# Runs shown on the map, filtered in SQL rather than passed in as an ID list
+SHOWN_RUNS = "activity_id IN (SELECT activity_id FROM runs WHERE start_date_local >= ?)"
+
+
+def ensure_heat_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS heat_cells (
+        activity_id BIGINT,
+        cell_lat INTEGER,
+        cell_lng INTEGER,
+        weight INTEGER
+    )
+    """)
+
+
+def save_cells(con, activity_ids):
+    """Recount the cells of these runs from their run_routes points."""
+    ids = [int(a) for a in activity_ids]
+    con.execute("DELETE FROM heat_cells WHERE activity_id IN (SELECT UNNEST(?))", (ids,))
+    con.execute("""
+        INSERT INTO heat_cells
+        SELECT activity_id, floor(lat / ?)::INTEGER, floor(lng / ?)::INTEGER, COUNT(*)::INTEGER
+        FROM (
+            SELECT activity_id, UNNEST(lat) AS lat, UNNEST(lng) AS lng
+            FROM run_routes
+            WHERE activity_id IN (SELECT UNNEST(?))
+        )
+        GROUP BY ALL
+    """, (CELL_DEG, CELL_DEG, ids))
+
+
+def load_cells(con, since=START_DATE, max_cells=MAX_CELLS):
+    """[lat, lng, weight] cell centres for runs started since `since`, at the finest level with at most max_cells cells."""
+    counts = con.execute(f"""
+        SELECT {", ".join(f"COUNT(DISTINCT (floor(cell_lat / {f}), floor(cell_lng / {f})))" for f in LEVELS)}
+        FROM heat_cells
+        WHERE {SHOWN_RUNS}
+    """, (since,)).fetchone()
+    # The coarsest level can still overflow (runs on every continent); keep its heaviest cells
+    factor = next((f for f, n in zip(LEVELS, counts) if n <= max_cells), LEVELS[-1])
+    cells = con.execute(f"""
+        SELECT (floor(cell_lat / ?) + 0.5) * ? AS lat,
+               (floor(cell_lng / ?) + 0.5) * ? AS lng,
+               SUM(weight) AS weight
+        FROM heat_cells
+        WHERE {SHOWN_RUNS}
+        GROUP BY 1, 2
+        ORDER BY weight DESC
+        LIMIT ?
+    """, (factor, factor * CELL_DEG, factor, factor * CELL_DEG, since, max_cells)).fetchnumpy()
+    return np.column_stack([
+        cells["lat"].round(5), cells["lng"].round(5), cells["weight"].astype(np.float64),
+    ]).tolist()
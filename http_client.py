@@ -0,0 +1,140 @@
+"""Shared HTTP layer for the external APIs (Strava, Oura, Open-Meteo, Groq).
+
+One keep-alive session per host with a bounded connection pool, default
+timeouts, and jittered exponential retries on 429/5xx that honour Retry-After.
+Access tokens are cached on disk and only refreshed close to `expires_at`.
+With HTTP_RECORD_DIR set, every response is also saved as a fixture that
+benchmarks/fixture_server.py can replay offline.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+BACKOFF_FACTOR = 0.5
+BACKOFF_JITTER = 0.5
+BACKOFF_MAX = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_SIZE = 8
+
+TOKEN_CACHE_PATH = os.getenv("TOKEN_CACHE_PATH", ".tokens.json")
+TOKEN_REFRESH_MARGIN = 300  # seconds before expires_at
+
+RECORD_DIR = os.getenv("HTTP_RECORD_DIR")
+# Token exchanges carry credentials and are never written to fixtures
+RECORD_SKIP_PATHS = ("/oauth/",)
+RECORD_HEADERS = ("Content-Type", "Retry-After", "X-RateLimit-Limit", "X-RateLimit-Usage",
+                  "X-ReadRateLimit-Limit", "X-ReadRateLimit-Usage")
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies the default (connect, read) timeout unless one is given."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+def fixture_key(method, path, query=""):
+    """Stable file name for a request: method, path and sorted query parameters."""
+    params = "&".join(f"{k}={v}" for k, v in sorted(parse_qsl(query, keep_blank_values=True)))
+    return hashlib.sha1(f"{method.upper()} {path}?{params}".encode()).hexdigest()
+
+
+def _record(response, *args, **kwargs):
+    """Response hook: save the exchange under RECORD_DIR."""
+    url = urlsplit(response.url)
+    if any(p in url.path for p in RECORD_SKIP_PATHS):
+        return
+    method = response.request.method
+    fixture = {
+        "method": method,
+        "path": url.path,
+        "query": url.query,
+        "status": response.status_code,
+        "headers": {k: response.headers[k] for k in RECORD_HEADERS if k in response.headers},
+        "body": response.text,
+    }
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    with open(os.path.join(RECORD_DIR, f"{fixture_key(method, url.path, url.query)}.json"), "w") as f:
+        json.dump(fixture, f)
+
+
+def _build_session():
+    retry = Retry(
+        total=MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,  # token refresh and LLM calls are POSTs
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_jitter=BACKOFF_JITTER,
+        backoff_max=BACKOFF_MAX,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = TimeoutSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if RECORD_DIR:
+        session.hooks["response"].append(_record)
+    return session
+
+
+def session_for(url):
+    """The pooled session for the host of `url`."""
+    host = urlsplit(url).netloc
+    with _lock:
+        if host not in _sessions:
+            _sessions[host] = _build_session()
+        return _sessions[host]
+
+
+def get(url, **kwargs):
+    return session_for(url).get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return session_for(url).post(url, **kwargs)
+
+
+def _load_tokens():
+    try:
+        with open(TOKEN_CACHE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def cached_token(name, refresh):
+    """Return the cached token `name`, calling `refresh(cached)` only when it is near expiry.
+
+    `refresh` receives the previous token dict (or None) and must return a dict
+    with at least `access_token` and `expires_at` (epoch seconds).
+    """
+    with _lock:
+        tokens = _load_tokens()
+    token = tokens.get(name)
+    if token and token.get("expires_at", 0) - TOKEN_REFRESH_MARGIN > time.time():
+        return token
+
+    token = refresh(token)
+    with _lock:
+        tokens = _load_tokens()
+        tokens[name] = token
+        tmp_path = f"{TOKEN_CACHE_PATH}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, TOKEN_CACHE_PATH)
+    return token
@@ -1,15 +1,9 @@
 # pace_prediction_model.py
 
-import duckdb
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
 
-# Connect to DuckDB
-con = duckdb.connect("running.duckdb")
-
-def fetch_training_data():
+def fetch_training_data(con):
     query = """
         SELECT 
             r.activity_id,
@@ -33,6 +27,10 @@ def fetch_training_data():
     return df
 
 def build_and_train_model(df):
+    # Imported here: the chat (and so the dashboard) imports this module on every start
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+
     feature_cols = [
         "distance_km",
         "average_heartrate",
@@ -69,7 +67,9 @@ def predict_pace(model, distance_km, hr=None, elev=None, temp=None, humid=None,
     return round(prediction, 2)
 
 if __name__ == "__main__":
-    df = fetch_training_data()
+    from data_ingestion import init_db
+
+    df = fetch_training_data(init_db())
     model = build_and_train_model(df)
 
     # Example: predict pace for a 21.1km half marathon
@@ -1,22 +1,16 @@
 import streamlit as st
-import altair as alt
 import duckdb
 import pandas as pd
-import polyline
-import folium
+import numpy as np
 from streamlit.components.v1 import html
 from datetime import timedelta
 from chat_window import render_chat
+from stream_pyramid import chart_series, pick_level
+from data_ingestion import init_db
 
 from dotenv import load_dotenv
-from openai import OpenAI
-import os
 
 load_dotenv()
-client = OpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
-)
 
 
 # Set page config
@@ -67,40 +61,52 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def get_streaming_data(con, run_id):
-    query = f"""
-        SELECT time_sec, heartrate, velocity_smooth
-        FROM run_streams
-        WHERE activity_id = {run_id}
-        ORDER BY time_sec
-    """
-    df_stream = con.execute(query).fetchdf()
-
-    df_stream["pace"] = 1000 / (df_stream["velocity_smooth"] * 60)  # Convert m/s to min/km
-    df_stream = df_stream[(df_stream["pace"] < 20) & (df_stream["pace"] > 2)]  # Filter noisy data
-    df_stream = df_stream[(df_stream["heartrate"] > 60) & (df_stream["heartrate"] < 220)]
-    return df_stream
+# The chart spans the page like the route map below it
+CHART_WIDTH_PX = 1000
+
+def get_streaming_data(con, run_id, width_px=CHART_WIDTH_PX):
+    """Smoothed pace and HR by distance, downsampled to suit a chart `width_px` wide."""
+    level = pick_level(width_px)
+    row = None
+    if level is not None:
+        row = con.execute("""
+            SELECT distance_m, pace_ds, hr_dbpm
+            FROM stream_pyramid
+            WHERE activity_id = ? AND level = ?
+        """, (run_id, level)).fetchone()
+        if row is not None:
+            # Stored as m, 0.1 s/km and 0.1 bpm
+            distance_m, pace_ds, hr_dbpm = row
+            row = (np.asarray(distance_m) / 1000, np.asarray(pace_ds) / 600, np.asarray(hr_dbpm) / 10)
+
+    if row is None:
+        # Wider than the largest level, or not built yet: smooth the full-resolution arrays
+        row = con.execute("""
+            SELECT time_sec, heartrate, velocity_mms
+            FROM activity_streams
+            WHERE activity_id = ?
+        """, (run_id,)).fetchone()
+        time_sec, heartrate, velocity_mms = row if row else ([], None, None)
+
+        def samples(values, scale=1):
+            if values is None:
+                return np.full(len(time_sec), np.nan)
+            return np.asarray(values, dtype=np.float64) / scale
+
+        row = chart_series(samples(time_sec), samples(heartrate), samples(velocity_mms, 1000))
+
+    distance_km, pace_smooth, hr_smooth = row
+    return pd.DataFrame({
+        "distance_km": np.asarray(distance_km, dtype=np.float64),
+        "pace_smooth": np.asarray(pace_smooth, dtype=np.float64),
+        "hr_smooth": np.asarray(hr_smooth, dtype=np.float64),
+    })
 
 def plot_strava_style_chart(df_stream):
-    if df_stream.empty or "velocity_smooth" not in df_stream or "heartrate" not in df_stream:
+    if df_stream.empty:
         st.warning("⚠️ No streaming pace or heart rate data found.")
         return
-
-    df_stream = df_stream.copy()
-    df_stream = df_stream.sort_values("time_sec")
-
-    # Compute cumulative distance (km) from velocity and time
-    df_stream["delta_time"] = df_stream["time_sec"].diff().fillna(0)
-    df_stream["delta_dist_m"] = df_stream["velocity_smooth"] * df_stream["delta_time"]
-    df_stream["distance_km"] = df_stream["delta_dist_m"].cumsum() / 1000
-
-    # Convert velocity to pace in min/km
-    df_stream["pace"] = 1000 / (df_stream["velocity_smooth"] * 60)
-    df_stream = df_stream[(df_stream["pace"] > 3) & (df_stream["pace"] < 12)]  # filter outliers
-
-    # Smooth both pace and heart rate
-    df_stream["pace_smooth"] = df_stream["pace"].rolling(window=7, min_periods=1).mean()
-    df_stream["hr_smooth"] = df_stream["heartrate"].rolling(window=7, min_periods=1).mean()
+    import altair as alt
 
     # 🎽 Pace chart (top)
     pace_chart = alt.Chart(df_stream).mark_line(color="steelblue").encode(
@@ -119,20 +125,8 @@ def plot_strava_style_chart(df_stream):
     # 🧱 Stack vertically
     st.altair_chart(alt.vconcat(pace_chart, hr_chart).resolve_scale(y='independent'), use_container_width=True)
 
-    if df_stream.empty or 'velocity_smooth' not in df_stream or 'heartrate' not in df_stream:
-        st.warning("No streaming data available for chart.")
-        return
-
-    # Compute derived metrics
-    df_stream = df_stream.copy()
-    df_stream = df_stream.sort_values("time_sec")
-    df_stream["distance_km"] = (df_stream["velocity_smooth"].fillna(0) * df_stream["time_sec"]).cumsum() / 1000
-    df_stream["pace"] = 1000 / (df_stream["velocity_smooth"] * 60)
-    df_stream = df_stream[(df_stream["pace"] > 3) & (df_stream["pace"] < 12)]  # remove spikes
-
-    # Optional smoothing with rolling average
-    df_stream["pace_smooth"] = df_stream["pace"].rolling(window=5, min_periods=1).mean()
-    df_stream["hr_smooth"] = df_stream["heartrate"].rolling(window=5, min_periods=1).mean()
+# Schema and migrations, in case a run link is opened before the dashboard
+init_db()
 
 # Connect to DuckDB
 con = duckdb.connect("running.duckdb")
@@ -196,25 +190,42 @@ if not df_stream.empty:
     plot_strava_style_chart(df_stream)
 
 
-# Route Map using OpenStreetMap + auto-centering
-if run["summary_polyline"]:
-    try:
-        points = polyline.decode(run["summary_polyline"])
-        m = folium.Map(
-            location=[0, 0],  # Placeholder until we set bounds
-            zoom_start=14,
-            tiles="OpenStreetMap"
-        )
-        folium.PolyLine(points, color="blue", weight=4).add_to(m)
-
-        # Auto-center based on route bounds
-        m.fit_bounds([min(points), max(points)])
-
-        html(m.get_root().render(), height=500, width=1000)
-    except Exception as e:
-        st.error(f"Error rendering map: {e}")
-else:
-    st.warning("No GPS route data available for this run.")
+# Route Map using OpenStreetMap + auto-centering, from the route decoded at ingest.
+# The rendered HTML only depends on the route, so it is cached per run and
+# re-rendered when a sync updates the run; the most recently opened runs are kept.
+MAP_CACHE_ENTRIES = 64
+
+@st.cache_data(show_spinner=False, max_entries=MAP_CACHE_ENTRIES)
+def render_route_map(run_id, updated_at):
+    """Folium HTML of the run's route, or None if it has no GPS route."""
+    route = con.execute(
+        "SELECT lat, lng, min_lat, min_lng, max_lat, max_lng FROM run_routes WHERE activity_id = ?",
+        (run_id,)
+    ).fetchone()
+    if not route:
+        return None
+    lat, lng, min_lat, min_lng, max_lat, max_lng = route
+    import folium
+
+    m = folium.Map(
+        location=[0, 0],  # Placeholder until we set bounds
+        zoom_start=14,
+        tiles="OpenStreetMap"
+    )
+    folium.PolyLine(list(zip(lat, lng)), color="blue", weight=4).add_to(m)
+
+    # Auto-center based on route bounds
+    m.fit_bounds([[min_lat, min_lng], [max_lat, max_lng]])
+    return m.get_root().render()
+
+try:
+    route_html = render_route_map(int(run_id), run["updated_at"])
+    if route_html:
+        html(route_html, height=500, width=1000)
+    else:
+        st.warning("No GPS route data available for this run.")
+except Exception as e:
+    st.error(f"Error rendering map: {e}")
 
 # Build a concise summary of the run
 run_summary = {
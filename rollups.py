@@ -0,0 +1,84 @@
+"""Day, week and month totals of runs, for the dashboard's trend charts.
+
+`run_rollups` holds one row per period with the distance, run count, mean
+pace and mean heart rate of the runs that started in it. Saving runs
+recomputes only the periods those runs fall in (before and after the save),
+so the charts read a few hundred rows instead of grouping every run.
+"""
+import pandas as pd
+
+# Periods as DuckDB date_trunc parts; weeks start on Monday
+PERIODS = ["day", "week", "month"]
+
+
+def ensure_rollup_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS run_rollups (
+        period TEXT,
+        period_start DATE,
+        distance_km DOUBLE,
+        run_count INTEGER,
+        mean_pace DOUBLE,
+        mean_hr DOUBLE,
+        PRIMARY KEY (period, period_start)
+    )
+    """)
+
+
+def _aggregate(where):
+    """Rows for run_rollups from the runs matching `where` (which can use `period`)."""
+    return f"""
+        SELECT p.period, date_trunc(p.period, r.start_date_local)::DATE AS period_start,
+               SUM(r.distance_km), COUNT(*)::INTEGER, AVG(r.pace_min_per_km), AVG(r.average_heartrate)
+        FROM runs r, (SELECT UNNEST(?) AS period) p
+        WHERE r.start_date_local IS NOT NULL AND {where}
+        GROUP BY ALL
+    """
+
+
+def refresh_periods(con, start_dates):
+    """Recompute the periods the given run start times fall in."""
+    days = pd.DataFrame({"day": pd.to_datetime(pd.Series(list(start_dates)), errors="coerce")}).dropna()
+    if days.empty:
+        return
+    con.register("touched_days", days.drop_duplicates())
+    try:
+        touched = """
+            SELECT DISTINCT p.period, date_trunc(p.period, d.day)::DATE AS period_start
+            FROM touched_days d, (SELECT UNNEST(?) AS period) p
+        """
+        con.execute(f"""
+            DELETE FROM run_rollups
+            WHERE (period, period_start) IN (SELECT (period, period_start) FROM ({touched}))
+        """, (PERIODS,))
+        con.execute(f"""
+            INSERT INTO run_rollups
+            {_aggregate(f"(p.period, date_trunc(p.period, r.start_date_local)::DATE) IN (SELECT (period, period_start) FROM ({touched}))")}
+        """, (PERIODS, PERIODS))
+    finally:
+        con.unregister("touched_days")
+
+
+def rebuild(con):
+    con.execute("DELETE FROM run_rollups")
+    con.execute(f"INSERT INTO run_rollups {_aggregate('true')}", (PERIODS,))
+
+
+def in_sync(con):
+    """Whether every run is counted once in the day rollups."""
+    counted, runs = con.execute("""
+        SELECT (SELECT COALESCE(SUM(run_count), 0) FROM run_rollups WHERE period = 'day'),
+               (SELECT COUNT(*) FROM runs WHERE start_date_local IS NOT NULL)
+    """).fetchone()
+    return counted == runs
+
+
+def load_rollup(con, period, since="2020-01-01"):
+    """One period's rows from `since` on, oldest first, with the running total distance."""
+    return con.execute("""
+        SELECT period_start, distance_km, run_count, mean_pace, mean_hr,
+               SUM(distance_km) OVER (ORDER BY period_start) AS cumulative_distance
+        FROM run_rollups
+        WHERE period = ? AND period_start >= date_trunc(?, ?::DATE)
+        ORDER BY period_start
+    """, (period, period, since)).fetchdf()
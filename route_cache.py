@@ -0,0 +1,135 @@
+"""Decoded route coordinates, cached per run.
+
+Strava's summary polylines are decoded once, when runs are saved, by a NumPy
+decoder that handles a whole batch of strings in one pass. The points go to
+`run_routes` as float32 arrays with each run's bounding box, so the heatmap and
+the details map read coordinates and bounds straight from DuckDB and never
+decode at request time. `simplify_route` thins a route (Douglas–Peucker) for
+drawing it as a line.
+"""
+import numpy as np
+import pandas as pd
+
+PRECISION = 5
+
+
+def ensure_route_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS run_routes (
+        activity_id BIGINT PRIMARY KEY,
+        lat FLOAT[],
+        lng FLOAT[],
+        min_lat DOUBLE,
+        min_lng DOUBLE,
+        max_lat DOUBLE,
+        max_lng DOUBLE
+    )
+    """)
+
+
+def decode_polylines(encoded, precision=PRECISION):
+    """Decode many Google encoded polylines at once.
+
+    Returns (lat, lng, offsets): route k is lat[offsets[k]:offsets[k + 1]] (same for lng).
+    Missing or malformed strings decode to no points.
+    """
+    raw = [s.encode() if isinstance(s, str) else b"" for s in encoded]
+    lengths = np.array([len(s) for s in raw], dtype=np.int64)
+    chunks = np.frombuffer(b"".join(raw), dtype=np.uint8).astype(np.int64) - 63
+    owner = np.repeat(np.arange(len(raw)), lengths)
+    if not len(chunks):
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, np.zeros(len(raw) + 1, dtype=np.int64)
+
+    # A value is 5-bit chunks, low first; 0x20 marks "more chunks follow".
+    # Values never run across strings, even malformed ones.
+    last = (chunks & 0x20) == 0
+    first = np.concatenate([[True], last[:-1] | (owner[1:] != owner[:-1])])
+    starts = np.flatnonzero(first)
+    shift = 5 * (np.arange(len(chunks)) - starts[np.cumsum(first) - 1])
+
+    # A usable string has only polyline characters, values of at most 32 bits,
+    # ends on a complete value and holds whole (lat, lng) pairs
+    bad = np.bincount(owner, weights=(chunks < 0) | (chunks > 63) | (shift > 30), minlength=len(raw)) > 0
+    values_per_string = np.bincount(owner, weights=last, minlength=len(raw)).astype(np.int64)
+    ends = np.cumsum(lengths) - 1
+    complete = np.zeros(len(raw), dtype=bool)
+    complete[lengths > 0] = last[ends[lengths > 0]]
+    valid = complete & ~bad & (values_per_string % 2 == 0)
+    counts = np.where(valid, values_per_string // 2, 0)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    values = np.add.reduceat((chunks & 0x1F) << np.minimum(shift, 30), starts)[valid[owner[starts]]]
+    # Zigzag: the low bit carries the sign
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # Values alternate lat/lng deltas; coordinates are running sums restarted per route
+    scale = 10.0 ** precision
+    coords = []
+    for delta in (deltas[0::2], deltas[1::2]):
+        total = np.cumsum(delta)
+        base = np.concatenate([[0], total])[offsets[:-1]]
+        coords.append((total - np.repeat(base, counts)) / scale)
+    return coords[0], coords[1], offsets
+
+
+def route_frame(activity_ids, polylines):
+    """One row per run with a decodable polyline: points, start point and bounding box."""
+    lat, lng, offsets = decode_polylines(polylines)
+    rows = []
+    for activity_id, start, end in zip(activity_ids, offsets[:-1], offsets[1:]):
+        if end == start:
+            continue
+        route_lat, route_lng = lat[start:end], lng[start:end]
+        rows.append((
+            activity_id, route_lat.astype(np.float32), route_lng.astype(np.float32),
+            route_lat[0], route_lng[0],
+            route_lat.min(), route_lng.min(), route_lat.max(), route_lng.max(),
+        ))
+    return pd.DataFrame(rows, columns=[
+        "activity_id", "lat", "lng", "start_lat", "start_lng", "min_lat", "min_lng", "max_lat", "max_lng",
+    ])
+
+
+def save_routes(con, activity_ids, routes):
+    """Replace the cached routes of these runs with `routes` (a route_frame); runs missing from it lose theirs."""
+    con.execute("DELETE FROM run_routes WHERE activity_id IN (SELECT UNNEST(?))", ([int(a) for a in activity_ids],))
+    if routes.empty:
+        return
+    con.register("staged_routes", routes)
+    try:
+        con.execute("""
+            INSERT INTO run_routes
+            SELECT activity_id, lat::FLOAT[], lng::FLOAT[], min_lat, min_lng, max_lat, max_lng
+            FROM staged_routes
+        """)
+    finally:
+        con.unregister("staged_routes")
+
+
+def simplify_route(lat, lng, tolerance):
+    """Douglas–Peucker: indices of the points to keep so the line stays within `tolerance` degrees."""
+    points = np.column_stack([lat, lng]).astype(np.float64)
+    if len(points) < 3:
+        return np.arange(len(points))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, segment = points[first], points[last] - points[first]
+        inner = points[first + 1:last] - start
+        length = np.hypot(*segment)
+        if length == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            # Perpendicular distance to the chord from its cross product
+            distance = np.abs(inner[:, 0] * segment[1] - inner[:, 1] * segment[0]) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.extend([(first, split), (split, last)])
+    return np.flatnonzero(keep)
@@ -0,0 +1,373 @@
+"""Run-type classification: a rule table first, KMeans clustering for the rest.
+
+RULES is the decision table `classify_runs` applies, in order, to every run at
+once; the first rule whose clauses all hold names the run. Runs no rule claims
+are clustered and the clusters named from their averages.
+
+A fitted classifier (scaler, KMeans centroids, cluster names and the feature
+medians it normalized with) is saved to CLASSIFIER_PATH. Later loads only
+predict, so a run keeps its type until the next refit, which happens when the
+saved model is missing, was built for another CLASSIFIER_VERSION, is older
+than REFIT_AFTER_DAYS, or is asked for explicitly.
+
+scikit-learn and joblib are imported where a model is fit, saved or loaded,
+so importing this module (as ingestion and the dashboard do) stays cheap.
+"""
+import datetime
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+CLASSIFIER_PATH = os.getenv("RUN_CLASSIFIER_PATH", "run_classifier.joblib")
+# Bump when RULES, the features or the clustering change, so saved models are refit
+CLASSIFIER_VERSION = 1
+REFIT_AFTER_DAYS = 30
+
+# (rule, run type, clauses); a clause is (feature column, comparison, threshold).
+# Intervals must be ≤ 6km, so both interval rules carry that clause.
+RULES = [
+    ("long distance", "long run", [("distance_km", ">=", 15)]),
+    ("structured intervals", "interval", [
+        ("distance_km", "<=", 6), ("variability_score", ">", 0.25),
+        ("work_rest_ratio", ">", 0.23), ("high_intensity_time", ">", 0.18),
+    ]),
+    ("fast variable intervals", "interval", [
+        ("distance_km", "<=", 6), ("variability_score", ">", 0.3),
+        ("avg_pace", "<", 5.5), ("intensity_score", "<", 0.5),
+    ]),
+    ("short steady", "easy run", [
+        ("distance_km", "<=", 6), ("variability_score", "<", 0.2), ("intensity_score", "<", 0.6),
+    ]),
+    ("tempo pace", "tempo run", [
+        ("distance_km", ">=", 5), ("avg_pace", ">=", 5.5), ("avg_pace", "<=", 6.3),
+        ("variability_score", "<", 0.25),
+    ]),
+    ("mid distance variable", "tempo run", [
+        ("distance_km", ">", 4), ("distance_km", "<=", 12), ("variability_score", ">", 0.4),
+    ]),
+    ("short intense", "speed work", [("distance_km", "<=", 8), ("intensity_score", ">", 0.75)]),
+    # fallback for misclassified long intervals
+    ("long variable intense", "tempo run", [
+        ("distance_km", ">", 6), ("variability_score", ">", 0.3), ("intensity_score", ">", 0.5),
+    ]),
+    ("short variable easy", "interval", [
+        ("distance_km", "<=", 6), ("variability_score", ">", 0.3), ("intensity_score", "<", 0.5),
+    ]),
+]
+RULE_OPS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+# What KMeans sees, in this order
+CLUSTER_FEATURES = [
+    "distance_km", "duration_min", "avg_pace", "elevation_gain", "avg_hr",
+    "pace_variability", "hr_variability", "effort_spikes", "high_intensity_time", "work_rest_ratio",
+    "pace_per_km_norm", "distance_duration_ratio", "hr_intensity", "variability_score", "intensity_score",
+]
+
+
+def _silhouette_for_k(X_scaled, k):
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    labels = KMeans(n_clusters=k, random_state=42, n_init=10).fit_predict(X_scaled)
+    return silhouette_score(X_scaled, labels) if len(set(labels)) > 1 else 0
+
+
+def feature_hashes(features):
+    """One int64 per run that changes when any of its classifier inputs does."""
+    rounded = features[CLUSTER_FEATURES].astype(float).round(6)
+    return pd.util.hash_pandas_object(rounded, index=False).astype("int64").to_numpy()
+
+
+def model_expired(fitted_at):
+    return datetime.datetime.utcnow() - fitted_at > datetime.timedelta(days=REFIT_AFTER_DAYS)
+
+
+def saved_model_current(fitted_at):
+    """Whether the classifier saved at `fitted_at` (ISO) can still be used as is, without loading it."""
+    if not fitted_at or not os.path.exists(CLASSIFIER_PATH):
+        return False
+    return not model_expired(datetime.datetime.fromisoformat(fitted_at))
+
+
+def ensure_run_types_table(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS run_types (
+            activity_id BIGINT PRIMARY KEY,
+            run_type TEXT,
+            classified_at TIMESTAMP
+        )
+    """)
+    con.execute("ALTER TABLE run_types ADD COLUMN IF NOT EXISTS feature_hash BIGINT")
+
+
+class ImprovedRunClassifier:
+    def __init__(self):
+        self.scaler = None
+        self.model = None
+        self.cluster_names = {}
+        self.rule_hits = None
+        # Training-set medians used to normalize pace and fill gaps, so a handful
+        # of new runs are scaled the same way as the history the model saw
+        self.medians = None
+        self.fitted_at = None
+        self.is_trained = False
+
+    @classmethod
+    def load(cls, path=CLASSIFIER_PATH):
+        """The saved classifier, or None if there is none or it was built for another CLASSIFIER_VERSION."""
+        if not os.path.exists(path):
+            return None
+        import joblib
+        try:
+            saved = joblib.load(path)
+        except Exception as e:
+            print(f"⚠️ Could not load run classifier from {path}: {e}")
+            return None
+        if saved.get("version") != CLASSIFIER_VERSION or saved.get("features") != CLUSTER_FEATURES:
+            return None
+        classifier = cls()
+        classifier.scaler = saved["scaler"]
+        classifier.model = saved["model"]
+        classifier.cluster_names = saved["cluster_names"]
+        classifier.medians = saved["medians"]
+        classifier.fitted_at = saved["fitted_at"]
+        classifier.is_trained = True
+        return classifier
+
+    def save(self, path=CLASSIFIER_PATH):
+        import joblib
+
+        tmp_path = f"{path}.tmp"
+        joblib.dump({
+            "version": CLASSIFIER_VERSION,
+            "features": CLUSTER_FEATURES,
+            "scaler": self.scaler,
+            "model": self.model,
+            "cluster_names": self.cluster_names,
+            "medians": self.medians,
+            "fitted_at": self.fitted_at,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    def refit_due(self):
+        return model_expired(self.fitted_at)
+    
+    def extract_features(self, df):
+        """Extract comprehensive features for better classification"""
+        features = pd.DataFrame()
+        features["activity_id"] = df["activity_id"] 
+        
+        # Basic features
+        features['distance_km'] = df['distance_km']
+        features['duration_min'] = df['moving_time_min']
+        features['avg_pace'] = df['pace_min_per_km'].fillna(df['pace_min_per_km_stream'])
+        features['elevation_gain'] = df['total_elevation_gain_m'].fillna(0)
+        features['avg_hr'] = df['average_heartrate'].fillna(df['avg_heartrate_stream'])
+        
+        # Streaming-based features (the key to better classification)
+        features['pace_variability'] = df['pace_cv'].fillna(0)
+        features['hr_variability'] = df['hr_cv'].fillna(0)
+        features['effort_spikes'] = df['effort_spike_rate'].fillna(0)
+        features['high_intensity_time'] = df['high_intensity_pct'].fillna(0)
+        features['work_rest_ratio'] = df['work_rest_ratio'].fillna(0)
+        
+        fit_medians = self.medians is None
+        if fit_medians:
+            self.medians = {'avg_pace': features['avg_pace'].median()}
+
+        # Derived features
+        features['pace_per_km_norm'] = features['avg_pace'] / self.medians['avg_pace']
+        features['distance_duration_ratio'] = features['distance_km'] / (features['duration_min'] / 60)
+        features['hr_intensity'] = np.where(
+            features['avg_hr'] > 0,
+            features['avg_hr'] / 185,  # Normalize to estimated max HR
+            0
+        )
+        
+        # Composite features for better separation
+        features['variability_score'] = (
+            features['pace_variability'] * 0.4 + 
+            features['hr_variability'] * 0.3 + 
+            features['effort_spikes'] * 0.3
+        )
+        
+        features['intensity_score'] = (
+            features['hr_intensity'] * 0.6 + 
+            features['high_intensity_time'] * 0.4
+        )
+        
+        # Fill remaining NaN values
+        if fit_medians:
+            self.medians = features[CLUSTER_FEATURES].median().to_dict()
+        features = features.fillna(self.medians)
+        
+        return features
+    
+    def find_optimal_clusters(self, features, max_k=6):
+        """Find optimal number of clusters using silhouette score"""
+        if len(features) < 10:
+            return 5  # Increased default clusters
+        
+        from joblib import Parallel, delayed
+
+        X_scaled = self.scaler.fit_transform(features)
+        
+        K_range = range(3, min(max_k + 1, len(X_scaled) // 2))  # Start with 3 clusters minimum
+        # Each k is an independent fit; spread them over the cores
+        scores = Parallel(n_jobs=-1)(delayed(_silhouette_for_k)(X_scaled, k) for k in K_range)
+        
+        if scores:
+            optimal_k = K_range[np.argmax(scores)]
+            return optimal_k
+        return 5
+    
+    def apply_rules(self, features):
+        """Run type of each run from the first matching rule in RULES, 'unknown' where none match.
+
+        Evaluated on whole columns; how many runs each rule claimed is kept in
+        `self.rule_hits` for tuning the thresholds.
+        """
+        matches = [
+            np.logical_and.reduce([RULE_OPS[op](features[col].to_numpy(), threshold) for col, op, threshold in clauses])
+            for _, _, clauses in RULES
+        ]
+        rule_index = np.select(matches, np.arange(len(RULES)), default=-1)
+        hits = np.bincount(rule_index[rule_index >= 0], minlength=len(RULES))
+        self.rule_hits = pd.Series(hits, index=[name for name, _, _ in RULES])
+        self.rule_hits["unmatched"] = int((rule_index < 0).sum())
+        run_types = np.array([run_type for _, run_type, _ in RULES] + ["unknown"], dtype=object)
+        return run_types[rule_index]
+
+    def fit(self, features):
+        """Fit the scaler and KMeans on the runs no rule claims, and name the clusters."""
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import RobustScaler
+
+        run_types = self.apply_rules(features)
+        unknown = features.loc[run_types == 'unknown', CLUSTER_FEATURES]
+        self.scaler = RobustScaler()
+        self.model = None
+        self.cluster_names = {}
+        if len(unknown) > 3:
+            n_clusters = min(self.find_optimal_clusters(unknown), len(unknown))
+            X_scaled = self.scaler.fit_transform(unknown)
+            self.model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+            cluster_labels = self.model.fit_predict(X_scaled)
+            self.cluster_names = self._analyze_unknown_clusters(unknown, cluster_labels)
+        self.fitted_at = datetime.datetime.utcnow()
+        self.is_trained = True
+        return self
+
+    def predict(self, features):
+        """Run types from the rules, and from the fitted clusters for runs no rule claims."""
+        run_types = self.apply_rules(features)
+        unknown = run_types == 'unknown'
+        if self.model is not None and unknown.any():
+            X_scaled = self.scaler.transform(features.loc[unknown, CLUSTER_FEATURES])
+            labels = self.model.predict(X_scaled)
+            run_types[unknown] = [self.cluster_names.get(label, 'recovery run') for label in labels]
+        run_types[run_types == 'unknown'] = 'recovery run'
+        return run_types.tolist()
+
+    def classify_runs(self, features):
+        """Main classification method using rule-based approach first, then clustering"""
+        if len(features) < 5:
+            return ['unknown'] * len(features)
+        return self.fit(features).predict(features)
+
+    
+    def _analyze_unknown_clusters(self, features, labels):
+        """Analyze clusters for unknown runs and assign names"""
+        cluster_names = {}
+        
+        for cluster_id in np.unique(labels):
+            mask = labels == cluster_id
+            cluster_data = features[mask]
+            
+            # Calculate cluster characteristics
+            avg_distance = cluster_data['distance_km'].mean()
+            avg_variability = cluster_data['variability_score'].mean()
+            avg_intensity = cluster_data['intensity_score'].mean()
+            avg_work_rest = cluster_data['work_rest_ratio'].mean()
+            
+            # Assign names based on cluster characteristics
+            if avg_distance >= 15:
+                name = "long run"
+            elif avg_distance <= 6 and avg_work_rest > 0.15 and avg_variability > 0.3:
+                name = "interval"
+            elif avg_intensity > 0.7:
+                name = "tempo run"
+            elif avg_distance < 8 and avg_variability < 0.2 and avg_intensity < 0.5:
+                name = "easy run"
+            else:
+                name = "recovery run"
+
+            
+            cluster_names[cluster_id] = name
+        
+        return cluster_names
+
+
+def fitted_classifier(df, refit=False, save=True):
+    """The saved classifier, or one fit on df when asked to, when none fits, or (if saving) when it is due."""
+    classifier = None if refit else ImprovedRunClassifier.load()
+    if classifier is not None and not (save and classifier.refit_due()):
+        return classifier
+    classifier = ImprovedRunClassifier()
+    classifier.fit(classifier.extract_features(df))
+    if save:
+        classifier.save()
+        print(f"🧠 Refit run classifier on {len(df)} runs ({len(classifier.cluster_names)} clusters)")
+    return classifier
+
+
+def update_run_types(con, df, classifier, reclassify_all=False):
+    """Classify the runs of df that need it and merge the result into run_types in one statement.
+
+    Runs with no stored type or changed features (all of them with
+    reclassify_all) go through the classifier; only rows whose run_type or
+    features differ from what is stored are written. Returns the number written.
+    """
+    features = classifier.extract_features(df)
+    staged = pd.DataFrame({
+        "position": np.arange(len(df)),
+        "activity_id": df["activity_id"].to_numpy(),
+        "feature_hash": feature_hashes(features),
+    })
+    con.register("staged_run_types", staged)
+    try:
+        stored = con.execute("""
+            SELECT t.run_type, COALESCE(t.run_type IS NULL OR t.feature_hash IS DISTINCT FROM s.feature_hash, true) AS stale
+            FROM staged_run_types s
+            LEFT JOIN run_types t USING (activity_id)
+            ORDER BY s.position
+        """).fetchdf()
+    finally:
+        con.unregister("staged_run_types")
+    stale = np.ones(len(df), dtype=bool) if reclassify_all else stored["stale"].to_numpy(dtype=bool)
+    if not stale.any():
+        return 0
+    run_types = stored["run_type"].to_numpy(dtype=object, copy=True)
+    run_types[stale] = classifier.predict(features[stale])
+    if classifier.rule_hits is not None:
+        print(f"🧮 Run-type rule hits: {classifier.rule_hits.to_dict()}")
+    staged["run_type"] = run_types
+
+    con.register("staged_run_types", staged[stale])
+    try:
+        return con.execute("""
+            INSERT INTO run_types (activity_id, run_type, classified_at, feature_hash)
+            SELECT s.activity_id, s.run_type, now(), s.feature_hash
+            FROM staged_run_types s
+            LEFT JOIN run_types t USING (activity_id)
+            WHERE t.run_type IS DISTINCT FROM s.run_type OR t.feature_hash IS DISTINCT FROM s.feature_hash
+            ON CONFLICT (activity_id) DO UPDATE SET
+                run_type = excluded.run_type,
+                classified_at = excluded.classified_at,
+                feature_hash = excluded.feature_hash
+        """).fetchone()[0]
+    finally:
+        con.unregister("staged_run_types")
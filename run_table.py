@@ -0,0 +1,105 @@
+"""The dashboard's run table, one page at a time.
+
+Filtering (run type, date range), sorting and paging all happen in DuckDB
+with ORDER BY / LIMIT / OFFSET, and only the rows of the requested page are
+formatted, so rendering a page costs the same however many runs are stored.
+"""
+import pandas as pd
+
+PAGE_SIZE = 25
+# Earliest run the dashboard shows, as in stream_features.runs_with_features
+START_DATE = "2020-01-01"
+
+# Column label -> the expression it sorts by
+SORT_COLUMNS = {
+    "Start Date": "r.start_date_local",
+    "Distance (km)": "r.distance_km",
+    "Moving Time": "r.moving_time_min",
+    "Pace (min/km)": "r.pace_min_per_km",
+    "Elevation Gain (m)": "r.total_elevation_gain_m",
+    "Avg HR": "r.average_heartrate",
+    "Run Type": "t.run_type",
+}
+
+
+def format_pace(p):
+    if pd.isna(p): return ""
+    m, s = divmod(int(p * 60), 60)
+    return f"{m} min {s} sec"
+
+
+def format_duration(m_float):
+    if pd.isna(m_float): return ""
+    total_sec = int(m_float * 60)
+    h, rem = divmod(total_sec, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h} hr {m} min {s} sec" if h > 0 else f"{m} min {s} sec"
+
+
+def run_type_options(con):
+    return [row[0] for row in con.execute(
+        "SELECT DISTINCT run_type FROM run_types WHERE run_type IS NOT NULL ORDER BY run_type"
+    ).fetchall()]
+
+
+def _filters(run_types, start, end):
+    """WHERE clause and parameters for the table's filters; None or empty means no filter."""
+    clauses, params = ["r.start_date_local >= ?"], [START_DATE]
+    if run_types:
+        clauses.append("t.run_type IN (SELECT UNNEST(?))")
+        params.append(list(run_types))
+    if start is not None:
+        clauses.append("r.start_date_local >= ?")
+        params.append(pd.Timestamp(start))
+    if end is not None:
+        # Through the end of that day
+        clauses.append("r.start_date_local < ?")
+        params.append(pd.Timestamp(end) + pd.Timedelta(days=1))
+    return " AND ".join(clauses), params
+
+
+def count_runs(con, run_types=None, start=None, end=None):
+    where, params = _filters(run_types, start, end)
+    return con.execute(f"""
+        SELECT COUNT(*) FROM runs r LEFT JOIN run_types t USING (activity_id) WHERE {where}
+    """, params).fetchone()[0]
+
+
+def load_page(con, sort="Start Date", descending=True, run_types=None, start=None, end=None,
+              page=0, page_size=PAGE_SIZE):
+    """One page of runs, sorted and filtered in DuckDB."""
+    where, params = _filters(run_types, start, end)
+    order = f"{SORT_COLUMNS[sort]} {'DESC' if descending else 'ASC'} NULLS LAST, r.activity_id"
+    return con.execute(f"""
+        SELECT r.start_date_local, r.run_name, r.distance_km, r.moving_time_min, r.pace_min_per_km,
+               r.total_elevation_gain_m, r.average_heartrate, r.activity_id, t.run_type
+        FROM runs r
+        LEFT JOIN run_types t USING (activity_id)
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    """, params + [page_size, page * page_size]).fetchdf()
+
+
+def page_html(df_display):
+    """A page from load_page, formatted and rendered to HTML."""
+    df_display = df_display.rename(columns={
+        "start_date_local": "Start Date",
+        "run_name": "Run Name",
+        "distance_km": "Distance (km)",
+        "moving_time_min": "Moving Time",
+        "pace_min_per_km": "Pace (min/km)",
+        "total_elevation_gain_m": "Elevation Gain (m)",
+        "average_heartrate": "Avg HR",
+        "run_type": "Run Type"
+    })
+
+    df_display["View"] = df_display["activity_id"].apply(
+        lambda rid: f'<a href="details?run_id={rid}" target="_blank" title="View details"><i class="fas fa-eye"></i></a>'
+    )
+    df_display.drop(columns=["activity_id"], inplace=True)
+
+    df_display["Pace (min/km)"] = df_display["Pace (min/km)"].apply(format_pace)
+    df_display["Moving Time"] = df_display["Moving Time"].apply(format_duration)
+    df_display["Run Type"] = df_display["Run Type"].str.title()
+    return df_display.to_html(escape=False, index=False)
@@ -0,0 +1,56 @@
+"""Rate limiting for Strava API requests, shared by the stream download workers.
+
+Kept out of data_ingestion so importing it (as the dashboard does) does not
+pull in stravalib; data_ingestion.strava_client imports it when a sync starts.
+"""
+import threading
+import time
+
+from stravalib.util import limiter
+
+# Fraction of Strava's 15-minute budget after which requests get spaced out
+THROTTLE_FROM = 0.5
+
+
+class StravaRateLimiter(limiter.RateLimiter):
+    """Rate limiter shared by all stream workers, driven by Strava's rate-limit headers.
+
+    Requests go out at full speed until THROTTLE_FROM of the 15-minute budget is
+    used; after that the remaining budget is spread over what is left of the
+    window, so concurrent workers slow down before Strava starts returning 429s.
+    """
+
+    def __init__(self, throttle_from=THROTTLE_FROM):
+        super().__init__()
+        self.throttle_from = throttle_from
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def __call__(self, response_headers, method):
+        rates = limiter.get_rates_from_response_headers(response_headers, method)
+        if not rates:
+            return
+
+        blocked_for = 0
+        spacing = 0
+        if rates.long_usage >= rates.long_limit:
+            blocked_for = limiter.get_seconds_until_next_day()
+        elif rates.short_usage >= rates.short_limit:
+            blocked_for = limiter.get_seconds_until_next_quarter()
+        elif rates.short_usage >= rates.short_limit * self.throttle_from:
+            spacing = limiter.get_seconds_until_next_quarter() / (rates.short_limit - rates.short_usage)
+
+        with self._lock:
+            now = time.monotonic()
+            if blocked_for:
+                self._next_slot = max(self._next_slot, now + blocked_for)
+                wait = self._next_slot - now
+            else:
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + spacing
+                wait = slot - now
+
+        if wait > 0:
+            if wait > 60:
+                print(f"⏳ Strava rate limit reached ({rates.short_usage}/{rates.short_limit}), waiting {wait:.0f}s...")
+            time.sleep(wait)
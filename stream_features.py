@@ -0,0 +1,150 @@
+"""Per-run streaming features, materialized in `run_stream_features`.
+
+`FEATURE_SQL` is the one definition of the stream features the classifier
+uses (pace/HR variability, effort spikes, time at high intensity, work/rest).
+Ingestion recomputes it only for the runs whose streams it just wrote, and
+rows carry the `FEATURE_VERSION` they were computed with: bump it whenever
+the query changes and every run is recomputed once on the next import.
+"""
+import numpy as np
+import pandas as pd
+
+FEATURE_VERSION = 1
+FEATURE_COLUMNS = [
+    "pace_cv", "hr_cv", "effort_spike_rate", "high_intensity_pct", "work_rest_ratio",
+    "avg_velocity_smooth", "avg_heartrate_stream",
+]
+# Runs per recompute query when catching up after a version bump
+REFRESH_BATCH_SIZE = 200
+
+# Over the run_streams view, for the runs listed in staged_feature_ids
+FEATURE_SQL = """
+    WITH hr_changes AS (
+        SELECT
+            activity_id,
+            time_sec,
+            heartrate,
+            velocity_smooth,
+            heartrate - LAG(heartrate) OVER (PARTITION BY activity_id ORDER BY time_sec) AS hr_change
+        FROM run_streams
+        WHERE activity_id IN (SELECT activity_id FROM staged_feature_ids)
+        AND velocity_smooth > 0 AND velocity_smooth < 20  -- Filter out unrealistic speeds
+        AND heartrate > 0 AND heartrate < 250  -- Filter out unrealistic heart rates
+    )
+    SELECT
+        activity_id,
+        -- Pace variability (coefficient of variation) - with bounds checking
+        CASE
+            WHEN COUNT(*) > 10 AND AVG(velocity_smooth) > 0 AND AVG(velocity_smooth) < 20 THEN
+                CASE
+                    WHEN AVG(1000 / (velocity_smooth * 60)) > 0 AND STDDEV_POP(1000 / (velocity_smooth * 60)) IS NOT NULL THEN
+                        LEAST(STDDEV_POP(1000 / (velocity_smooth * 60)) / AVG(1000 / (velocity_smooth * 60)), 2.0)
+                    ELSE NULL
+                END
+            ELSE NULL
+        END AS pace_cv,
+
+        -- Heart rate variability - with bounds checking
+        CASE
+            WHEN COUNT(heartrate) > 10 AND AVG(heartrate) BETWEEN 50 AND 220 THEN
+                CASE
+                    WHEN STDDEV_POP(heartrate) IS NOT NULL THEN
+                        LEAST(STDDEV_POP(heartrate) / AVG(heartrate), 1.0)
+                    ELSE NULL
+                END
+            ELSE NULL
+        END AS hr_cv,
+
+        -- Effort spikes (sudden HR increases > 15 bpm)
+        COUNT(CASE WHEN hr_change > 15 THEN 1 END) * 1.0 / NULLIF(COUNT(*), 0) AS effort_spike_rate,
+
+        -- Time in high intensity (assuming max HR ~190)
+        COUNT(CASE WHEN heartrate > 141 THEN 1 END) * 1.0 / NULLIF(COUNT(heartrate), 0) AS high_intensity_pct,
+
+        -- Work-to-rest ratio for intervals
+        CASE
+            WHEN COUNT(CASE WHEN heartrate > 141 THEN 1 END) > 0 THEN
+                COUNT(CASE WHEN heartrate > 141 THEN 1 END) * 1.0 /
+                NULLIF(COUNT(CASE WHEN heartrate <= 141 AND heartrate > 0 THEN 1 END), 0)
+            ELSE 0
+        END AS work_rest_ratio,
+
+        -- Average streaming data for validation
+        AVG(velocity_smooth) AS avg_velocity_smooth,
+        AVG(heartrate) AS avg_heartrate_stream
+
+    FROM hr_changes
+    GROUP BY activity_id
+"""
+
+
+def ensure_feature_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS run_stream_features (
+        activity_id BIGINT PRIMARY KEY,
+        feature_version INTEGER,
+        pace_cv DOUBLE,
+        hr_cv DOUBLE,
+        effort_spike_rate DOUBLE,
+        high_intensity_pct DOUBLE,
+        work_rest_ratio DOUBLE,
+        avg_velocity_smooth DOUBLE,
+        avg_heartrate_stream DOUBLE,
+        computed_at TIMESTAMP
+    )
+    """)
+
+
+def refresh_features(con, activity_ids):
+    """Recompute the features of these runs.
+
+    Every run gets a row, all NULL when it has no usable samples, so it is not
+    picked up again as stale.
+    """
+    ids = [int(a) for a in activity_ids]
+    if not ids:
+        return
+    columns = ", ".join(FEATURE_COLUMNS)
+    con.register("staged_feature_ids", pd.DataFrame({"activity_id": ids}, dtype="int64"))
+    try:
+        con.execute(f"""
+            INSERT OR REPLACE INTO run_stream_features (activity_id, feature_version, {columns}, computed_at)
+            SELECT i.activity_id, ?, {", ".join(f"f.{c}" for c in FEATURE_COLUMNS)}, now()
+            FROM staged_feature_ids i
+            LEFT JOIN ({FEATURE_SQL}) f USING (activity_id)
+        """, (FEATURE_VERSION,))
+    finally:
+        con.unregister("staged_feature_ids")
+
+
+def refresh_stale_features(con):
+    """Compute features for stored runs that have none, or were computed by another FEATURE_VERSION."""
+    stale = [row[0] for row in con.execute("""
+        SELECT s.activity_id
+        FROM activity_streams s
+        LEFT JOIN run_stream_features f USING (activity_id)
+        WHERE f.feature_version IS DISTINCT FROM ?
+    """, (FEATURE_VERSION,)).fetchall()]
+    for start in range(0, len(stale), REFRESH_BATCH_SIZE):
+        refresh_features(con, stale[start:start + REFRESH_BATCH_SIZE])
+    return len(stale)
+
+
+def runs_with_features(con):
+    """Runs since 2020, newest first, with their stream features and stream-derived pace."""
+    df = con.execute(f"""
+        SELECT r.*, {", ".join(f"f.{c}" for c in FEATURE_COLUMNS)}
+        FROM runs r
+        LEFT JOIN run_stream_features f USING (activity_id)
+        ORDER BY r.start_date_local DESC
+    """).fetchdf()
+    df["start_date_local"] = pd.to_datetime(df["start_date_local"], format="%Y-%m-%d %H:%M:%S")
+    df = df[df["start_date_local"] >= pd.to_datetime("2020-01-01")]
+
+    # Calculate streaming pace
+    df["pace_min_per_km_stream"] = np.where(
+        df["avg_velocity_smooth"] > 0,
+        1000 / (df["avg_velocity_smooth"] * 60),
+        np.nan
+    )
+    return df
@@ -0,0 +1,131 @@
+"""Downsampled chart series for the run details page.
+
+`chart_series` turns raw 1 Hz samples into the smoothed pace and heart rate by
+distance that pages/details.py plots. Ingestion stores that series at a few
+fixed sizes (`LEVELS`) in `stream_pyramid`, each reduced with
+Largest-Triangle-Three-Buckets so peaks and dips survive, and the page loads
+the level that fits its chart width instead of every sample.
+"""
+import numpy as np
+
+# Points per level; a series shorter than a level is stored whole
+LEVELS = [500, 2000]
+# Rolling window (samples) for pace / HR smoothing
+SMOOTH_WINDOW = 7
+# LTTB needs about one point per two pixels before the line looks any different
+PIXELS_PER_POINT = 2
+
+
+# Stored as integers like activity_streams: distance in m, pace in 0.1 s/km, HR in 0.1 bpm.
+# Keyed by (activity_id, level) but, like activity_streams, without an index
+def ensure_pyramid_table(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS stream_pyramid (
+        activity_id BIGINT,
+        level INTEGER,
+        distance_m INTEGER[],
+        pace_ds SMALLINT[],
+        hr_dbpm SMALLINT[]
+    )
+    """)
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` samples, shorter at the start (pandas min_periods=1)."""
+    sums = np.cumsum(np.concatenate([[0.0], values]))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def chart_series(time_sec, heartrate, velocity):
+    """Distance (km), smoothed pace (min/km) and smoothed HR, as plotted on the details page.
+
+    Arrays are float samples in time order; NaN marks a missing value.
+    """
+    time_sec = np.asarray(time_sec, dtype=np.float64)
+    heartrate = np.asarray(heartrate, dtype=np.float64)
+    velocity = np.asarray(velocity, dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pace = 1000 / (velocity * 60)
+    # Noise filter, then distance integrated over the samples that are left
+    keep = (pace < 20) & (pace > 2) & (heartrate > 60) & (heartrate < 220)
+    time_sec, heartrate, velocity, pace = time_sec[keep], heartrate[keep], velocity[keep], pace[keep]
+
+    delta_time = np.diff(time_sec, prepend=time_sec[:1])
+    distance_km = np.cumsum(velocity * delta_time) / 1000
+
+    # Plausible running paces only, smoothed over neighbouring samples
+    keep = (pace > 3) & (pace < 12)
+    distance_km, pace, heartrate = distance_km[keep], pace[keep], heartrate[keep]
+    return distance_km, rolling_mean(pace, SMOOTH_WINDOW), rolling_mean(heartrate, SMOOTH_WINDOW)
+
+
+def lttb(x, y, threshold):
+    """Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps from (x, y)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Interior points split into threshold - 2 buckets; first and last are always kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # The last bucket's right-hand neighbour is the final point
+    avg_x = np.append(avg_x[1:], x[-1]).tolist()
+    avg_y = np.append(avg_y[1:], y[-1]).tolist()
+
+    # Each pick depends on the previous one, and buckets hold only a handful of
+    # points, so plain floats beat a NumPy call per bucket by ~4x
+    xs, ys, bounds = np.asarray(x).tolist(), np.asarray(y).tolist(), edges.tolist()
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        ax, ay = xs[a], ys[a]
+        dx, dy = ax - avg_x[i], avg_y[i] - ay
+        best, a = -1.0, bounds[i]
+        for j in range(bounds[i], bounds[i + 1]):
+            # Twice the triangle area between the last kept point, this candidate and the next bucket's mean
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best:
+                best, a = area, j
+        keep.append(a)
+    keep.append(n - 1)
+    return np.array(keep, dtype=np.int64)
+
+
+def downsample(distance_km, pace_smooth, hr_smooth, points):
+    """Rows kept at one level: the union of the LTTB picks for pace and for HR, in distance order.
+
+    LTTB usually keeps the extremes; the fastest, slowest and max/min HR points are added so it always does.
+    """
+    if len(distance_km) == 0:
+        return distance_km, pace_smooth, hr_smooth
+    extremes = [np.argmin(pace_smooth), np.argmax(pace_smooth), np.argmin(hr_smooth), np.argmax(hr_smooth)]
+    keep = np.union1d(lttb(distance_km, pace_smooth, points), lttb(distance_km, hr_smooth, points))
+    keep = np.union1d(keep, extremes)
+    return distance_km[keep], pace_smooth[keep], hr_smooth[keep]
+
+
+def build_levels(time_sec, heartrate, velocity):
+    """(level, distance_km, pace_smooth, hr_smooth) for every level, from raw samples.
+
+    Each level is reduced from the next larger one rather than from the full series.
+    """
+    series = chart_series(time_sec, heartrate, velocity)
+    levels = []
+    for points in sorted(LEVELS, reverse=True):
+        series = downsample(*series, points)
+        levels.append((points, *series))
+    return levels[::-1]
+
+
+def pick_level(width_px):
+    """Smallest stored level dense enough for a chart `width_px` wide, or None for full resolution."""
+    needed = width_px / PIXELS_PER_POINT
+    for points in LEVELS:
+        if points >= needed:
+            return points
+    return None
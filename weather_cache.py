@@ -0,0 +1,209 @@
+"""Open-Meteo weather cache: hourly weather stored per lat/lon grid cell.
+
+Runs resolve their weather from `weather_hourly` first. Whatever is missing is
+grouped per cell into date spans and fetched with one archive request per span.
+Runs that still have no weather (the archive lags a few days) wait in
+`weather_queue` with exponential backoff instead of being refetched on every sync.
+"""
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import http_client
+
+OPEN_METEO_BASE_URL = os.getenv("OPEN_METEO_BASE_URL", "https://archive-api.open-meteo.com").rstrip("/")
+ARCHIVE_URL = f"{OPEN_METEO_BASE_URL}/v1/archive"
+
+# ~11 km cells; the ERA5 archive grid is coarser than this anyway
+CELL_SIZE = 0.1
+# Missing dates this close together in one cell are fetched as one span
+MAX_GAP_DAYS = 14
+MAX_SPAN_DAYS = 366
+REQUEST_DELAY = 0.5
+RETRY_BASE = timedelta(hours=6)
+RETRY_MAX = timedelta(days=7)
+
+
+def ensure_weather_tables(con):
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS weather_hourly (
+        cell_lat INTEGER,
+        cell_lon INTEGER,
+        hour TIMESTAMP,
+        temp_c DOUBLE,
+        humidity_pct DOUBLE,
+        fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (cell_lat, cell_lon, hour)
+    )
+    """)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS weather_queue (
+        activity_id BIGINT PRIMARY KEY,
+        attempts INTEGER,
+        next_attempt_at TIMESTAMP
+    )
+    """)
+    # Legacy rows saved with NULL weather are retried through the queue
+    con.execute("""
+        INSERT INTO weather_queue (activity_id, attempts, next_attempt_at)
+        SELECT activity_id, 0, now() FROM weather_by_run
+        WHERE temp_c IS NULL OR humidity_pct IS NULL
+        ON CONFLICT (activity_id) DO NOTHING
+    """)
+
+
+def plan_fetches(missing):
+    """Group (cell_lat, cell_lon, day) needs into one (cell_lat, cell_lon, start, end) request per span."""
+    by_cell = {}
+    for cell_lat, cell_lon, day in missing:
+        by_cell.setdefault((cell_lat, cell_lon), set()).add(day)
+
+    plan = []
+    for (cell_lat, cell_lon), days in sorted(by_cell.items()):
+        days = sorted(days)
+        start = end = days[0]
+        for day in days[1:]:
+            if (day - end).days <= MAX_GAP_DAYS and (day - start).days < MAX_SPAN_DAYS:
+                end = day
+            else:
+                plan.append((cell_lat, cell_lon, start, end))
+                start = end = day
+        plan.append((cell_lat, cell_lon, start, end))
+    return plan
+
+
+def fetch_hourly(cell_lat, cell_lon, start_date, end_date):
+    """Fetch every hour in [start_date, end_date] for the centre of a cell."""
+    resp = http_client.get(ARCHIVE_URL, params={
+        "latitude": round(cell_lat * CELL_SIZE, 4),
+        "longitude": round(cell_lon * CELL_SIZE, 4),
+        "start_date": start_date.isoformat(),
+        "end_date": min(end_date, date.today()).isoformat(),
+        "hourly": "temperature_2m,relative_humidity_2m",
+        "timezone": "auto",
+    })
+    resp.raise_for_status()
+    hourly = resp.json()["hourly"]
+    return pd.DataFrame({
+        "cell_lat": cell_lat,
+        "cell_lon": cell_lon,
+        "hour": pd.to_datetime(hourly["time"]),
+        "temp_c": pd.to_numeric(pd.Series(hourly["temperature_2m"]), errors="coerce"),
+        "humidity_pct": pd.to_numeric(pd.Series(hourly["relative_humidity_2m"]), errors="coerce"),
+    })
+
+
+def store_hourly(con, frame):
+    con.register("staged_weather", frame)
+    try:
+        con.execute("""
+            INSERT INTO weather_hourly (cell_lat, cell_lon, hour, temp_c, humidity_pct)
+            SELECT cell_lat, cell_lon, hour, temp_c, humidity_pct FROM staged_weather
+            ON CONFLICT (cell_lat, cell_lon, hour) DO UPDATE SET
+                temp_c = excluded.temp_c,
+                humidity_pct = excluded.humidity_pct,
+                fetched_at = now()
+        """)
+    finally:
+        con.unregister("staged_weather")
+
+
+def _pending_runs(con, activity_ids):
+    """Runs that need weather: the given ones plus queue entries that are due."""
+    con.register("requested_ids", pd.DataFrame({"activity_id": pd.Series(list(activity_ids), dtype="int64")}))
+    try:
+        return con.execute(f"""
+            SELECT
+                r.activity_id,
+                r.start_date_local,
+                r.latitude,
+                r.longitude,
+                CAST(round(r.latitude / {CELL_SIZE}) AS INTEGER) AS cell_lat,
+                CAST(round(r.longitude / {CELL_SIZE}) AS INTEGER) AS cell_lon,
+                date_trunc('hour', r.start_date_local) AS hour
+            FROM runs r
+            LEFT JOIN weather_by_run w ON r.activity_id = w.activity_id
+            WHERE r.latitude IS NOT NULL AND r.longitude IS NOT NULL AND r.start_date_local IS NOT NULL
+              AND (w.activity_id IS NULL OR w.temp_c IS NULL OR w.humidity_pct IS NULL)
+              AND (
+                  r.activity_id IN (SELECT activity_id FROM requested_ids)
+                  OR r.activity_id IN (SELECT activity_id FROM weather_queue WHERE next_attempt_at <= now())
+              )
+        """).fetchdf()
+    finally:
+        con.unregister("requested_ids")
+
+
+def _resolve_from_cache(con, pending):
+    """Copy cached hours into weather_by_run. Returns the activity IDs resolved."""
+    con.register("pending_weather", pending)
+    try:
+        resolved = con.execute("""
+            SELECT p.activity_id, strftime(p.start_date_local, '%Y-%m-%dT%H:%M:%S') AS timestamp,
+                   p.latitude AS lat, p.longitude AS lon, h.temp_c, h.humidity_pct
+            FROM pending_weather p
+            JOIN weather_hourly h USING (cell_lat, cell_lon, hour)
+            WHERE h.temp_c IS NOT NULL AND h.humidity_pct IS NOT NULL
+        """).fetchdf()
+    finally:
+        con.unregister("pending_weather")
+    if resolved.empty:
+        return set()
+
+    con.register("resolved_weather", resolved)
+    try:
+        con.execute("""
+            INSERT INTO weather_by_run (activity_id, timestamp, lat, lon, temp_c, humidity_pct)
+            SELECT activity_id, timestamp, lat, lon, temp_c, humidity_pct FROM resolved_weather
+            ON CONFLICT (activity_id) DO UPDATE SET
+                timestamp = excluded.timestamp,
+                lat = excluded.lat,
+                lon = excluded.lon,
+                temp_c = excluded.temp_c,
+                humidity_pct = excluded.humidity_pct
+        """)
+        con.execute("DELETE FROM weather_queue WHERE activity_id IN (SELECT activity_id FROM resolved_weather)")
+    finally:
+        con.unregister("resolved_weather")
+    return set(resolved["activity_id"])
+
+
+def _backoff(con, activity_ids):
+    for activity_id in activity_ids:
+        row = con.execute("SELECT attempts FROM weather_queue WHERE activity_id = ?", (activity_id,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+        con.execute("""
+            INSERT INTO weather_queue (activity_id, attempts, next_attempt_at) VALUES (?, ?, ?)
+            ON CONFLICT (activity_id) DO UPDATE SET
+                attempts = excluded.attempts,
+                next_attempt_at = excluded.next_attempt_at
+        """, (activity_id, attempts, datetime.now() + delay))
+
+
+def plan_weather(con, activity_ids=()):
+    """Resolve what the cache already has. Returns (runs still pending, fetch plan, resolved count)."""
+    pending = _pending_runs(con, activity_ids)
+    if pending.empty:
+        return pending, [], 0
+
+    resolved = _resolve_from_cache(con, pending)
+    remaining = pending[~pending["activity_id"].isin(resolved)]
+    plan = [
+        span for span in plan_fetches(
+            (row.cell_lat, row.cell_lon, row.hour.date()) for row in remaining.itertuples()
+        )
+        if span[2] <= date.today()
+    ]
+    return remaining, plan, len(resolved)
+
+
+def settle_weather(con, remaining):
+    """After fetching, resolve the rest from cache and queue what is still missing. Returns (resolved, queued)."""
+    if remaining.empty:
+        return 0, 0
+    resolved = _resolve_from_cache(con, remaining)
+    unresolved = set(remaining["activity_id"]) - resolved
+    _backoff(con, unresolved)
+    return len(resolved), len(unresolved)